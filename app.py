@@ -1,43 +1,101 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail, Message
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+import click
+from itertools import islice
+import json
 import os
+import threading
+import uuid
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 import os
 from werkzeug.utils import secure_filename
 from pymongo import MongoClient
-import joblib
-from sklearn.preprocessing import StandardScaler
+import numpy as np
+from model_registry import price_registry
+from prediction_cache import PredictionCache
+from fragment_cache import FragmentCache
+from counter_cache import CounterCache
+from email_outbox import EmailOutbox
+from email_rendering import EmailRenderer
+from file_lock import FileLock
+from mongo_sync import MongoBikeSync
+from image_pipeline import RenditionIndex, process_image, rendition_url, verify_image
+from image_jobs import PENDING_DIR, ImageJobQueue, is_pending, pending_url
+from image_store import ImageStore, content_url, hash_file, image_extension, is_content_url
+from static_assets import StaticFiles
+from upload_streams import ImageUploadStream, UploadRejected
+from pagination import (SEARCH_SORT, PaginationError, after_cursor, decode_cursor, ensure_search_index, find_page,
+                        page_size, projection_for, requested_fields)
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+import bike_search
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask app
-app = Flask(__name__)
+# static/ is served by serve_static below (fingerprinted URLs, ETags, ranges)
+app = Flask(__name__, static_folder=None)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bikerental.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Mail settings
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 
+# Outbound email queue (see email_outbox.py)
+app.config['EMAIL_OUTBOX_PATH'] = os.getenv('EMAIL_OUTBOX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_outbox.db'))
+app.config['EMAIL_WORKERS'] = int(os.getenv('EMAIL_WORKERS', 2))
+app.config['EMAIL_BATCH_SIZE'] = int(os.getenv('EMAIL_BATCH_SIZE', 20))
+app.config['EMAIL_MAX_ATTEMPTS'] = int(os.getenv('EMAIL_MAX_ATTEMPTS', 5))
+
 # Initialize extensions
 db = SQLAlchemy(app)
 mail = Mail(app)
 
-def send_email(to, subject, body):
+def deliver_emails(messages):
     """
-    Send email with improved error handling and logging
-    Returns: Boolean indicating success/failure
+    Send a batch of outbox messages over a single SMTP connection
+    Returns: dict of outbox id -> error for the messages that failed
     """
+    errors = {}
+    with app.app_context():
+        with mail.connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(Message(
+                        subject=message['subject'],
+                        recipients=message['recipients'],
+                        body=message['body'],
+                        html=message['html'],
+                        sender=message['sender'] or app.config['MAIL_DEFAULT_SENDER']
+                    ))
+                    print(f"Email sent successfully to {', '.join(message['recipients'])}")
+                except Exception as send_error:
+                    print(f"SMTP Error sending to {', '.join(message['recipients'])}: {str(send_error)}")
+                    errors[message['id']] = send_error
+    return errors
+
+email_outbox = EmailOutbox(
+    app.config['EMAIL_OUTBOX_PATH'],
+    deliver_emails,
+    workers=app.config['EMAIL_WORKERS'],
+    batch_size=app.config['EMAIL_BATCH_SIZE'],
+    max_attempts=app.config['EMAIL_MAX_ATTEMPTS']
+)
+
+def mail_configured():
     if not all([
         app.config['MAIL_USERNAME'],
         app.config['MAIL_PASSWORD'],
@@ -49,30 +107,80 @@ def send_email(to, subject, body):
         print(f"MAIL_SERVER: {app.config['MAIL_SERVER']}")
         print(f"MAIL_PORT: {app.config['MAIL_PORT']}")
         return False
+    return True
+
+def queue_emails(messages, after_commit=False):
+    """
+    Hand rendered messages to the outbox.
+    after_commit: hold them until the current db.session transaction commits (dropped on rollback)
+    """
+    if after_commit:
+        # Open the transaction the messages belong to, so a rollback() before any query still drops them
+        db.session.connection()
+        db.session.info.setdefault('emails_after_commit', []).extend(messages)
+    else:
+        email_outbox.enqueue_many(messages)
+
+@event.listens_for(db.session, 'after_commit')
+def _queue_committed_emails(session):
+    # The outbox is a separate database, so messages about this transaction are only queued once it is durable
+    messages = session.info.pop('emails_after_commit', None)
+    if messages:
+        try:
+            email_outbox.enqueue_many(messages)
+        except Exception as e:
+            print(f"Error queueing emails: {str(e)}")
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_uncommitted_emails(session):
+    session.info.pop('emails_after_commit', None)
+
+def send_email(to, subject, body, after_commit=False):
+    """
+    Queue an email for delivery by the outbox workers (see queue_emails() for after_commit)
+    Returns: Boolean indicating whether the email was queued
+    """
+    if not mail_configured():
+        return False
 
     if not to:
         print("No recipient email provided")
         return False
 
     try:
-        msg = Message(
-            subject=subject,
-            recipients=[to],
-            body=body,
-            sender=app.config['MAIL_DEFAULT_SENDER']
-        )
-        
-        # Add error handling around the actual send
-        try:
-            mail.send(msg)
-            print(f"Email sent successfully to {to}")
-            return True
-        except Exception as send_error:
-            print(f"SMTP Error sending to {to}: {str(send_error)}")
-            return False
-            
+        queue_emails([{'recipients': [to], 'subject': subject, 'body': body,
+                       'sender': app.config['MAIL_DEFAULT_SENDER']}], after_commit=after_commit)
+        return True
     except Exception as e:
-        print(f"Error creating email message: {str(e)}")
+        print(f"Error queueing email: {str(e)}")
+        return False
+
+# Email templates are compiled once at startup (see email_rendering.py)
+email_renderer = EmailRenderer(app)
+email_renderer.preload()
+
+def send_template_email(to, subject, template, after_commit=False, **context):
+    """Render a plain-text email template and queue it"""
+    return send_email(to, subject, email_renderer.render(template, **context), after_commit=after_commit)
+
+def send_bulk_template_email(template, recipients, after_commit=False, **shared):
+    """
+    Render one plain-text template for many recipients in a single pass and queue them together
+    recipients: list of (email, subject, per-recipient context dict)
+    Returns: Boolean indicating whether the emails were queued
+    """
+    recipients = [(to, subject, context) for to, subject, context in recipients if to]
+    if not recipients or not mail_configured():
+        return False
+    try:
+        bodies = email_renderer.render_many(template, [context for _, _, context in recipients], **shared)
+        queue_emails([
+            {'recipients': [to], 'subject': subject, 'body': body, 'sender': app.config['MAIL_DEFAULT_SENDER']}
+            for (to, subject, _), body in zip(recipients, bodies)
+        ], after_commit=after_commit)
+        return True
+    except Exception as e:
+        print(f"Error queueing emails: {str(e)}")
         return False
 
 # Add configurations for image uploads
@@ -82,29 +190,170 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Static file delivery: STATIC_SENDFILE=x-sendfile or x-accel-redirect hands the bytes to a front proxy
+app.config['STATIC_SENDFILE'] = os.getenv('STATIC_SENDFILE') or None
+app.config['STATIC_ACCEL_PREFIX'] = os.getenv('STATIC_ACCEL_PREFIX', '/protected-static/')
+app.config['USE_X_SENDFILE'] = app.config['STATIC_SENDFILE'] == 'x-sendfile'
+
+# Worker processes rendering uploaded photos (0 renders in the request thread)
+app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', os.cpu_count() or 1))
+# Largest single photo accepted by the streaming upload path
+app.config['MAX_IMAGE_SIZE'] = int(os.getenv('MAX_IMAGE_SIZE', app.config['MAX_CONTENT_LENGTH']))
+
+# Lock files coordinating one-per-host background jobs across worker processes
+app.config['LOCK_FOLDER'] = os.getenv('LOCK_FOLDER', app.instance_path)
+
+# Price prediction cache (set PREDICTION_CACHE_PATH to share it across worker processes)
+app.config['PREDICTION_CACHE_SIZE'] = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+app.config['PREDICTION_CACHE_TTL'] = int(os.getenv('PREDICTION_CACHE_TTL', 3600))
+app.config['PREDICTION_CACHE_PATH'] = os.getenv('PREDICTION_CACHE_PATH')
+
+# Home page listing (set HOME_FRAGMENT_STAMP_PATH so a bike change clears the cache in every worker)
+app.config['HOME_PAGE_SIZE'] = int(os.getenv('HOME_PAGE_SIZE', 12))
+app.config['HOME_FRAGMENT_CACHE_TTL'] = int(os.getenv('HOME_FRAGMENT_CACHE_TTL', 300))
+app.config['HOME_FRAGMENT_STAMP_PATH'] = os.getenv('HOME_FRAGMENT_STAMP_PATH')
+
+# Seconds a cached navbar pending-request count may lag changes made by other worker processes
+app.config['PENDING_COUNT_TTL'] = int(os.getenv('PENDING_COUNT_TTL', 60))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
 
+# Thumbnail and medium renditions of uploaded photos (see image_pipeline.py)
+STATIC_FOLDER = os.path.dirname(UPLOAD_FOLDER)
+image_renditions = RenditionIndex(STATIC_FOLDER)
+# Photos are stored once per distinct content (see image_store.py)
+image_store = ImageStore(STATIC_FOLDER)
+app.jinja_env.globals.update(image_renditions=image_renditions, rendition_url=rendition_url, is_pending_image=is_pending)
+
+# Endpoints whose file uploads are streamed straight into the photo staging area
+IMAGE_UPLOAD_ENDPOINTS = {'add_bike', 'edit_bike'}
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in IMAGE_UPLOAD_ENDPOINTS:
+            # Validated, size-checked, hashed and staged chunk by chunk (see upload_streams.py)
+            return ImageUploadStream(os.path.join(STATIC_FOLDER, PENDING_DIR), app.config['MAX_IMAGE_SIZE'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+app.request_class = UploadRequest
+
 def save_image(file):
-    if file and allowed_file(file.filename):
-        filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}")
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    """
+    Stage an uploaded bike photo; image_jobs renders it once the bike is committed.
+    A photo that is already stored is used as-is.
+    Returns: dict with the image url (pending or stored), size and original name, or None if no file was uploaded
+    Raises: UploadRejected if the upload is not an acceptable image
+    """
+    if not file:
+        return None
+    if isinstance(file.stream, ImageUploadStream):
+        # Checked and written while the request was parsed; the file name plays no part
+        file_path, image_format, size, digest = file.stream.claim()
+        token = file.stream.token
+    elif allowed_file(file.filename):
+        token = uuid.uuid4().hex
+        file_path = os.path.join(STATIC_FOLDER, PENDING_DIR, token)
         file.save(file_path)
-        # Use forward slashes for URL paths
-        return 'bike_images/' + filename  # Return relative path with forward slash
-    return None
-
-@app.route('/static/<path:filename>')
+        size = os.path.getsize(file_path)
+        digest = hash_file(file_path)
+    else:
+        return None
+    try:
+        # The stream only matched the signature bytes; Pillow must be able to parse the header too
+        image_format = verify_image(file_path)
+    except Exception:
+        os.remove(file_path)
+        raise UploadRejected("not a readable image")
+    image_url = content_url(digest, image_extension(image_format))
+    if image_renditions.has_renditions(image_url) and pin_stored_image(image_url):
+        # Same bytes as a stored photo: share it
+        os.remove(file_path)
+    else:
+        image_url = pending_url(image_url, token)
+        os.replace(file_path, os.path.join(STATIC_FOLDER, image_url))
+    return {
+        'url': image_url,
+        'size': size,
+        'original_name': file.filename[:200]
+    }
+
+def save_images(files):
+    """
+    save_image() for the image1-image3 fields of a form, all or nothing.
+    Returns: list of three save_image() results
+    Raises: UploadRejected naming the first rejected photo; photos staged before it are deleted
+    """
+    images = []
+    try:
+        for slot in range(1, 4):
+            try:
+                images.append(save_image(files.get(f'image{slot}')))
+            except UploadRejected as e:
+                raise UploadRejected(f"Photo {slot} was rejected: {e}") from e
+    except Exception:
+        for image in images:
+            if image and is_pending(image['url']):
+                os.remove(os.path.join(STATIC_FOLDER, image['url']))
+        # Also drops the references pin_stored_image() took for shared photos
+        db.session.rollback()
+        raise
+    return images
+
+def set_bike_image(bike, slot, image):
+    """Store a save_image() result in image slot 1-3 of a bike"""
+    setattr(bike, f'image_url_{slot}', image['url'])
+    setattr(bike, f'image_{slot}_size', image['size'])
+    setattr(bike, f'image_{slot}_original_name', image['original_name'])
+
+@app.cli.command('generate-renditions')
+def generate_renditions_command():
+    """Write missing renditions and image sizes for photos uploaded before the image pipeline."""
+    generated = failed = 0
+    for bike in Bike.query.order_by(Bike.id):
+        for slot in range(1, 4):
+            image_url = getattr(bike, f'image_url_{slot}')
+            if not image_url:
+                continue
+            image_url = image_url.replace('\\', '/')
+            if is_pending(image_url):
+                continue
+            file_path = os.path.join(STATIC_FOLDER, image_url)
+            if not os.path.exists(file_path):
+                print(f"Bike {bike.id}: {image_url} is missing")
+                failed += 1
+                continue
+            if getattr(bike, f'image_{slot}_size') is None:
+                setattr(bike, f'image_{slot}_size', os.path.getsize(file_path))
+            if image_renditions.has_renditions(image_url):
+                continue
+            try:
+                process_image(file_path, STATIC_FOLDER)
+                generated += 1
+            except Exception as e:
+                print(f"Bike {bike.id}: could not process {image_url}: {str(e)}")
+                failed += 1
+    db.session.commit()
+    home_fragments.invalidate()
+    print(f"Generated renditions for {generated} images ({failed} failed)")
+
+# Fingerprinted static URLs with long-lived caching (see static_assets.py)
+static_files = StaticFiles(
+    STATIC_FOLDER,
+    sendfile=app.config['STATIC_SENDFILE'],
+    accel_prefix=app.config['STATIC_ACCEL_PREFIX']
+)
+app.jinja_env.globals.update(static_url=static_files.url)
+
+@app.route('/static/<path:filename>', endpoint='static')
 def serve_static(filename):
-    # Normalize the path to use forward slashes
-    filename = filename.replace('\\', '/')
-    if filename.startswith('bike_images/'):
-        # For bike images, serve from the bike_images subdirectory
-        image_name = filename.replace('bike_images/', '')
-        return send_from_directory(app.config['UPLOAD_FOLDER'], image_name)
-    # For other static files
-    return send_from_directory('static', filename)
+    return static_files.serve(filename)
+
+@app.cli.command('compress-static')
+def compress_static_command():
+    """Write precompressed .gz (and .br, with the brotli package) copies of static text assets."""
+    written = static_files.compress()
+    print(f"Wrote {written} precompressed files")
 
 # User Model
 class User(db.Model):
@@ -140,10 +389,27 @@ class Bike(db.Model):
     image_url_1 = db.Column(db.String(200))
     image_url_2 = db.Column(db.String(200))
     image_url_3 = db.Column(db.String(200))
+    # Price model estimate stored at write time (see migrations/add_suggested_price_columns.py)
+    suggested_price = db.Column(db.Float, nullable=True)
+    last_price_calculation = db.Column(db.DateTime, nullable=True)
+    price_model_version = db.Column(db.String(50), nullable=True)
+    # Upload metadata (see migrations/add_image_metadata_columns.py)
+    image_1_original_name = db.Column(db.String(200), nullable=True)
+    image_2_original_name = db.Column(db.String(200), nullable=True)
+    image_3_original_name = db.Column(db.String(200), nullable=True)
+    image_1_size = db.Column(db.Integer, nullable=True)  # in bytes
+    image_2_size = db.Column(db.Integer, nullable=True)  # in bytes
+    image_3_size = db.Column(db.Integer, nullable=True)  # in bytes
     rentals = db.relationship('Rental', backref='bike', lazy=True)
     rental_requests = db.relationship('RentalRequest', backref='bike', lazy=True)
     bike_purchases = db.relationship('Purchase', backref=db.backref('bike_details', lazy=True))
 
+    # Indexes for the hot predicates (see migrations/add_hot_query_indexes.py)
+    __table_args__ = (
+        db.Index('ix_bike_available_created', 'is_available', 'created_at'),
+        db.Index('ix_bike_owner_id', 'owner_id'),
+    )
+
 # Rental Model
 class Rental(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -156,6 +422,10 @@ class Rental(db.Model):
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, active, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_rental_bike_status_end', 'bike_id', 'status', 'end_date'),
+    )
+
 # Rental Request Model
 class RentalRequest(db.Model):
     __tablename__ = 'rental_request'
@@ -169,6 +439,25 @@ class RentalRequest(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     renter = db.relationship('User', foreign_keys=[renter_id], backref=db.backref('rental_requests_made', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_rental_request_bike_status', 'bike_id', 'status', 'created_at'),
+        db.Index('ix_rental_request_renter_created', 'renter_id', 'created_at'),
+    )
+
+# Pending SQL -> Mongo bike changes, written in the same transaction as the change (see mongo_sync.py)
+class BikeSyncOutbox(db.Model):
+    __tablename__ = 'bike_sync_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    bike_id = db.Column(db.Integer, nullable=False)  # no foreign key: deleted bikes are synced too
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+# Reference counts of stored photos (see image_store.py and migrations/dedupe_bike_images.py)
+class ImageBlob(db.Model):
+    __tablename__ = 'image_blob'
+    url = db.Column(db.String(200), primary_key=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+
 # Purchase Model
 class Purchase(db.Model):
     __tablename__ = 'purchase'
@@ -190,6 +479,11 @@ class Purchase(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_purchase_bike_status', 'bike_id', 'status', 'created_at'),
+    )
+    
     def to_dict(self):
         """Convert purchase object to dictionary"""
         return {
@@ -214,35 +508,239 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Pending rental requests per bike owner, for the navbar badge
+pending_request_counts = CounterCache(ttl=app.config['PENDING_COUNT_TTL'])
+
+@event.listens_for(db.session, 'before_flush')
+def _note_pending_request_changes(session, flush_context, instances):
+    # Owners whose count changes: new requests, status changes and deleted requests
+    owners = session.info.setdefault('pending_count_owners', set())
+    with session.no_autoflush:
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if not isinstance(obj, RentalRequest):
+                continue
+            if obj in session.dirty and not inspect(obj).attrs.status.history.has_changes():
+                continue
+            bike = obj.bike or (Bike.query.get(obj.bike_id) if obj.bike_id else None)
+            if bike is not None:
+                owners.add(bike.owner_id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_pending_request_counts(session):
+    owners = session.info.pop('pending_count_owners', None)
+    if owners:
+        pending_request_counts.invalidate(owners)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_pending_request_changes(session):
+    session.info.pop('pending_count_owners', None)
+
 # Context processor to add pending requests count to all templates
 @app.context_processor
 def utility_processor():
     def get_pending_requests_count():
-        if not session.get('user_id'):
+        user_id = session.get('user_id')
+        if not user_id:
             return 0
-        # Count pending requests for bikes owned by the current user
-        return RentalRequest.query.join(Bike).filter(
-            Bike.owner_id == session['user_id'],
+        # Count pending requests for bikes owned by the current user (cached until one changes)
+        return pending_request_counts.get(user_id, lambda: RentalRequest.query.join(Bike).filter(
+            Bike.owner_id == user_id,
             RentalRequest.status == 'pending'
-        ).count()
+        ).count())
     return dict(pending_requests_count=get_pending_requests_count())
 
 def send_notification_email(subject, recipient, template, **kwargs):
     try:
-        msg = Message(
-            subject,
-            recipients=[recipient]
-        )
-        msg.html = render_template(template, **kwargs)
-        mail.send(msg)
-        print(f"Email sent successfully to {recipient}")
+        # Render now, while the request context is available; the outbox workers only send
+        email_outbox.enqueue([recipient], subject, html=email_renderer.render(template, **kwargs))
     except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+        print(f"Failed to queue email: {str(e)}")
+
+# Rendered home page listings, keyed by (page, listing type)
+home_fragments = FragmentCache(
+    ttl=app.config['HOME_FRAGMENT_CACHE_TTL'],
+    stamp_path=app.config['HOME_FRAGMENT_STAMP_PATH']
+)
+
+def queue_bike_sync(connection, bike_ids):
+    """Record bikes whose Mongo document must be refreshed, inside the caller's transaction"""
+    now = datetime.utcnow()
+    connection.execute(
+        BikeSyncOutbox.__table__.insert(),
+        [{'bike_id': bike_id, 'created_at': now, 'attempts': 0} for bike_id in bike_ids]
+    )
+
+@event.listens_for(db.session, 'after_flush')
+def _note_bike_changes(session, flush_context):
+    changed = {
+        obj.id for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, Bike) and (obj not in session.dirty or session.is_modified(obj))
+    }
+    if changed:
+        session.info['bikes_changed'] = True
+        # Same connection, same transaction: the outbox rows commit or roll back with the change
+        queue_bike_sync(session.connection(), changed)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_home_fragments(session):
+    # Any committed bike insert, edit, delete or availability change can alter a listing page
+    if session.info.pop('bikes_changed', False):
+        home_fragments.invalidate()
+        mongo_sync.notify()
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_bike_changes(session):
+    session.info.pop('bikes_changed', None)
+
+def adjust_image_refs(connection, deltas):
+    """Add deltas (url -> +/-n) to the stored photo reference counts, inside the caller's transaction"""
+    for image_url, delta in deltas.items():
+        if delta:
+            connection.execute(
+                db.text('INSERT INTO image_blob (url, refcount) VALUES (:url, :delta) '
+                        'ON CONFLICT (url) DO UPDATE SET refcount = image_blob.refcount + :delta'),
+                {'url': image_url, 'delta': delta}
+            )
+
+def collect_image_garbage(image_urls):
+    """Delete stored photos that no bike references any more"""
+    removed = []
+    with db.engine.begin() as connection:
+        for image_url in image_urls:
+            # A single conditional DELETE, so a reference taken since the count dropped is never lost
+            deleted = connection.execute(
+                ImageBlob.__table__.delete().where(ImageBlob.url == image_url, ImageBlob.refcount <= 0)
+            ).rowcount
+            if not deleted and connection.execute(
+                db.select([ImageBlob.url]).where(ImageBlob.url == image_url)
+            ).first() is not None:
+                continue
+            # Removed while this transaction holds the write lock: pin_stored_image() either pins
+            # the photo before this point or finds the files gone
+            image_store.remove(image_url)
+            image_renditions.forget(image_url)
+            removed.append(image_url)
+    return removed
+
+def pin_stored_image(image_url):
+    """
+    Reference a stored photo from the session's transaction before a bike row takes it, so
+    collect_image_garbage() cannot delete it in between. The bike's flush takes the pin over.
+    Returns: False if the photo is no longer stored
+    """
+    connection = db.session.connection()
+    adjust_image_refs(connection, {image_url: 1})
+    # The reference holds the database write lock until commit, and collection removes files under that lock
+    if not image_store.exists(image_url):
+        adjust_image_refs(connection, {image_url: -1})
+        connection.execute(ImageBlob.__table__.delete().where(ImageBlob.url == image_url, ImageBlob.refcount <= 0))
+        return False
+    pins = db.session.info.setdefault('image_pins', {})
+    pins[image_url] = pins.get(image_url, 0) + 1
+    return True
+
+@event.listens_for(db.session, 'after_flush')
+def _count_image_refs(session, flush_context):
+    # Stored photos gained or lost by inserted, edited and deleted bikes (pending uploads are counted on swap)
+    deltas = {}
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, Bike):
+            continue
+        state = inspect(obj)
+        for slot in range(1, 4):
+            if obj in session.deleted:
+                added, removed = [], [getattr(obj, f'image_url_{slot}')]
+            else:
+                history = state.attrs[f'image_url_{slot}'].history
+                added, removed = history.added or (), history.deleted or ()
+            for image_url in added:
+                if is_content_url(image_url):
+                    deltas[image_url] = deltas.get(image_url, 0) + 1
+            for image_url in removed:
+                if is_content_url(image_url):
+                    deltas[image_url] = deltas.get(image_url, 0) - 1
+    # References already taken by pin_stored_image() are handed to the rows that now hold the photo
+    pins = session.info.get('image_pins', {})
+    for image_url in list(pins):
+        taken = min(pins[image_url], max(deltas.get(image_url, 0), 0))
+        if taken:
+            deltas[image_url] -= taken
+            pins[image_url] -= taken
+            if not pins[image_url]:
+                del pins[image_url]
+    if any(deltas.values()):
+        adjust_image_refs(session.connection(), deltas)
+        released = session.info.setdefault('released_images', set())
+        released.update(image_url for image_url, delta in deltas.items() if delta < 0)
+
+@event.listens_for(db.session, 'before_commit')
+def _release_unused_image_pins(session):
+    # Pins no flushed row took over (e.g. a photo re-uploaded into the slot that already holds it)
+    if session.info.get('image_pins'):
+        session.flush()
+        pins = session.info.pop('image_pins', {})
+        if pins:
+            adjust_image_refs(session.connection(), {image_url: -count for image_url, count in pins.items()})
+            session.info.setdefault('released_images', set()).update(pins)
+
+@event.listens_for(db.session, 'after_commit')
+def _collect_released_images(session):
+    released = session.info.pop('released_images', None)
+    if released:
+        try:
+            collect_image_garbage(released)
+        except Exception as e:
+            print(f"Error collecting unused images: {str(e)}")
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_released_images(session):
+    session.info.pop('released_images', None)
+    # Pins are rolled back with the transaction that took them
+    session.info.pop('image_pins', None)
+
+def _swap_bike_image(session, bike_id, image_url):
+    # A bulk UPDATE skips the flush hooks: count the reference, queue the Mongo sync and home page invalidation here
+    if image_url:
+        adjust_image_refs(session.connection(), {image_url: 1})
+    queue_bike_sync(session.connection(), [bike_id])
+    session.info['bikes_changed'] = True
+
+# Renders staged uploads in worker processes (see image_jobs.py)
+image_jobs = ImageJobQueue(
+    app, db, Bike, STATIC_FOLDER,
+    workers=app.config['IMAGE_WORKERS'],
+    on_swap=_swap_bike_image,
+    on_discard=lambda image_url: collect_image_garbage([image_url]),
+    lock_path=os.path.join(app.config['LOCK_FOLDER'], 'image-jobs-recovery.lock')
+)
+
+def submit_image_jobs(bike):
+    for slot in range(1, 4):
+        image_url = getattr(bike, f'image_url_{slot}')
+        if is_pending(image_url):
+            image_jobs.submit(bike.id, slot, image_url)
 
 @app.route('/')
 def index():
-    bikes = Bike.query.filter_by(is_available=True).order_by(Bike.created_at.desc()).all()
-    return render_template('index.html', bikes=bikes)
+    page = request.args.get('page', 1, type=int)
+    listing_type = request.args.get('type')
+    if listing_type not in ('rent', 'sale'):
+        listing_type = None
+
+    # Anonymous and logged-in visitors share the listing; only the page chrome is per user
+    key = (page, listing_type)
+    listing = home_fragments.get(key)
+    if listing is None:
+        query = Bike.query.filter_by(is_available=True)
+        if listing_type:
+            query = query.filter_by(listing_type=listing_type)
+        bikes = query.order_by(Bike.created_at.desc()).paginate(
+            page=page, per_page=app.config['HOME_PAGE_SIZE'], error_out=False
+        )
+        listing = render_template('_bike_listing.html', bikes=bikes, listing_type=listing_type)
+        home_fragments.set(key, listing)
+
+    return render_template('index.html', listing=Markup(listing), listing_type=listing_type)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -309,6 +807,12 @@ mongo_client = MongoClient(os.getenv('MONGO_URI'))
 mongo_db = mongo_client['bike_rental']
 bikes_collection = mongo_db['bikes']
 
+# Applies queued bike changes to Mongo in the background
+mongo_sync = MongoBikeSync(
+    app, db, Bike, BikeSyncOutbox, bikes_collection,
+    lock_path=os.path.join(app.config['LOCK_FOLDER'], 'mongo-sync.lock')
+)
+
 # Bike Management Routes
 @app.route('/bikes/add', methods=['GET', 'POST'])
 @login_required
@@ -374,15 +878,14 @@ def add_bike():
             return redirect(url_for('add_bike'))
 
         # Handle image uploads
-        image_urls = []
-        for i in range(1, 4):
-            image = files.get(f'image{i}') if not is_api else None
-            if image and allowed_file(image.filename):
-                filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-                image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                image_urls.append(os.path.join('bike_images', filename))
-            else:
-                image_urls.append(None)
+        try:
+            images = save_images(files) if not is_api else [None, None, None]
+        except UploadRejected as e:
+            if is_api:
+                return jsonify({'error': str(e)}), 400
+            flash(str(e), 'danger')
+            return redirect(url_for('add_bike'))
+        image_urls = [image['url'] if image else None for image in images]
 
         # Create SQL bike record with all required fields
         new_bike = Bike(
@@ -397,47 +900,18 @@ def add_bike():
             listing_type=listing_type,
             price_per_day=price_per_day,
             sale_price=sale_price,
-            owner_id=session['user_id'],
-            image_url_1=image_urls[0],
-            image_url_2=image_urls[1],
-            image_url_3=image_urls[2]
+            owner_id=session['user_id']
         )
+        for slot, image in enumerate(images, start=1):
+            if image:
+                set_bike_image(new_bike, slot, image)
+        update_suggested_price(new_bike)
 
         db.session.add(new_bike)
         db.session.commit()
+        submit_image_jobs(new_bike)
 
-        # Update MongoDB document structure
-        mongo_bike = {
-            'sql_id': new_bike.id,
-            'brand': data.get('brand'),
-            'model': data.get('model'),
-            'year': int(data.get('year')),
-            'engine_cc': int(data.get('engine_cc')),
-            'km_driven': int(data.get('km_driven')),
-            'mileage': float(data.get('mileage')),
-            'condition': data.get('condition'),
-            'listing_type': listing_type,
-            'price_per_day': price_per_day,
-            'sale_price': sale_price,
-            'description': data.get('description'),
-            'owner_id': session['user_id'],
-            'images': image_urls,
-            'created_at': datetime.utcnow(),
-            'is_available': True,
-            'metadata': {
-                'views': 0,
-                'favorites': 0,
-                'last_viewed': None,
-                'search_keywords': [
-                    data.get('brand', '').lower(),
-                    data.get('model', '').lower(),
-                    str(data.get('year')),
-                    data.get('condition', '').lower()
-                ]
-            }
-        }
-
-        bikes_collection.insert_one(mongo_bike)
+        # The Mongo document is written by mongo_sync from the outbox row queued with this commit
 
         if is_api:
             return jsonify({
@@ -451,6 +925,7 @@ def add_bike():
                     'listing_type': new_bike.listing_type,
                     'price_per_day': new_bike.price_per_day,
                     'sale_price': new_bike.sale_price,
+                    'suggested_price': new_bike.suggested_price,
                     'images': image_urls
                 }
             }), 201
@@ -460,9 +935,6 @@ def add_bike():
 
     except Exception as e:
         db.session.rollback()
-        # Cleanup MongoDB if SQL insert failed
-        if 'new_bike' in locals() and new_bike.id:
-            bikes_collection.delete_one({'sql_id': new_bike.id})
         
         error_msg = f"Error adding bike: {str(e)}"
         if is_api:
@@ -524,6 +996,13 @@ def edit_bike(bike_id):
         return redirect(url_for('my_bikes'))
     
     if request.method == 'POST':
+        # Staged before the bike is touched, so a rejected photo leaves nothing to undo
+        try:
+            images = save_images(request.files)
+        except UploadRejected as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('edit_bike', bike_id=bike_id))
+
         try:
             bike.name = request.form.get('name')
             bike.model = request.form.get('model')
@@ -543,15 +1022,13 @@ def edit_bike(bike_id):
                 bike.sale_price = float(sale_price) if sale_price else None
                 bike.price_per_day = None
             
-            # Handle image uploads
-            for i in range(1, 4):
-                image = request.files.get(f'image{i}')
-                if image and allowed_file(image.filename):
-                    filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-                    image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                    setattr(bike, f'image_url_{i}', os.path.join('bike_images', filename))
+            for slot, image in enumerate(images, start=1):
+                if image:
+                    set_bike_image(bike, slot, image)
 
+            update_suggested_price(bike)
             db.session.commit()
+            submit_image_jobs(bike)
             flash('Bike updated successfully!', 'success')
             return redirect(url_for('my_bikes'))
             
@@ -690,40 +1167,22 @@ def request_purchase(bike_id):
 
             # Send notifications
             try:
-                send_email(
-                    to=buyer.email,
-                    subject=f"Purchase Request Sent - {bike.brand}",
-                    body=f"""Hi {buyer.username},
-
-Your purchase request has been sent for {bike.brand}.
-
-Details:
-- Bike: {bike.brand} ({bike.year} {bike.brand} {bike.model})
-- Price: ${bike.sale_price:,.2f}
-
-The seller will review your request and respond soon.
-
-Best regards,
-The Bike Rental Team"""
+                send_template_email(
+                    buyer.email,
+                    f"Purchase Request Sent - {bike.brand}",
+                    'email/purchase_request_sent.txt',
+                    buyer=buyer,
+                    bike=bike
                 )
 
-                send_email(
-                    to=seller.email,
-                    subject=f"New Purchase Request - {bike.brand}",
-                    body=f"""Hi {seller.username},
-
-{buyer.username} wants to buy your {bike.brand}.
-
-Buyer Details:
-- Name: {buyer.username}
-- Contact: {buyer.mobile if buyer.mobile else 'Not provided'}
-
-Message: {message}
-
-Review this request in your dashboard.
-
-Best regards,
-The Bike Rental Team"""
+                send_template_email(
+                    seller.email,
+                    f"New Purchase Request - {bike.brand}",
+                    'email/purchase_request_received.txt',
+                    buyer=buyer,
+                    seller=seller,
+                    bike=bike,
+                    message=message
                 )
             except Exception as e:
                 print(f"Error sending emails: {str(e)}")
@@ -790,68 +1249,50 @@ def handle_purchase_request(request_id):
             ).all()
             for req in other_requests:
                 req.status = 'rejected'
-                # Send rejection email
-                send_email(
-                    to=req.buyer_user.email,
-                    subject=f"Purchase Request Rejected - {bike.brand}",
-                    body=f"""Hi {req.buyer_user.username},
-
-Unfortunately, your purchase request for {bike.brand} was not accepted as the bike has been sold to another buyer.
-
-You can continue browsing other available bikes on our platform.
-
-Best regards,
-The Bike Rental Team"""
-                )
+            # Emails are rendered now but only queued once the decision is committed
+            # Tell every losing bidder in one rendering pass
+            send_bulk_template_email(
+                'email/purchase_sold_to_other.txt',
+                [
+                    (req.buyer_user.email, f"Purchase Request Rejected - {bike.brand}", {'buyer': req.buyer_user})
+                    for req in other_requests
+                ],
+                bike=bike,
+                after_commit=True
+            )
             
             # Send acceptance email
-            send_email(
-                to=purchase.buyer_user.email,
-                subject=f"Purchase Request Accepted - {bike.brand}",
-                body=f"""Hi {purchase.buyer_user.username},
-
-Great news! {bike.owner_user.username} has accepted your purchase request for {bike.brand}.
-
-Seller Contact:
-{bike.owner_user.mobile if bike.owner_user.mobile else 'Not provided'}
-
-Please contact the seller to arrange the payment and pickup.
-
-Best regards,
-The Bike Rental Team"""
+            send_template_email(
+                purchase.buyer_user.email,
+                f"Purchase Request Accepted - {bike.brand}",
+                'email/purchase_accepted_buyer.txt',
+                buyer=purchase.buyer_user,
+                seller=bike.owner_user,
+                bike=bike,
+                after_commit=True
             )
             
             # Send notification to seller
-            send_email(
-                to=bike.owner_user.email,
-                subject=f"You've Accepted a Purchase Request - {bike.brand}",
-                body=f"""Hi {bike.owner_user.username},
-
-You have accepted the purchase request from {purchase.buyer_user.username} for your bike {bike.brand}.
-
-Buyer Contact:
-{purchase.buyer_user.mobile if purchase.buyer_user.mobile else 'Not provided'}
-
-Please wait for the buyer to contact you to arrange the payment and pickup.
-
-Best regards,
-The Bike Rental Team"""
+            send_template_email(
+                bike.owner_user.email,
+                f"You've Accepted a Purchase Request - {bike.brand}",
+                'email/purchase_accepted_seller.txt',
+                buyer=purchase.buyer_user,
+                seller=bike.owner_user,
+                bike=bike,
+                after_commit=True
             )
             
         else:  # reject
             purchase.status = 'rejected'
             purchase.seller_id = session['user_id']  # Set the seller_id
-            send_email(
-                to=purchase.buyer_user.email,
-                subject=f"Purchase Request Rejected - {bike.brand}",
-                body=f"""Hi {purchase.buyer_user.username},
-
-Unfortunately, your purchase request for {bike.brand} was not accepted.
-
-You can continue browsing other available bikes on our platform.
-
-Best regards,
-The Bike Rental Team"""
+            send_template_email(
+                purchase.buyer_user.email,
+                f"Purchase Request Rejected - {bike.brand}",
+                'email/purchase_rejected.txt',
+                buyer=purchase.buyer_user,
+                bike=bike,
+                after_commit=True
             )
         
         db.session.commit()
@@ -1091,8 +1532,90 @@ def init_db():
     print("Initializing database...")
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as connection:
+            bike_search.create_search_index(connection)
         print("Database tables created successfully!")
 
+def usernames_by_id(user_ids):
+    """
+    Look up usernames for many users with a single IN query.
+    Returns: dict of user id -> username (missing users are left out)
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    rows = db.session.query(User.id, User.username).filter(User.id.in_(user_ids))
+    return {user_id: username for user_id, username in rows}
+
+# Rows fetched per database round trip when streaming an export
+STREAM_BATCH_SIZE = 500
+
+def wants_ndjson():
+    """True when the client asked for a streamed NDJSON export (?format=ndjson or Accept header)"""
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def ndjson_response(records):
+    """Stream records as newline-delimited JSON, one line per record, as they are produced"""
+    def generate():
+        for record in records:
+            yield json.dumps(record, default=str) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Response fields of /api/bikes/search and the Mongo fields each one is built from
+SEARCH_RESULT_FIELDS = {
+    'id': ['sql_id'],
+    'name': ['brand'],
+    'brand': ['brand'],
+    'model': ['model'],
+    'year': ['year'],
+    'condition': ['condition'],
+    'listing_type': ['listing_type'],
+    'price_per_day': ['price_per_day'],
+    'sale_price': ['sale_price'],
+    'is_available': ['is_available'],
+    'owner': ['owner_id'],
+    'images': ['images'],
+    'metadata': ['metadata.views', 'metadata.favorites']
+}
+
+def format_search_result(bike, fields, usernames):
+    """Build a search result containing only the requested fields"""
+    metadata = bike.get('metadata', {})
+    result = {
+        'id': bike['sql_id'],  # Keep the SQL ID for compatibility
+        'name': bike.get('brand'),
+        'brand': bike.get('brand'),
+        'model': bike.get('model'),
+        'year': bike.get('year'),
+        'condition': bike.get('condition'),
+        'listing_type': bike.get('listing_type'),
+        'price_per_day': bike.get('price_per_day'),
+        'sale_price': bike.get('sale_price'),
+        'is_available': bike.get('is_available'),
+        'owner': {
+            'id': bike.get('owner_id'),
+            'username': usernames.get(bike.get('owner_id'))  # Get username from SQL
+        },
+        'images': bike.get('images'),
+        'metadata': {
+            'views': metadata.get('views'),
+            'favorites': metadata.get('favorites')
+        }
+    }
+    return {field: result[field] for field in fields}
+
+def stream_search_results(bikes, fields):
+    """Format a Mongo cursor batch by batch, resolving each batch's owners in one query"""
+    bikes = iter(bikes)
+    while True:
+        batch = list(islice(bikes, STREAM_BATCH_SIZE))
+        if not batch:
+            return
+        usernames = usernames_by_id(bike['owner_id'] for bike in batch) if 'owner' in fields else {}
+        for bike in batch:
+            yield format_search_result(bike, fields, usernames)
+
 @app.route('/api/bikes/search', methods=['GET'])
 def search_bikes():
     try:
@@ -1137,45 +1660,169 @@ def search_bikes():
                 })
             query['$or'] = price_query
 
-        # Execute MongoDB query
-        bikes = bikes_collection.find(query)
+        # Fetch one page, newest first, with only the fields the client asked for
+        limit = page_size(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor) if cursor else None
+        fields = requested_fields(request.args.get('fields'), SEARCH_RESULT_FIELDS)
+        projection = projection_for(fields, SEARCH_RESULT_FIELDS)
+
+        if wants_ndjson():
+            # Export mode: stream every match from the cursor instead of one page
+            bikes = (bikes_collection.find(after_cursor(query, cursor), projection)
+                     .sort(SEARCH_SORT)
+                     .batch_size(STREAM_BATCH_SIZE))
+            return ndjson_response(stream_search_results(bikes, fields))
+
+        bikes, next_cursor = find_page(bikes_collection, query, limit, cursor=cursor, projection=projection)
+
+        # Resolve every owner's username in one SQL query instead of one per bike
+        usernames = usernames_by_id(bike['owner_id'] for bike in bikes) if 'owner' in fields else {}
 
         # Format results
-        results = []
-        for bike in bikes:
-            results.append({
-                'id': bike['sql_id'],  # Keep the SQL ID for compatibility
-                'name': bike['name'],
-                'model': bike['model'],
-                'year': bike['year'],
-                'condition': bike['condition'],
-                'listing_type': bike['listing_type'],
-                'price_per_day': bike['price_per_day'],
-                'sale_price': bike['sale_price'],
-                'is_available': bike['is_available'],
-                'owner': {
-                    'id': bike['owner_id'],
-                    'username': User.query.get(bike['owner_id']).username  # Get username from SQL
-                },
-                'images': bike['images'],
-                'metadata': {
-                    'views': bike['metadata']['views'],
-                    'favorites': bike['metadata']['favorites']
-                }
-            })
+        results = [format_search_result(bike, fields, usernames) for bike in bikes]
 
         return jsonify({
             'status': 'success',
             'count': len(results),
+            'limit': limit,
+            'next_cursor': next_cursor,
             'bikes': results
         }), 200
 
+    except PaginationError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+@app.route('/api/mongo-sync/metrics', methods=['GET'])
+def mongo_sync_metrics():
+    return jsonify(mongo_sync.metrics()), 200
+
+@app.cli.command('sync-mongo')
+def sync_mongo_command():
+    """Apply every queued bike change to Mongo, then exit."""
+    applied = mongo_sync.drain()
+    print(f"Applied {applied} queued bike changes")
+
+@app.cli.command('reconcile-mongo')
+@click.option('--chunk-size', default=500, help='Bikes compared per round trip')
+@click.option('--dry-run', is_flag=True, help='Report differences without repairing them')
+def reconcile_mongo_command(chunk_size, dry_run):
+    """Diff SQL bikes against Mongo documents and repair missing, stale and orphaned ones."""
+    report = mongo_sync.reconcile(chunk_size=chunk_size, repair=not dry_run)
+    print(f"Checked {report['checked']} bikes: {report['missing']} missing, {report['stale']} stale, "
+          f"{report['orphaned']} orphaned documents; repaired {report['repaired']}")
+
+@app.cli.command('create-search-index')
+def create_search_index_command():
+    """Create the Mongo index that backs cursor pagination of /api/bikes/search."""
+    ensure_search_index(bikes_collection)
+    print("Search index ready")
+
+def format_rental_request(rental_request):
+    return {
+        'id': rental_request.id,
+        'bike_id': rental_request.bike_id,
+        'bike': {
+            'brand': rental_request.bike.brand,
+            'model': rental_request.bike.model,
+            'year': rental_request.bike.year
+        },
+        'renter_id': rental_request.renter_id,
+        'renter': {
+            'username': rental_request.renter.username,
+            'email': rental_request.renter.email
+        },
+        'start_date': rental_request.start_date.strftime('%Y-%m-%d'),
+        'end_date': rental_request.end_date.strftime('%Y-%m-%d'),
+        'status': rental_request.status,
+        'message': rental_request.message,
+        'created_at': rental_request.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+@app.route('/api/bikes/text-search', methods=['GET'])
+def text_search_bikes():
+    """Ranked full-text search over the SQL catalog with facet counts (see bike_search.py)"""
+    try:
+        results = bike_search.search(
+            db.session,
+            query=request.args.get('q', '').strip(),
+            brand=request.args.get('brand'),
+            condition=request.args.get('condition'),
+            listing_type=request.args.get('listing_type'),
+            year=request.args.get('year'),
+            limit=request.args.get('limit', type=int, default=bike_search.DEFAULT_LIMIT),
+            offset=request.args.get('offset', type=int, default=0)
+        )
+
+        # Load the page's bikes in one query and keep the ranked order
+        bikes = {bike.id: bike for bike in Bike.query.filter(Bike.id.in_(results['ids']))} if results['ids'] else {}
+        bikes_data = []
+        for bike_id in results['ids']:
+            bike = bikes.get(bike_id)
+            if bike is None:
+                continue
+            bikes_data.append({
+                'id': bike.id,
+                'brand': bike.brand,
+                'model': bike.model,
+                'year': bike.year,
+                'condition': bike.condition,
+                'listing_type': bike.listing_type,
+                'price_per_day': bike.price_per_day,
+                'sale_price': bike.sale_price,
+                'suggested_price': bike.suggested_price,
+                'is_available': bike.is_available,
+                'image_url': bike.image_url_1
+            })
+
+        return jsonify({
+            'status': 'success',
+            'total': results['total'],
+            'count': len(bikes_data),
+            'bikes': bikes_data,
+            'facets': {
+                facet: [{'value': value, 'count': count} for value, count in counts]
+                for facet, counts in results['facets'].items()
+            }
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except OperationalError as e:
+        db.session.rollback()
+        if not bike_search.search_index_exists(db.session.connection()):
+            return jsonify({
+                'status': 'error',
+                'message': 'The bike search index does not exist; run migrations/add_bike_search_index.py'
+            }), 503
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Re-index every bike in the bike_search full-text table."""
+    with db.engine.begin() as connection:
+        bike_search.rebuild_search_index(connection)
+    print("Bike search index rebuilt")
+
 @app.route('/api/rental-requests', methods=['GET'])
 @login_required
 def get_rental_requests():
@@ -1196,31 +1843,21 @@ def get_rental_requests():
         if renter_id:
             query = query.filter(RentalRequest.renter_id == renter_id)
 
-        # Order by created_at descending
-        rental_requests = query.order_by(RentalRequest.created_at.desc()).all()
+        # Order by created_at descending; load each request's bike and renter in the same query
+        query = query.order_by(RentalRequest.created_at.desc()).options(
+            joinedload(RentalRequest.bike),
+            joinedload(RentalRequest.renter)
+        )
+
+        if wants_ndjson():
+            # Export mode: stream rows as they are read instead of building the whole list
+            return ndjson_response(
+                format_rental_request(rental_request)
+                for rental_request in query.yield_per(STREAM_BATCH_SIZE)
+            )
 
         # Format the response
-        requests_data = []
-        for request in rental_requests:
-            requests_data.append({
-                'id': request.id,
-                'bike_id': request.bike_id,
-                'bike': {
-                    'brand': request.bike.brand,
-                    'model': request.bike.model,
-                    'year': request.bike.year
-                },
-                'renter_id': request.renter_id,
-                'renter': {
-                    'username': request.renter.username,
-                    'email': request.renter.email
-                },
-                'start_date': request.start_date.strftime('%Y-%m-%d'),
-                'end_date': request.end_date.strftime('%Y-%m-%d'),
-                'status': request.status,
-                'message': request.message,
-                'created_at': request.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
+        requests_data = [format_rental_request(rental_request) for rental_request in query]
 
         return jsonify({
             'status': 'success',
@@ -1265,6 +1902,8 @@ def clear_rental_requests():
         
         # Commit the changes
         db.session.commit()
+        # Bulk deletes skip the session hooks, so drop every cached navbar count
+        pending_request_counts.clear()
         
         return jsonify({
             'status': 'success',
@@ -1286,6 +1925,8 @@ def clear_db_confirm():
             # Clear SQLite tables
     db.drop_all()
     db.create_all()
+    with db.engine.begin() as connection:
+        bike_search.ensure_search_index(connection)
             
     # Clear MongoDB collections
     mongo_db.bikes.delete_many({})
@@ -1349,6 +1990,27 @@ def clear_purchases():
             'message': str(e)
         }), 500
 
+@app.before_first_request
+def start_background_workers():
+    # Also picks up emails, bike changes and photo uploads left queued by a previous run
+    email_outbox.start()
+    mongo_sync.start()
+    image_jobs.recover()
+
+@app.route('/api/image-jobs/metrics', methods=['GET'])
+def image_jobs_metrics():
+    return jsonify(image_jobs.metrics()), 200
+
+@app.route('/api/email-outbox/metrics', methods=['GET'])
+def email_outbox_metrics():
+    return jsonify(dict(email_outbox.metrics(), rendering=email_renderer.metrics())), 200
+
+@app.cli.command('send-emails')
+def send_emails_command():
+    """Deliver every queued email that is due, then exit."""
+    sent = email_outbox.drain()
+    print(f"Processed {sent} queued emails")
+
 @app.route('/test-mail')
 def test_mail():
     if not app.debug:
@@ -1371,17 +2033,161 @@ def test_mail():
         }
     })
 
-# Load the trained model and preprocessing objects
-model_artifacts = joblib.load('bike_price_model.joblib')
-rf_model = model_artifacts['model']
-scaler = model_artifacts['scaler']
-label_encoders = model_artifacts['label_encoders']
+# Maximum number of bikes accepted by the batch analyze endpoint
+MAX_ANALYZE_BATCH = 500
+
+prediction_cache = PredictionCache(
+    max_entries=app.config['PREDICTION_CACHE_SIZE'],
+    ttl=app.config['PREDICTION_CACHE_TTL'],
+    store_path=app.config['PREDICTION_CACHE_PATH']
+)
+
+def bike_price_features(bike):
+    """Extract the price model inputs from a Bike row or a raw feature dict"""
+    get = bike.get if isinstance(bike, dict) else lambda key: getattr(bike, key)
+    return {
+        'brand': get('brand'),
+        'model': get('model'),
+        'year': int(get('year')),
+        'engine_cc': int(get('engine_cc')),
+        'km_driven': int(get('km_driven')),
+        'mileage': float(get('mileage')),
+        'condition': get('condition')
+    }
+
+def predict_prices(rows):
+    """
+    Predict prices for many feature dicts with a single model call
+    Returns: list of floats, None for rows with an unknown brand/model/condition
+    """
+    # The model is loaded lazily and memory-mapped on first use
+    price_model, version = price_registry.get_versioned()
+    X_input, known = price_model.encode(rows)
+    predictions = [None] * len(rows)
+    if len(X_input):
+        # Identical feature vectors share one cached prediction per model version
+        keys = prediction_cache.keys_for(X_input)
+        prices = prediction_cache.get_many(version, keys)
+        missing = [i for i, price in enumerate(prices) if price is None]
+        if missing:
+            fresh = price_model.predict(X_input[missing])
+            prediction_cache.put_many(version, [keys[i] for i in missing], fresh)
+            for i, price in zip(missing, fresh):
+                prices[i] = float(price)
+        for index, price in zip(np.flatnonzero(known), prices):
+            predictions[index] = price
+    return predictions
+
+@app.route('/api/price-model/metrics', methods=['GET'])
+def price_model_metrics():
+    return jsonify(dict(price_registry.metrics(), prediction_cache=prediction_cache.metrics())), 200
+
+def update_suggested_price(bike):
+    """
+    Store the model's price estimate on a Bike row (caller commits)
+    Returns: the suggested price, or None if the bike could not be priced
+    """
+    try:
+        _, version = price_registry.get_versioned()
+        bike.suggested_price = predict_prices([bike_price_features(bike)])[0]
+        bike.last_price_calculation = datetime.utcnow()
+        bike.price_model_version = version
+    except Exception as e:
+        # Pricing is advisory; never block saving a listing on it
+        print(f"Error calculating suggested price for bike {bike.id}: {str(e)}")
+    return bike.suggested_price
+
+def stored_suggested_price(bike):
+    """The persisted estimate if it was computed by the model version being served, else None"""
+    _, version = price_registry.get_versioned()
+    if bike.suggested_price is not None and bike.price_model_version == version:
+        return bike.suggested_price
+    return None
+
+REPRICE_BATCH_SIZE = 500
+
+def reprice_bikes(batch_size=REPRICE_BATCH_SIZE):
+    """
+    Re-price every bike priced by an older model version, in vectorized batches
+    Returns: number of bikes updated
+    """
+    _, version = price_registry.get_versioned()
+    updated = 0
+    last_id = 0
+    while True:
+        # Keyset pagination keeps every batch an indexed range scan
+        bikes = Bike.query.filter(
+            Bike.id > last_id,
+            db.or_(Bike.price_model_version.is_(None), Bike.price_model_version != version)
+        ).order_by(Bike.id).limit(batch_size).all()
+        if not bikes:
+            break
+        last_id = bikes[-1].id
+
+        rows, priced = [], []
+        for bike in bikes:
+            try:
+                rows.append(bike_price_features(bike))
+                priced.append(bike)
+            except (TypeError, ValueError):
+                continue
+        now = datetime.utcnow()
+        mappings = [
+            {
+                'id': bike.id,
+                'suggested_price': price,
+                'last_price_calculation': now,
+                'price_model_version': version
+            }
+            for bike, price in zip(priced, predict_prices(rows))
+        ]
+        db.session.bulk_update_mappings(Bike, mappings)
+        # Bulk updates skip the flush hooks, so queue the Mongo refresh explicitly
+        if mappings:
+            queue_bike_sync(db.session.connection(), [mapping['id'] for mapping in mappings])
+        db.session.commit()
+        mongo_sync.notify()
+        db.session.expire_all()
+        updated += len(mappings)
+    print(f"Re-priced {updated} bikes with price model version {version}")
+    return updated
+
+def reprice_lock():
+    """Held by whichever process is backfilling stored prices"""
+    return FileLock(os.path.join(app.config['LOCK_FOLDER'], 'reprice-bikes.lock'))
+
+def _start_reprice_job(version, previous):
+    """Backfill stored prices in a background thread when a newly activated model version is served"""
+    if previous is None:
+        # A worker loading its first version is not a model change; 'flask reprice-bikes' covers older rows
+        return
+    def run():
+        lock = reprice_lock()
+        if not lock.acquire(blocking=False):
+            # Another worker process is already backfilling
+            return
+        try:
+            with app.app_context():
+                reprice_bikes()
+        except Exception as e:
+            print(f"Error re-pricing bikes: {str(e)}")
+        finally:
+            lock.release()
+    threading.Thread(target=run, name='reprice-bikes', daemon=True).start()
+
+price_registry.on_version_change(_start_reprice_job)
+
+@app.cli.command('reprice-bikes')
+def reprice_bikes_command():
+    """Re-price all bikes whose stored estimate is from an older model version."""
+    # Holding the lock keeps the version-change listeners in running workers from starting a second backfill
+    with reprice_lock():
+        reprice_bikes()
 
 @app.route('/api/bikes/<int:bike_id>/analyze', methods=['GET'])
 def analyze_bike(bike_id):
     try:
-        # Get bike from MongoDB using SQL ID
-        bike = bikes_collection.find_one({'sql_id': bike_id})
+        bike = Bike.query.get(bike_id)
         
         if not bike:
             return jsonify({
@@ -1390,47 +2196,102 @@ def analyze_bike(bike_id):
             }), 404
 
         # Prepare input data
-        input_data = {
-            'brand': bike['brand'],
-            'model': bike['model'],
-            'year': int(bike['year']),
-            'engine_cc': int(bike['engine_cc']),
-            'km_driven': int(bike['km_driven']),
-            'mileage': float(bike['mileage']),
-            'condition': bike['condition']
-        }
+        input_data = bike_price_features(bike)
 
-        # Transform categorical variables
-        brand_encoded = label_encoders['brand'].transform([input_data['brand']])[0]
-        model_encoded = label_encoders['model'].transform([input_data['model']])[0]
-        condition_encoded = label_encoders['condition'].transform([input_data['condition']])[0]
+        # Use the price stored at write time; only predict if it is missing or stale
+        estimated_price = stored_suggested_price(bike)
+        if estimated_price is None:
+            estimated_price = predict_prices([input_data])[0]
+        if estimated_price is None:
+            return jsonify({
+                'success': False,
+                'message': f"The price model does not know {input_data['brand']} {input_data['model']} ({input_data['condition']})",
+                'parameters': input_data
+            }), 422
 
-        # Create feature vector
-        X_input = [[
-            brand_encoded,
-            model_encoded,
-            input_data['year'],
-            input_data['engine_cc'],
-            input_data['km_driven'],
-            input_data['mileage'],
-            condition_encoded
-        ]]
+        return jsonify({
+            'success': True,
+            'estimated_price': estimated_price,
+            'actual_price': float(bike.sale_price) if bike.sale_price is not None else None,
+            'parameters': input_data
+        }), 200
+
+    except Exception as e:
+        print(f"Analysis error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"Analysis error: {str(e)}"
+        }), 500
 
-        # Scale features
-        X_input_scaled = scaler.transform(X_input)
+@app.route('/api/bikes/analyze', methods=['GET', 'POST'])
+def analyze_bikes():
+    """
+    Batch price estimation for listing pages.
+    Accepts ?ids=1,2,3 or a JSON body with either 'bike_ids' or raw 'bikes' feature rows.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        raw_rows = data.get('bikes')
+        if raw_rows is None:
+            bike_ids = data.get('bike_ids')
+            if bike_ids is None:
+                bike_ids = [part for part in request.args.get('ids', '').split(',') if part.strip()]
+            bike_ids = list(dict.fromkeys(int(bike_id) for bike_id in bike_ids))
+            if len(bike_ids) > MAX_ANALYZE_BATCH:
+                return jsonify({
+                    'success': False,
+                    'message': f'At most {MAX_ANALYZE_BATCH} bikes can be analyzed per request'
+                }), 400
+
+            # Bulk-load every requested bike with a single IN query
+            bikes = Bike.query.filter(Bike.id.in_(bike_ids)).all() if bike_ids else []
+            bikes_by_id = {bike.id: bike for bike in bikes}
+            found = [bikes_by_id[bike_id] for bike_id in bike_ids if bike_id in bikes_by_id]
+            not_found = [bike_id for bike_id in bike_ids if bike_id not in bikes_by_id]
+            rows = [bike_price_features(bike) for bike in found]
+            identities = [{'id': bike.id, 'actual_price': bike.sale_price} for bike in found]
+            stored = [stored_suggested_price(bike) for bike in found]
+        else:
+            if len(raw_rows) > MAX_ANALYZE_BATCH:
+                return jsonify({
+                    'success': False,
+                    'message': f'At most {MAX_ANALYZE_BATCH} bikes can be analyzed per request'
+                }), 400
+            not_found = []
+            rows = [bike_price_features(row) for row in raw_rows]
+            identities = [{'id': row.get('id'), 'actual_price': row.get('sale_price')} for row in raw_rows]
+            stored = [None] * len(rows)
+
+        # Only bikes without a current stored estimate go through the model
+        missing = [i for i, price in enumerate(stored) if price is None]
+        predictions = list(stored)
+        for i, price in zip(missing, predict_prices([rows[i] for i in missing])):
+            predictions[i] = price
 
-        # Make prediction
-        estimated_price = rf_model.predict(X_input_scaled)[0]
+        results = []
+        for identity, input_data, estimated_price in zip(identities, rows, predictions):
+            results.append({
+                'id': identity['id'],
+                'estimated_price': estimated_price,
+                'actual_price': float(identity['actual_price']) if identity['actual_price'] is not None else None,
+                'parameters': input_data,
+                'error': None if estimated_price is not None else 'Unknown brand, model or condition'
+            })
 
         return jsonify({
             'success': True,
-            'estimated_price': float(estimated_price),
-            'actual_price': float(bike['sale_price']),
-            'parameters': input_data
+            'count': len(results),
+            'results': results,
+            'not_found': not_found
         }), 200
 
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({
+            'success': False,
+            'message': f"Invalid analyze request: {str(e)}"
+        }), 400
     except Exception as e:
-        print(f"Analysis error: {str(e)}")
+        print(f"Batch analysis error: {str(e)}")
         return jsonify({
             'success': False,
             'message': f"Analysis error: {str(e)}"
@@ -1439,5 +2300,8 @@ def analyze_bike(bike_id):
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as connection:
+            if bike_search.ensure_search_index(connection):
+                print("Bike search index created")
         print("Database initialized successfully!")
     app.run(debug=True, port=5002)
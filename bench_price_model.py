@@ -0,0 +1,297 @@
+"""
+Latency benchmark for bike price estimation.
+
+Runs the same scenarios against the sklearn model in bike_price_model.joblib
+and the compiled NumPy engine the app serves:
+
+    single_row   one analyze_bike-style call (encode a feature dict + predict)
+    batch_10     10 rows per call
+    batch_100    100 rows per call
+    batch_10000  10k rows per call
+    cold_start   fresh interpreter: load the model and make the first prediction
+
+Each scenario reports p50/p95/p99 latency, rows per second and peak RSS.
+The peak is reset before each warm scenario (Linux only; elsewhere it is
+reported as None) and cold starts run in their own process, so every
+scenario reports its own peak. The result is written as JSON together with
+the git commit, model hash and model version, so runs can be compared
+across commits and model versions.
+
+Usage:
+    python bench_price_model.py [--engine compiled --engine sklearn] [--output bench.json]
+                                [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from price_engine import BASE_DIR, DEFAULT_DATA_PATH, DEFAULT_MODEL_PATH, FEATURE_ORDER, CompiledForest
+
+BATCH_SIZES = [10, 100, 10000]
+ENGINES = ['compiled', 'sklearn']
+
+
+def peak_rss_bytes():
+    """Peak RSS of this process's address space"""
+    try:
+        # VmHWM, unlike ru_maxrss, does not carry over the parent's peak across fork and exec
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """
+    Restart peak RSS tracking at the current RSS (Linux 4.0+), so the peak covers only what follows.
+    Returns: True if the peak was reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def load_rows(data_path=DEFAULT_DATA_PATH):
+    """Feature dicts in the shape analyze_bike builds, taken from the training CSV"""
+    # Imported here so cold-start children do not pay for pandas
+    import pandas as pd
+
+    df = pd.read_csv(data_path)
+    return [
+        {
+            'brand': row.Brand,
+            'model': row.Model,
+            'year': int(row.Year),
+            'engine_cc': int(row.Engine_CC),
+            'km_driven': int(row.KM_Driven),
+            'mileage': float(row.Mileage_KMPL),
+            'condition': row.Condition
+        }
+        for row in df.itertuples()
+    ]
+
+
+class SklearnEngine:
+    """The pre-compiled request path: LabelEncoder.transform, scaler.transform, forest.predict"""
+
+    def __init__(self, artifacts):
+        self.model = artifacts['model']
+        self.scaler = artifacts['scaler']
+        self.label_encoders = artifacts['label_encoders']
+
+    def predict_rows(self, rows):
+        X = np.empty((len(rows), len(FEATURE_ORDER)), dtype=np.float64)
+        for j, column in enumerate(FEATURE_ORDER):
+            values = [row[column] for row in rows]
+            X[:, j] = self.label_encoders[column].transform(values) if column in self.label_encoders else values
+        return self.model.predict(self.scaler.transform(X))
+
+
+class CompiledEngine:
+    """The served request path: CategoryIndex encoding + CompiledForest.predict"""
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+
+    def predict_rows(self, rows):
+        X, _ = self.compiled.encode(rows)
+        return self.compiled.predict(X)
+
+
+def summarize(samples_ms, rows_per_call, peak_rss=None):
+    samples = np.asarray(samples_ms)
+    return {
+        'calls': int(len(samples)),
+        'rows_per_call': rows_per_call,
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'mean_ms': float(samples.mean()),
+        'rows_per_second': float(rows_per_call * len(samples) / (samples.sum() / 1000)),
+        'peak_rss_bytes': peak_rss,
+    }
+
+
+def run_scenario(engine, rows, rows_per_call, calls, warmup=3):
+    rng = np.random.RandomState(0)
+    batches = [
+        [rows[i] for i in rng.randint(0, len(rows), rows_per_call)]
+        for _ in range(min(calls, 20))
+    ]
+    for batch in batches[:warmup]:
+        engine.predict_rows(batch)
+    # Without a reset, the peak would be the largest of any earlier scenario
+    peak_reset = reset_peak_rss()
+    samples = []
+    for call in range(calls):
+        batch = batches[call % len(batches)]
+        start = time.perf_counter()
+        engine.predict_rows(batch)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples, rows_per_call, peak_rss_bytes() if peak_reset else None)
+
+
+def cold_start_child(engine_name, model_path, compiled_path, row):
+    """Runs in a fresh interpreter: load the model, predict once, report timings"""
+    start = time.perf_counter()
+    if engine_name == 'sklearn':
+        import joblib
+        engine = SklearnEngine(joblib.load(model_path))
+    else:
+        engine = CompiledEngine(CompiledForest.load(compiled_path, mmap_mode='r'))
+    loaded = time.perf_counter()
+    engine.predict_rows([row])
+    done = time.perf_counter()
+    return {
+        'load_ms': (loaded - start) * 1000,
+        'first_predict_ms': (done - loaded) * 1000,
+        'total_ms': (done - start) * 1000,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def run_cold_start(engine_name, model_path, compiled_path, row, repeats):
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--cold-start-child', engine_name,
+             '--model', model_path, '--compiled', compiled_path, '--row', json.dumps(row)],
+            check=True, capture_output=True, text=True, cwd=BASE_DIR
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    totals = np.asarray([sample['total_ms'] for sample in samples])
+    return {
+        'calls': repeats,
+        'rows_per_call': 1,
+        'p50_ms': float(np.percentile(totals, 50)),
+        'p95_ms': float(np.percentile(totals, 95)),
+        'p99_ms': float(np.percentile(totals, 99)),
+        'mean_ms': float(totals.mean()),
+        'load_p50_ms': float(np.median([sample['load_ms'] for sample in samples])),
+        'first_predict_p50_ms': float(np.median([sample['first_predict_ms'] for sample in samples])),
+        'peak_rss_bytes': int(max(sample['peak_rss_bytes'] for sample in samples)),
+    }
+
+
+def environment(model_path):
+    from model_registry import ModelStore, _file_sha256
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=BASE_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'git_commit': commit,
+        'model_path': os.path.basename(model_path),
+        'model_sha256': _file_sha256(model_path),
+        'model_version': ModelStore().current_version(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def benchmark(engines=ENGINES, model_path=DEFAULT_MODEL_PATH, data_path=DEFAULT_DATA_PATH,
+              single_calls=2000, batch_calls=200, cold_starts=5):
+    import joblib
+
+    artifacts = joblib.load(model_path)
+    compiled = CompiledForest.from_artifacts(artifacts)
+    rows = load_rows(data_path)
+    built = {'compiled': CompiledEngine(compiled), 'sklearn': SklearnEngine(artifacts)}
+
+    results = {'environment': environment(model_path), 'scenarios': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        compiled_path = os.path.join(tmp, 'compiled')
+        compiled.save(compiled_path)
+
+        for engine_name in engines:
+            engine = built[engine_name]
+            scenarios = {'single_row': run_scenario(engine, rows, 1, single_calls)}
+            print(f"{engine_name:<9} single_row    p50={scenarios['single_row']['p50_ms']:.3f}ms")
+            for size in BATCH_SIZES:
+                calls = max(5, batch_calls // max(1, size // 100))
+                scenarios[f'batch_{size}'] = run_scenario(engine, rows, size, calls)
+                print(f"{engine_name:<9} batch_{size:<7} p50={scenarios[f'batch_{size}']['p50_ms']:.3f}ms")
+            if cold_starts:
+                scenarios['cold_start'] = run_cold_start(
+                    engine_name, os.path.abspath(model_path), compiled_path, rows[0], cold_starts
+                )
+                print(f"{engine_name:<9} cold_start    p50={scenarios['cold_start']['p50_ms']:.1f}ms")
+            results['scenarios'][engine_name] = scenarios
+    return results
+
+
+def compare(current, previous):
+    """Print p50 and throughput changes against an earlier run"""
+    print(f"\nCompared with {previous['environment'].get('git_commit')} "
+          f"(model {previous['environment'].get('model_version')}):")
+    for engine_name, scenarios in current['scenarios'].items():
+        for name, result in scenarios.items():
+            before = previous.get('scenarios', {}).get(engine_name, {}).get(name)
+            if not before:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            print(f"  {engine_name:<9} {name:<12} p50 {before['p50_ms']:.3f} -> {result['p50_ms']:.3f}ms ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark bike price estimation')
+    parser.add_argument('--engine', action='append', choices=ENGINES)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    parser.add_argument('--single-calls', type=int, default=2000)
+    parser.add_argument('--batch-calls', type=int, default=200)
+    parser.add_argument('--cold-starts', type=int, default=5, help='Fresh-interpreter runs (0 to skip)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Earlier JSON result to compare against')
+    parser.add_argument('--cold-start-child', choices=ENGINES, help=argparse.SUPPRESS)
+    parser.add_argument('--compiled', help=argparse.SUPPRESS)
+    parser.add_argument('--row', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cold_start_child:
+        print(json.dumps(cold_start_child(args.cold_start_child, args.model, args.compiled, json.loads(args.row))))
+        return
+
+    results = benchmark(
+        engines=args.engine or ENGINES,
+        model_path=args.model,
+        data_path=args.data,
+        single_calls=args.single_calls,
+        batch_calls=args.batch_calls,
+        cold_starts=args.cold_starts
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
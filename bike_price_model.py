@@ -1,38 +1,30 @@
-import pandas as pd
+"""
+Training pipeline for the bike price model.
+
+Importing this module has no side effects: predict_bike_price() scores with the
+published model from the model registry instead of training one.
+
+Usage:
+    python bike_price_model.py [--data used_bike_data.csv] [--n-jobs -1] [--cv-folds 5]
+                               [--plot results.png] [--verbose] [--no-publish]
+"""
+import argparse
+import time
+from contextlib import contextmanager
+
 import numpy as np
+import pandas as pd
+import joblib
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-import matplotlib.pyplot as plt
-import seaborn as sns
-import joblib
-
-# Load the dataset
-df = pd.read_csv('used_bike_data.csv')
-
-# Data Analysis
-print("\nDataset Info:")
-print(df.info())
-
-print("\nBasic Statistics:")
-print(df.describe())
 
-print("\nMissing Values:")
-print(df.isnull().sum())
+from price_engine import DEFAULT_DATA_PATH, DEFAULT_MODEL_PATH, UNKNOWN_CATEGORY
 
-# Feature Engineering
-# Convert categorical variables to numerical
-le_brand = LabelEncoder()
-le_model = LabelEncoder()
-le_condition = LabelEncoder()
-
-df['Brand_Encoded'] = le_brand.fit_transform(df['Brand'])
-df['Model_Encoded'] = le_model.fit_transform(df['Model'])
-df['Condition_Encoded'] = le_condition.fit_transform(df['Condition'])
-
-# Create feature matrix X and target variable y
-X = df[[
+# Column names in used_bike_data.csv, in the order the model expects
+FEATURE_COLUMNS = [
     'Brand_Encoded',
     'Model_Encoded',
     'Year',
@@ -40,126 +32,221 @@ X = df[[
     'KM_Driven',
     'Mileage_KMPL',
     'Condition_Encoded'
-]]
-
-y = df['Price']
-
-# Split the data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Scale the features
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-# Train Random Forest model
-rf_model = RandomForestRegressor(
-    n_estimators=100,
-    max_depth=10,
-    min_samples_split=5,
-    min_samples_leaf=2,
-    random_state=42
-)
-
-rf_model.fit(X_train_scaled, y_train)
-
-# Make predictions
-y_pred = rf_model.predict(X_test_scaled)
-
-# Model Evaluation
-mse = mean_squared_error(y_test, y_pred)
-rmse = np.sqrt(mse)
-mae = mean_absolute_error(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
-
-print("\nModel Performance Metrics:")
-print(f"Root Mean Squared Error: ₹{rmse:.2f}")
-print(f"Mean Absolute Error: ₹{mae:.2f}")
-print(f"R² Score: {r2:.4f}")
-
-# Cross-validation
-cv_scores = cross_val_score(rf_model, X_train_scaled, y_train, cv=5)
-print("\nCross-validation scores:", cv_scores)
-print("Average CV score:", cv_scores.mean())
-
-# Feature Importance
-feature_importance = pd.DataFrame({
-    'feature': X.columns,
-    'importance': rf_model.feature_importances_
-})
-feature_importance = feature_importance.sort_values('importance', ascending=False)
-
-print("\nFeature Importance:")
-print(feature_importance)
-
-# Visualizations
-plt.figure(figsize=(12, 6))
-plt.subplot(1, 2, 1)
-sns.scatterplot(x=y_test, y=y_pred)
-plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
-plt.xlabel('Actual Price')
-plt.ylabel('Predicted Price')
-plt.title('Actual vs Predicted Prices')
-
-plt.subplot(1, 2, 2)
-sns.barplot(x='importance', y='feature', data=feature_importance)
-plt.title('Feature Importance')
-plt.tight_layout()
-plt.show()
-
-# Save the model and preprocessing objects
-model_artifacts = {
-    'model': rf_model,
-    'scaler': scaler,
-    'label_encoders': {
+]
+
+# Forest settings used by the published model
+FOREST_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2,
+    'random_state': 42
+}
+
+
+@contextmanager
+def stage(name, timings):
+    """Record how long a training stage takes"""
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+
+def load_data(data_path=DEFAULT_DATA_PATH, verbose=False):
+    df = pd.read_csv(data_path)
+    if verbose:
+        print("\nDataset Info:")
+        df.info()
+
+        print("\nBasic Statistics:")
+        print(df.describe())
+
+        print("\nMissing Values:")
+        print(df.isnull().sum())
+    return df
+
+
+def encode_features(df, unknown_fraction=0.0, random_state=42):
+    """
+    Convert categorical variables to numerical
+    unknown_fraction relabels that share of each categorical column as UNKNOWN_CATEGORY,
+    so the model learns a bucket for brands/models it has never seen.
+    Returns: (feature matrix X, target y, label encoders)
+    """
+    le_brand = LabelEncoder()
+    le_model = LabelEncoder()
+    le_condition = LabelEncoder()
+
+    df = df.copy()
+    if unknown_fraction:
+        rng = np.random.RandomState(random_state)
+        for column in ('Brand', 'Model', 'Condition'):
+            masked = rng.rand(len(df)) < unknown_fraction
+            df[column] = df[column].where(~masked, UNKNOWN_CATEGORY)
+    df['Brand_Encoded'] = le_brand.fit_transform(df['Brand'])
+    df['Model_Encoded'] = le_model.fit_transform(df['Model'])
+    df['Condition_Encoded'] = le_condition.fit_transform(df['Condition'])
+
+    label_encoders = {
         'brand': le_brand,
         'model': le_model,
         'condition': le_condition
     }
-}
+    return df[FEATURE_COLUMNS], df['Price'], label_encoders
+
+
+def plot_results(y_test, y_pred, feature_importance, output_path):
+    """Save the evaluation plots to a file without opening a window"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(12, 6))
+    plt.subplot(1, 2, 1)
+    sns.scatterplot(x=y_test, y=y_pred)
+    plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'r--', lw=2)
+    plt.xlabel('Actual Price')
+    plt.ylabel('Predicted Price')
+    plt.title('Actual vs Predicted Prices')
+
+    plt.subplot(1, 2, 2)
+    sns.barplot(x='importance', y='feature', data=feature_importance)
+    plt.title('Feature Importance')
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+    print(f"Plots saved to {output_path}")
+
+
+def train(data_path=DEFAULT_DATA_PATH, n_jobs=-1, cv_folds=5, plot_path=None, verbose=False, unknown_fraction=0.0):
+    """
+    Train the price model.
+    Returns: (model artifacts dict, metrics dict, stage timings dict)
+    """
+    timings = {}
+
+    with stage('load', timings):
+        df = load_data(data_path, verbose=verbose)
+
+    with stage('encode', timings):
+        X, y, label_encoders = encode_features(df, unknown_fraction=unknown_fraction)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+
+    with stage('fit', timings):
+        rf_model = RandomForestRegressor(n_jobs=n_jobs, **FOREST_PARAMS)
+        rf_model.fit(X_train_scaled, y_train)
+        # Predict serially so trees are always summed in the same order
+        rf_model.set_params(n_jobs=None)
+
+    with stage('evaluate', timings):
+        y_pred = rf_model.predict(X_test_scaled)
+        mse = mean_squared_error(y_test, y_pred)
+        metrics = {
+            'r2': float(r2_score(y_test, y_pred)),
+            'mae': float(mean_absolute_error(y_test, y_pred)),
+            'rmse': float(np.sqrt(mse)),
+            'rows': int(len(y_test)),
+            'evaluated_on': 'holdout'
+        }
+
+    if cv_folds:
+        with stage('cross_validate', timings):
+            # Folds run in parallel; each fold fits its forest on a single core
+            cv_scores = cross_val_score(
+                clone(rf_model).set_params(n_jobs=1), X_train_scaled, y_train, cv=cv_folds, n_jobs=n_jobs
+            )
+            metrics['cv_r2_mean'] = float(cv_scores.mean())
+            metrics['cv_r2_std'] = float(cv_scores.std())
+
+    feature_importance = pd.DataFrame({
+        'feature': X.columns,
+        'importance': rf_model.feature_importances_
+    }).sort_values('importance', ascending=False)
+    if verbose:
+        print("\nFeature Importance:")
+        print(feature_importance)
+
+    if plot_path:
+        with stage('plot', timings):
+            plot_results(y_test, y_pred, feature_importance, plot_path)
+
+    model_artifacts = {
+        'model': rf_model,
+        'scaler': scaler,
+        'label_encoders': label_encoders
+    }
+    return model_artifacts, metrics, timings
 
-joblib.dump(model_artifacts, 'bike_price_model.joblib')
 
-# Example prediction function
 def predict_bike_price(brand, model, year, engine_cc, km_driven, mileage, condition):
-    # Create a DataFrame with the input data
-    input_data = pd.DataFrame([[
-        brand, model, year, engine_cc, km_driven, mileage, condition
-    ]], columns=['Brand', 'Model', 'Year', 'Engine_CC', 'KM_Driven', 'Mileage_KMPL', 'Condition'])
-    
-    # Encode categorical variables
-    input_data['Brand_Encoded'] = le_brand.transform([brand])
-    input_data['Model_Encoded'] = le_model.transform([model])
-    input_data['Condition_Encoded'] = le_condition.transform([condition])
-    
-    # Select features in the correct order
-    X_input = input_data[[
-        'Brand_Encoded',
-        'Model_Encoded',
-        'Year',
-        'Engine_CC',
-        'KM_Driven',
-        'Mileage_KMPL',
-        'Condition_Encoded'
-    ]]
-    
-    # Scale the features
-    X_input_scaled = scaler.transform(X_input)
-    
-    # Make prediction
-    predicted_price = rf_model.predict(X_input_scaled)[0]
-    
+    """Predict a price with the published model; raises ValueError for unknown categories"""
+    from model_registry import price_registry
+
+    row = {
+        'brand': brand,
+        'model': model,
+        'year': year,
+        'engine_cc': engine_cc,
+        'km_driven': km_driven,
+        'mileage': mileage,
+        'condition': condition
+    }
+    predicted_price = price_registry.get().predict_one(row)
+    if predicted_price is None:
+        raise ValueError(f"Unknown brand, model or condition: {brand} {model} ({condition})")
     return predicted_price
 
-# Example usage
-print("\nExample Prediction:")
-sample_price = predict_bike_price(
-    brand="Honda",
-    model="CBR 150",
-    year=2020,
-    engine_cc=150,
-    km_driven=25000,
-    mileage=45,
-    condition="Good"
-)
-print(f"Predicted price for the sample bike: ₹{sample_price:.2f}")
\ No newline at end of file
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the bike price model')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    parser.add_argument('--output', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Cores for fitting and cross-validation (-1 = all)')
+    parser.add_argument('--cv-folds', type=int, default=5, help='Cross-validation folds (0 to skip)')
+    parser.add_argument('--plot', help='Save evaluation plots to this file')
+    parser.add_argument('--verbose', action='store_true', help='Print dataset analysis and feature importance')
+    parser.add_argument('--unknown-fraction', type=float, default=0.0,
+                        help='Share of rows relabelled as an unknown category per column, to learn an unseen-category bucket')
+    parser.add_argument('--no-publish', action='store_true', help='Do not publish a new model registry version')
+    parser.add_argument('--version', help='Version name to publish under')
+    args = parser.parse_args(argv)
+
+    model_artifacts, metrics, timings = train(
+        data_path=args.data,
+        n_jobs=args.n_jobs,
+        cv_folds=args.cv_folds,
+        plot_path=args.plot,
+        verbose=args.verbose,
+        unknown_fraction=args.unknown_fraction
+    )
+
+    print("\nModel Performance Metrics:")
+    print(f"Root Mean Squared Error: ₹{metrics['rmse']:.2f}")
+    print(f"Mean Absolute Error: ₹{metrics['mae']:.2f}")
+    print(f"R² Score: {metrics['r2']:.4f}")
+    if 'cv_r2_mean' in metrics:
+        print(f"Average CV score: {metrics['cv_r2_mean']:.4f} (±{metrics['cv_r2_std']:.4f})")
+
+    with stage('save', timings):
+        joblib.dump(model_artifacts, args.output)
+    print(f"\nModel saved to {args.output}")
+
+    if not args.no_publish:
+        from model_registry import ModelStore
+
+        with stage('publish', timings):
+            ModelStore().publish(model_artifacts, version=args.version, metrics=metrics,
+                                 model_path=args.output, data_path=args.data)
+
+    print("\nStage timings:")
+    for name, seconds in timings.items():
+        print(f"  {name:<15} {seconds:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Full-text and faceted search over the SQL bike catalog.
+
+An SQLite FTS5 table (bike_search) indexes each bike's brand, model,
+description and search keywords (year, condition, listing type). Triggers on
+the bike table keep it in step with every insert, update and delete, so writes
+need no extra application code. Create it on existing databases with
+migrations/add_bike_search_index.py; ensure_search_index() creates it for a
+database made by db.create_all().
+
+search() ranks matches with bm25 and supports prefix matching ("hon" finds
+Honda). It fetches only the requested page (LIMIT/OFFSET). Facet counts come
+from one GROUP BY over the matches, so Python handles one row per distinct
+brand/condition/listing_type/year combination, never one per match.
+"""
+import re
+
+from sqlalchemy import text
+
+# Relative bm25 weights of the indexed columns: brand, model, description, keywords
+COLUMN_WEIGHTS = (10.0, 8.0, 1.0, 2.0)
+
+# Year facet buckets as (label, first year, last year)
+YEAR_BUCKETS = [
+    ('before 2010', None, 2009),
+    ('2010-2014', 2010, 2014),
+    ('2015-2019', 2015, 2019),
+    ('2020 and later', 2020, None)
+]
+
+FACETS = ['brand', 'condition', 'listing_type', 'year']
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Searchable text the triggers index for a bike row (NEW or OLD)
+_KEYWORDS = "{row}.year || ' ' || {row}.condition || ' ' || {row}.listing_type"
+
+SCHEMA = [
+    # prefix='2 3' adds prefix indexes so short "hon*"-style queries stay fast
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS bike_search USING fts5(
+        brand, model, description, keywords,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS bike_search_insert AFTER INSERT ON bike BEGIN
+        INSERT INTO bike_search (rowid, brand, model, description, keywords)
+        VALUES (NEW.id, NEW.brand, NEW.model, NEW.description, {_KEYWORDS.format(row='NEW')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS bike_search_update
+        AFTER UPDATE OF brand, model, description, year, condition, listing_type ON bike BEGIN
+        DELETE FROM bike_search WHERE rowid = OLD.id;
+        INSERT INTO bike_search (rowid, brand, model, description, keywords)
+        VALUES (NEW.id, NEW.brand, NEW.model, NEW.description, {_KEYWORDS.format(row='NEW')});
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS bike_search_delete AFTER DELETE ON bike BEGIN
+        DELETE FROM bike_search WHERE rowid = OLD.id;
+    END'''
+]
+
+# Everything SCHEMA creates
+SCHEMA_OBJECTS = ('bike_search', 'bike_search_insert', 'bike_search_update', 'bike_search_delete')
+
+DROP_SCHEMA = [
+    'DROP TRIGGER IF EXISTS bike_search_insert',
+    'DROP TRIGGER IF EXISTS bike_search_update',
+    'DROP TRIGGER IF EXISTS bike_search_delete',
+    'DROP TABLE IF EXISTS bike_search'
+]
+
+REBUILD = [
+    'DELETE FROM bike_search',
+    f'''INSERT INTO bike_search (rowid, brand, model, description, keywords)
+        SELECT id, brand, model, description, {_KEYWORDS.format(row='bike')} FROM bike'''
+]
+
+
+def create_search_index(connection):
+    """Create the FTS table and its triggers, and index any existing bikes"""
+    for statement in SCHEMA + REBUILD:
+        connection.execute(text(statement))
+
+
+def search_index_exists(connection):
+    """True if the FTS table and all its triggers exist"""
+    names = {name for name, in connection.execute(text('SELECT name FROM sqlite_master'))}
+    return names.issuperset(SCHEMA_OBJECTS)
+
+
+def ensure_search_index(connection):
+    """
+    Create the search index unless it is complete (e.g. after db.create_all() or drop_all()).
+    Returns: True if it was created
+    """
+    if search_index_exists(connection):
+        return False
+    create_search_index(connection)
+    return True
+
+
+def drop_search_index(connection):
+    for statement in DROP_SCHEMA:
+        connection.execute(text(statement))
+
+
+def rebuild_search_index(connection):
+    """Re-index every bike from scratch"""
+    for statement in REBUILD:
+        connection.execute(text(statement))
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 MATCH expression.
+    Every word must match, and the last one may be a prefix of an indexed word.
+    Returns: expression string, or None when the query has no searchable words
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    # Quote each word so FTS5 operators and column names in user input are taken literally
+    terms = [f'"{word}"' for word in words[:-1]]
+    terms.append(f'"{words[-1]}"*')
+    return ' AND '.join(terms)
+
+
+def year_bucket(year):
+    """YEAR_BUCKETS label of a model year, None when the year is unknown"""
+    if year is None:
+        return None
+    for label, first, last in YEAR_BUCKETS:
+        if (first is None or year >= first) and (last is None or year <= last):
+            return label
+    return None
+
+
+def search(session, query='', brand=None, condition=None, listing_type=None, year=None,
+           available_only=True, limit=DEFAULT_LIMIT, offset=0):
+    """
+    Search the catalog.
+    year filters on a YEAR_BUCKETS label.
+    Returns: dict with total, the ranked bike ids for the requested page and facet counts
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    offset = max(0, offset)
+    params = {}
+    conditions = []
+    if available_only:
+        conditions.append('bike.is_available = 1')
+    for column, value in (('brand', brand), ('condition', condition), ('listing_type', listing_type)):
+        if value:
+            conditions.append(f'bike.{column} = :{column} COLLATE NOCASE')
+            params[column] = value
+    if year:
+        bucket = next((bucket for bucket in YEAR_BUCKETS if bucket[0] == year), None)
+        if bucket is None:
+            raise ValueError(f"Unknown year bucket: {year}")
+        _, first, last = bucket
+        if first is not None:
+            conditions.append('bike.year >= :year_first')
+            params['year_first'] = first
+        if last is not None:
+            conditions.append('bike.year <= :year_last')
+            params['year_last'] = last
+
+    expression = match_expression(query or '')
+    if expression:
+        source = 'bike_search JOIN bike ON bike.id = bike_search.rowid WHERE bike_search MATCH :match'
+        params['match'] = expression
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        order = f'bm25(bike_search, {weights}), bike.created_at DESC'
+    else:
+        source = 'bike WHERE 1 = 1'
+        order = 'bike.created_at DESC'
+    for condition_sql in conditions:
+        source += f' AND {condition_sql}'
+
+    page = session.execute(
+        text(f'SELECT bike.id FROM {source} ORDER BY {order} LIMIT :limit OFFSET :offset'),
+        dict(params, limit=limit, offset=offset)
+    )
+    ids = [bike_id for bike_id, in page]
+
+    # Every facet and the total from one grouped pass; years are bucketed from the few distinct values
+    groups = session.execute(text(
+        f'SELECT bike.brand, bike.condition, bike.listing_type, bike.year, COUNT(*) FROM {source} '
+        f'GROUP BY bike.brand, bike.condition, bike.listing_type, bike.year'
+    ), params)
+    facets = {facet: {} for facet in FACETS}
+    total = 0
+    for bike_brand, bike_condition, bike_listing_type, bike_year, count in groups:
+        total += count
+        for facet, value in (('brand', bike_brand), ('condition', bike_condition),
+                             ('listing_type', bike_listing_type), ('year', year_bucket(bike_year))):
+            facets[facet][value] = facets[facet].get(value, 0) + count
+
+    return {
+        'total': total,
+        'ids': ids,
+        'facets': {
+            facet: sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+            for facet, counts in facets.items()
+        }
+    }
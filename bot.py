@@ -3,6 +3,7 @@ from pymongo import MongoClient
 from bson import ObjectId
 import os
 from bike_price_model import predict_bike_price  # Import the prediction function
+from pagination import PaginationError, decode_cursor, find_page, page_size, projection_for, requested_fields
 
 app = Flask(__name__)
 
@@ -12,6 +13,22 @@ client = MongoClient(MONGO_URI)
 db = client['bike_rental']
 bikes_collection = db['bikes']
 
+# Response fields of /api/bikes/search and the Mongo fields each one is built from
+SEARCH_RESULT_FIELDS = {
+    'id': ['_id'],
+    'brand': ['brand'],
+    'model': ['model'],
+    'year': ['year'],
+    'condition': ['condition'],
+    'engine_cc': ['engine_cc'],
+    'km_driven': ['km_driven'],
+    'listing_type': ['listing_type'],
+    'sale_price': ['sale_price'],
+    'price_per_day': ['price_per_day'],
+    'created_at': ['created_at'],
+    'metadata': ['metadata']
+}
+
 @app.route('/api/bikes/search', methods=['GET'])
 def search_bikes():
     try:
@@ -62,34 +79,48 @@ def search_bikes():
         if km_driven_max is not None:
             query['km_driven'] = {'$lte': km_driven_max}
 
-        # Execute search
-        bikes = bikes_collection.find(query)
+        # Execute search one page at a time, newest first
+        limit = page_size(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        fields = requested_fields(request.args.get('fields'), SEARCH_RESULT_FIELDS)
+        bikes, next_cursor = find_page(
+            bikes_collection, query, limit,
+            cursor=decode_cursor(cursor) if cursor else None,
+            projection=projection_for(fields, SEARCH_RESULT_FIELDS)
+        )
 
         # Format results
         results = []
         for bike in bikes:
-            bike['_id'] = str(bike['_id'])  # Convert ObjectId to string
-            results.append({
-                'id': bike['_id'],
-                'brand': bike['brand'],
-                'model': bike['model'],
-                'year': bike['year'],
-                'condition': bike['condition'],
+            result = {
+                'id': str(bike['_id']) if '_id' in bike else None,  # Convert ObjectId to string
+                'brand': bike.get('brand'),
+                'model': bike.get('model'),
+                'year': bike.get('year'),
+                'condition': bike.get('condition'),
                 'engine_cc': bike.get('engine_cc'),
                 'km_driven': bike.get('km_driven'),
-                'listing_type': bike['listing_type'],
+                'listing_type': bike.get('listing_type'),
                 'sale_price': bike.get('sale_price'),
                 'price_per_day': bike.get('price_per_day'),
                 'created_at': bike['created_at'].isoformat() if 'created_at' in bike else None,
                 'metadata': bike.get('metadata', {})
-            })
+            }
+            results.append({field: result[field] for field in fields})
 
         return jsonify({
             'status': 'success',
             'count': len(results),
+            'limit': limit,
+            'next_cursor': next_cursor,
             'bikes': results
         }), 200
 
+    except PaginationError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -0,0 +1,90 @@
+"""
+Check that the hot route queries are served by an index.
+
+Builds the same queries the routes run, asks SQLite for EXPLAIN QUERY PLAN and
+fails if any table is read with a full scan. tests/test_query_plans.py runs
+the same checks against a fresh database; run this script to check an
+existing one after schema changes:
+
+    python check_query_plans.py
+
+Exits with status 1 when a plan contains a full table scan.
+"""
+import sys
+from datetime import datetime
+
+from app import app, db, Bike, Purchase, Rental, RentalRequest
+
+# Arbitrary ids: the plan depends on the predicates, not the values
+SAMPLE_ID = 1
+
+
+def hot_queries():
+    """(name, query) pairs mirroring the filters used by the routes"""
+    now = datetime.utcnow()
+    return [
+        ('index: available bikes, newest first',
+         Bike.query.filter_by(is_available=True).order_by(Bike.created_at.desc())),
+        ('my_bikes / my_rentals: bikes by owner',
+         Bike.query.filter_by(owner_id=SAMPLE_ID)),
+        ('view_bike: active rentals',
+         Rental.query.filter(Rental.bike_id == SAMPLE_ID, Rental.status == 'active',
+                             Rental.end_date > now).order_by(Rental.start_date)),
+        ('view_bike: pending rental requests',
+         RentalRequest.query.filter(RentalRequest.bike_id == SAMPLE_ID,
+                                    RentalRequest.status == 'pending').order_by(RentalRequest.created_at)),
+        ('view_bike: pending purchases',
+         Purchase.query.filter(Purchase.bike_id == SAMPLE_ID,
+                               Purchase.status == 'pending').order_by(Purchase.created_at)),
+        ('handle_purchase_request: other pending offers',
+         Purchase.query.filter(Purchase.bike_id == SAMPLE_ID, Purchase.id != SAMPLE_ID,
+                               Purchase.status == 'pending')),
+        ('my_purchase_requests: pending offers on my bikes',
+         Purchase.query.join(Bike).filter(Bike.owner_id == SAMPLE_ID, Purchase.status == 'pending')),
+        ('navbar: pending rental requests on my bikes',
+         RentalRequest.query.join(Bike).filter(Bike.owner_id == SAMPLE_ID, RentalRequest.status == 'pending')),
+        ('rental_requests: sent by me',
+         RentalRequest.query.filter_by(renter_id=SAMPLE_ID).order_by(RentalRequest.created_at.desc())),
+    ]
+
+
+def query_plan(query):
+    """EXPLAIN QUERY PLAN rows (the detail column) for an ORM query"""
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    with db.engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}')]
+
+
+def full_scans(plan):
+    """Plan steps that read a whole table rather than searching an index"""
+    return [step for step in plan if step.startswith('SCAN') and 'USING' not in step]
+
+
+def check_query_plans(verbose=True):
+    """
+    Explain every hot query.
+    Returns: list of (name, plan) for queries that do a full table scan
+    """
+    failures = []
+    for name, query in hot_queries():
+        plan = query_plan(query)
+        scans = full_scans(plan)
+        if scans:
+            failures.append((name, plan))
+        if verbose:
+            print(f"{'FULL SCAN' if scans else 'ok':<10} {name}")
+            for step in plan:
+                print(f"{'':<10}   {step}")
+    return failures
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        if db.engine.url.get_backend_name() != 'sqlite':
+            print("EXPLAIN QUERY PLAN checks only support SQLite")
+            sys.exit(2)
+        failures = check_query_plans()
+    if failures:
+        print(f"\n{len(failures)} hot queries do a full table scan; run migrations/add_hot_query_indexes.py")
+        sys.exit(1)
+    print("\nAll hot queries use an index")
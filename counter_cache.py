@@ -0,0 +1,61 @@
+"""
+Per-key cache for counts that are expensive to compute on every request.
+
+The owner of the data calls invalidate() for the affected keys when the
+underlying rows change; the next get() recomputes once and serves from memory
+afterwards. The TTL is a fallback for changes made by other worker processes
+or by bulk statements that bypass invalidation.
+"""
+import threading
+import time
+
+
+class CounterCache:
+    """Thread-safe key -> count cache with explicit invalidation and a TTL fallback"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._counts = {}
+        # Bumped by every invalidation, so a count computed before it is not stored after it
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, compute):
+        """Cached count for key, calling compute() on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None and entry[1] >= now:
+                self.counters['hits'] += 1
+                return entry[0]
+            self.counters['misses'] += 1
+            generation = self._generation
+        count = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._counts[key] = (count, now + self.ttl)
+        return count
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._counts.pop(key, None) is not None:
+                    self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.counters['invalidations'] += len(self._counts)
+            self._counts.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                entries=len(self._counts),
+                ttl=self.ttl,
+                hit_rate=self.counters['hits'] / lookups if lookups else None,
+            )
@@ -0,0 +1,368 @@
+"""
+Durable outbound email queue.
+
+Request handlers enqueue() messages into an SQLite table and return at once.
+A pool of worker threads claims due messages in batches and hands each batch
+to a deliver callable, which sends the whole batch over one SMTP connection.
+Failed messages are retried with exponential backoff and marked 'failed' after
+max_attempts. Several processes can share one outbox file: claiming a batch
+is a single IMMEDIATE transaction, and a claim that is never finished (a
+crashed worker) expires after claim_timeout seconds.
+
+For local testing, run a stand-in SMTP server that accepts everything and
+writes each message to a directory:
+
+    python email_outbox.py sink [--port 1025] [--maildir sent_mail]
+
+and start the app with MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false.
+"""
+import argparse
+import json
+import os
+import random
+import socketserver
+import sqlite3
+import threading
+import time
+
+
+class EmailOutbox:
+    """SQLite-backed email queue with a worker pool"""
+
+    def __init__(self, path, deliver, workers=2, batch_size=20, max_attempts=5,
+                 backoff_base=30, backoff_max=3600, poll_interval=5, claim_timeout=300):
+        self.path = os.path.abspath(path)
+        self.deliver = deliver
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0, 'last_batch_seconds': None}
+        self._connection()
+
+    # SQLite connections cannot be shared between threads, so each thread opens its own
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipients TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT,
+                    html TEXT,
+                    sender TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    claimed_at REAL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    sent_at REAL
+                )
+            ''')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_email_outbox_due ON email_outbox (status, next_attempt_at)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, recipients, subject, body=None, html=None, sender=None):
+        """
+        Queue a message for delivery.
+        Returns: outbox id of the message
+        """
+        return self.enqueue_many([{
+            'recipients': recipients, 'subject': subject, 'body': body, 'html': html, 'sender': sender
+        }])[0]
+
+    def enqueue_many(self, messages):
+        """
+        Queue several messages in one transaction.
+        messages: dicts with recipients, subject and optionally body, html, sender
+        Returns: list of outbox ids
+        """
+        now = time.time()
+        connection = self._connection()
+        ids = []
+        connection.execute('BEGIN')
+        try:
+            for message in messages:
+                recipients = message['recipients']
+                if isinstance(recipients, str):
+                    recipients = [recipients]
+                cursor = connection.execute(
+                    'INSERT INTO email_outbox (recipients, subject, body, html, sender, next_attempt_at, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (json.dumps(list(recipients)), message['subject'], message.get('body'), message.get('html'),
+                     message.get('sender'), now, now)
+                )
+                ids.append(cursor.lastrowid)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self.start()
+        self._wakeup.set()
+        return ids
+
+    def claim(self, limit=None):
+        """Atomically take up to limit due messages for delivery"""
+        limit = limit or self.batch_size
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = connection.execute(
+                '''UPDATE email_outbox SET status = 'sending', claimed_at = ?, attempts = attempts + 1
+                   WHERE id IN (
+                       SELECT id FROM email_outbox
+                       WHERE (status = 'pending' AND next_attempt_at <= ?)
+                          OR (status = 'sending' AND claimed_at < ?)
+                       ORDER BY id LIMIT ?
+                   )
+                   RETURNING id, recipients, subject, body, html, sender, attempts''',
+                (now, now, now - self.claim_timeout, limit)
+            ).fetchall()
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return [
+            {
+                'id': row[0],
+                'recipients': json.loads(row[1]),
+                'subject': row[2],
+                'body': row[3],
+                'html': row[4],
+                'sender': row[5],
+                'attempts': row[6],
+            }
+            for row in sorted(rows)
+        ]
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        # Jitter spreads out retries of messages that failed together
+        return delay * random.uniform(0.8, 1.2)
+
+    def _record(self, messages, errors):
+        """Mark delivered messages sent and schedule retries for the rest"""
+        now = time.time()
+        sent, retried, failed = [], [], []
+        for message in messages:
+            error = errors.get(message['id'])
+            if error is None:
+                sent.append((now, message['id']))
+            elif message['attempts'] >= self.max_attempts:
+                failed.append((str(error), message['id']))
+            else:
+                retried.append((now + self._backoff(message['attempts']), str(error), message['id']))
+        connection = self._connection()
+        connection.execute('BEGIN')
+        connection.executemany(
+            "UPDATE email_outbox SET status = 'sent', sent_at = ?, claimed_at = NULL, last_error = NULL WHERE id = ?",
+            sent
+        )
+        connection.executemany(
+            "UPDATE email_outbox SET status = 'pending', next_attempt_at = ?, last_error = ?, claimed_at = NULL "
+            "WHERE id = ?",
+            retried
+        )
+        connection.executemany(
+            "UPDATE email_outbox SET status = 'failed', last_error = ?, claimed_at = NULL WHERE id = ?",
+            failed
+        )
+        connection.execute('COMMIT')
+        with self._stats_lock:
+            self.stats['sent'] += len(sent)
+            self.stats['retried'] += len(retried)
+            self.stats['failed'] += len(failed)
+        for error, message_id in failed:
+            print(f"Giving up on email {message_id} after {self.max_attempts} attempts: {error}")
+
+    def process_batch(self):
+        """
+        Claim and deliver one batch.
+        Returns: number of messages claimed
+        """
+        messages = self.claim()
+        if not messages:
+            return 0
+        start = time.perf_counter()
+        try:
+            errors = self.deliver(messages) or {}
+        except Exception as e:
+            # The connection itself failed: every message in the batch is retried
+            errors = {message['id']: e for message in messages}
+        self._record(messages, errors)
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            self.stats['last_batch_seconds'] = time.perf_counter() - start
+        return len(messages)
+
+    def drain(self):
+        """Deliver everything that is due, in the calling thread"""
+        total = 0
+        while True:
+            claimed = self.process_batch()
+            if not claimed:
+                return total
+            total += claimed
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                if self.process_batch():
+                    continue
+            except Exception as e:
+                print(f"Email worker error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the worker threads (once per process)"""
+        if self._threads or not self.workers:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'email-outbox-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def metrics(self):
+        now = time.time()
+        connection = self._connection()
+        depth = dict(connection.execute('SELECT status, COUNT(*) FROM email_outbox GROUP BY status').fetchall())
+        oldest = connection.execute(
+            "SELECT MIN(created_at) FROM email_outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()[0]
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict(
+            stats,
+            queue_depth=depth.get('pending', 0) + depth.get('sending', 0),
+            by_status=depth,
+            oldest_pending_seconds=now - oldest if oldest else None,
+            workers=len(self._threads),
+            path=self.path,
+        )
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP (EHLO, AUTH, MAIL, RCPT, DATA) to accept messages from smtplib"""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        self.reply('220 localhost email_outbox sink')
+        envelope = {'from': None, 'to': []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250-AUTH PLAIN LOGIN')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'AUTH':
+                if command.upper().startswith('AUTH LOGIN'):
+                    # Username and password prompts; any credentials are accepted
+                    for prompt in ('VXNlcm5hbWU6', 'UGFzc3dvcmQ6'):
+                        self.reply(f'334 {prompt}')
+                        self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif verb == 'MAIL':
+                envelope = {'from': command[10:].strip(), 'to': []}
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                envelope['to'].append(command[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                self.server.store(envelope, b''.join(data))
+                self.reply('250 OK: queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP stand-in that accepts every message and saves it as a .eml file"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='localhost', port=1025, maildir='sent_mail'):
+        super().__init__((host, port), _SinkHandler)
+        self.maildir = maildir
+        self.received = 0
+        self._lock = threading.Lock()
+        os.makedirs(maildir, exist_ok=True)
+
+    def store(self, envelope, data):
+        with self._lock:
+            self.received += 1
+            name = f'{time.time_ns()}-{self.received}.eml'
+        with open(os.path.join(self.maildir, name), 'wb') as f:
+            f.write(data)
+        print(f"Received mail from {envelope['from']} to {', '.join(envelope['to'])} -> {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Email outbox tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sink = subparsers.add_parser('sink', help='Run a local SMTP stand-in that saves messages to a directory')
+    sink.add_argument('--host', default='localhost')
+    sink.add_argument('--port', type=int, default=1025)
+    sink.add_argument('--maildir', default='sent_mail')
+    args = parser.parse_args(argv)
+
+    if args.command == 'sink':
+        server = SMTPSink(args.host, args.port, args.maildir)
+        print(f"SMTP sink listening on {args.host}:{args.port}, saving to {args.maildir}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Rendering layer for notification emails.
+
+Every template under templates/email/ is loaded and compiled once by
+preload(). Emails are rendered straight from the compiled template with only
+the context they are given, skipping render_template's per-call context
+processors (which would run the navbar count query for every email).
+render_many() renders one template for a whole fan-out batch, such as every
+losing bidder on a sold bike, merging the shared context once.
+Render time is tracked per template.
+"""
+import threading
+import time
+
+EMAIL_TEMPLATE_PREFIX = 'email/'
+
+
+class EmailRenderer:
+    """Compiled email templates with per-template render timings"""
+
+    def __init__(self, app, prefix=EMAIL_TEMPLATE_PREFIX):
+        self.app = app
+        self.prefix = prefix
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    def preload(self):
+        """
+        Compile every email template up front.
+        Returns: list of template names
+        """
+        env = self.app.jinja_env
+        names = env.list_templates(filter_func=lambda name: name.startswith(self.prefix))
+        for name in names:
+            self._templates[name] = env.get_template(name)
+        return names
+
+    def template(self, name):
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = self.app.jinja_env.get_template(name)
+        return template
+
+    def _record(self, name, renders, seconds):
+        with self._lock:
+            timing = self.timings.setdefault(name, {'renders': 0, 'seconds': 0.0})
+            timing['renders'] += renders
+            timing['seconds'] += seconds
+
+    def render(self, name, **context):
+        """Render one email"""
+        return self.render_many(name, [context])[0]
+
+    def render_many(self, name, contexts, **shared):
+        """
+        Render the same template once per recipient context.
+        shared holds the values common to every recipient (the bike, the seller, ...).
+        Returns: list of rendered bodies, in the order of contexts
+        """
+        template = self.template(name)
+        start = time.perf_counter()
+        bodies = [template.render(dict(shared, **context)) for context in contexts]
+        self._record(name, len(bodies), time.perf_counter() - start)
+        return bodies
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'templates': sorted(self._templates),
+                'timings': {
+                    name: dict(timing, mean_ms=timing['seconds'] * 1000 / timing['renders'] if timing['renders'] else None)
+                    for name, timing in self.timings.items()
+                },
+            }
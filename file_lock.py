@@ -0,0 +1,89 @@
+"""
+Advisory file locks shared by the app's worker processes.
+
+Every gunicorn worker runs the same start-up code. Work that must happen
+once per host, such as publishing the first price model version, takes a
+FileLock first. The operating system drops the lock when the holding
+process exits, so a crashed worker never leaves a stale lock behind.
+
+A forked child (e.g. an image_jobs worker) inherits the descriptors of
+held locks, which would keep them locked after the parent releases them.
+The child closes its copies right after the fork. The parent's lock is
+unaffected.
+"""
+import os
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Locks held in this process, dropped from forked children
+_held = weakref.WeakSet()
+
+
+def _forget_in_child():
+    for lock in list(_held):
+        fd, lock._fd = lock._fd, None
+        if fd is not None:
+            os.close(fd)
+    _held.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_in_child)
+
+
+class FileLock:
+    """Exclusive lock on a file, held until release() or until the process exits"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self, blocking=True):
+        """
+        Take the lock, waiting for other processes unless blocking is False.
+        Returns: True if this object now holds the lock
+        """
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            if blocking:
+                raise
+            return False
+        self._fd = fd
+        _held.add(self)
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        _held.discard(self)
+        if fcntl is None:
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        # Closing the descriptor releases a flock
+        os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,78 @@
+"""
+Cache for rendered HTML fragments.
+
+Entries belong to a generation; invalidate() starts a new one, which makes
+every cached fragment stale at once. With a stamp_path, the generation also
+follows the modification time of that file, so invalidate() in one worker
+process is seen by all workers on the host without a database round trip.
+The TTL bounds staleness if a change bypasses invalidate().
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """Bounded LRU of rendered fragments with whole-cache invalidation"""
+
+    def __init__(self, max_entries=256, ttl=300, stamp_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stamp_path = os.path.abspath(stamp_path) if stamp_path else None
+        self._entries = OrderedDict()
+        self._local_generation = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _generation(self):
+        if not self.stamp_path:
+            return self._local_generation
+        try:
+            stamp = os.stat(self.stamp_path).st_mtime_ns
+        except FileNotFoundError:
+            stamp = 0
+        return self._local_generation, stamp
+
+    def get(self, key):
+        """Cached fragment for key, or None if missing, expired or invalidated"""
+        generation = self._generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation or entry[1] < time.time():
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[2]
+
+    def set(self, key, fragment):
+        generation = self._generation()
+        with self._lock:
+            self._entries[key] = (generation, time.time() + self.ttl, fragment)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached fragment, in this process and (with a stamp file) in all others"""
+        with self._lock:
+            self._local_generation += 1
+            self._entries.clear()
+            self.counters['invalidations'] += 1
+        if self.stamp_path:
+            # Write rather than utime so the mtime changes even if the file was just created
+            with open(self.stamp_path, 'w') as f:
+                f.write(str(time.time_ns()))
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                ttl=self.ttl,
+                stamp_path=self.stamp_path,
+                hit_rate=self.counters['hits'] / lookups if lookups else None,
+            )
@@ -0,0 +1,278 @@
+"""
+Background rendering of uploaded bike photos.
+
+An upload is written once, into the staging directory (bike_images/pending/),
+and the Bike row points at that pending URL. The staged file is named after
+the content-addressed URL it will get (see image_store.py). The request does not wait for
+Pillow. Templates show a placeholder for pending URLs (templates/_images.html).
+
+ImageJobQueue renders the staged files in a pool of worker processes, so
+several uploads are resized in parallel across cores. A worker writes the
+renditions under the image's final name and then moves the staged original
+into the store with os.replace. The parent process then swaps the URL on
+the Bike row with a single conditional UPDATE
+(... SET image_url_N = final WHERE image_url_N = pending). If the owner
+replaced the photo in the meantime, the update matches nothing and the
+result is handed to on_discard (the file may be shared with other bikes, so
+the queue never deletes it itself).
+
+Pending URLs in the database are the queue's durable state: recover()
+resubmits them after a restart, including uploads whose original was
+already published when the process died, and removes staged files that no
+bike references. Files staged before content addressing
+(<timestamp>_<filename>) have no digest in their name, so recover() leaves
+them to migrations/dedupe_bike_images.py. Only one worker process
+recovers. It keeps the recovery lock for as long as it lives, and a worker
+started after it dies takes over.
+That recovery can still resubmit an upload another live worker is
+rendering. Whichever job publishes the original first wins. The other one
+finds the staged file gone and the original stored, and swaps in the same
+URL instead of failing.
+"""
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from flask import has_app_context
+
+from file_lock import FileLock
+from image_pipeline import process_image
+from image_store import content_url
+
+PENDING_DIR = 'bike_images/pending'
+# Staged files older than this that no bike references are left over from failed requests
+STALE_STAGED_SECONDS = 3600
+# <sha256>_<token>.<extension>, as written by pending_url()
+PENDING_NAME = re.compile(r'[0-9a-f]{64}_[0-9a-f]+\.[a-z0-9]+')
+
+
+def is_pending(image_url):
+    return bool(image_url) and image_url.replace('\\', '/').startswith(PENDING_DIR + '/')
+
+
+def has_pending_name(image_url):
+    """True for pending URLs that final_url() can map to the store"""
+    return is_pending(image_url) and PENDING_NAME.fullmatch(os.path.basename(image_url)) is not None
+
+
+def pending_url(image_url, token):
+    """Staging URL for an upload that will be stored as image_url; token keeps concurrent uploads apart"""
+    digest, extension = os.path.basename(image_url).split('.', 1)
+    return f'{PENDING_DIR}/{digest}_{token}.{extension}'
+
+
+def final_url(pending_url):
+    """bike_images/pending/<sha256>_<token>.jpg -> bike_images/<shard>/<shard>/<sha256>.jpg"""
+    name, extension = os.path.basename(pending_url).split('.', 1)
+    return content_url(name.split('_', 1)[0], extension)
+
+
+def _render_job(static_folder, pending_url):
+    # Runs in a worker process: render under the final name, then publish the original
+    start = time.perf_counter()
+    staged_path = os.path.join(static_folder, pending_url)
+    target_url = final_url(pending_url)
+    target_path = os.path.join(static_folder, target_url)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    try:
+        process_image(staged_path, static_folder, image_url=target_url)
+        # Identical content may already be stored by another job; replacing it is harmless
+        os.replace(staged_path, target_path)
+    except FileNotFoundError:
+        # Another job for the same upload (resubmitted by recover() elsewhere) published it first
+        if not os.path.exists(target_path):
+            raise
+    return time.perf_counter() - start
+
+
+def _worker_context():
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    # Loaded once in the server, so each worker starts with Pillow already imported
+    context.set_forkserver_preload(['image_jobs'])
+    return context
+
+
+class ImageJobQueue:
+    """Renders staged uploads in worker processes and swaps the final URLs onto Bike rows"""
+
+    def __init__(self, app, db, bike_model, static_folder, workers=None, on_swap=None, on_discard=None,
+                 history=100, lock_path=None):
+        self.app = app
+        self.db = db
+        self.Bike = bike_model
+        self.static_folder = static_folder
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        # Called with (session, bike_id, image_url) inside the swap transaction
+        self.on_swap = on_swap
+        # Called with the image_url of a rendered upload no bike row took
+        self.on_discard = on_discard
+        # Held by the one process that recovers (None: every process recovers)
+        self.lock_path = lock_path
+        self._recovery_lock = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.recent = deque(maxlen=history)
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'discarded': 0, 'render_seconds': 0.0}
+        os.makedirs(os.path.join(static_folder, PENDING_DIR), exist_ok=True)
+
+    @property
+    def staging_folder(self):
+        return os.path.join(self.static_folder, PENDING_DIR)
+
+    def start(self):
+        """Start the worker pool (once per process)"""
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                # By now Mongo's monitor threads (and often the outbox and sync threads) are running, and a
+                # plain fork can copy a lock one of them holds. Workers are forked from a clean,
+                # single-threaded forkserver instead (spawn where there is none).
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=_worker_context())
+
+    def stop(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+    def submit(self, bike_id, slot, pending_url):
+        """Queue the rendering of one staged upload; call after the row pointing at it is committed"""
+        key = (bike_id, slot, pending_url)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending[key] = time.perf_counter()
+            self.stats['submitted'] += 1
+        self.start()
+        if self._executor is None:
+            # IMAGE_WORKERS=0: render in the calling thread
+            try:
+                result = _render_job(self.static_folder, pending_url)
+            except Exception as e:
+                self._finish(key, error=e)
+            else:
+                self._finish(key, render_seconds=result)
+            return
+        future = self._executor.submit(_render_job, self.static_folder, pending_url)
+        future.add_done_callback(lambda done: self._finished(key, done))
+
+    def _finished(self, key, future):
+        error = future.exception()
+        self._finish(key, render_seconds=None if error else future.result(), error=error)
+
+    def _finish(self, key, render_seconds=None, error=None):
+        bike_id, slot, pending_url = key
+        swapped = False
+        try:
+            # Inline jobs (no worker pool) run inside the request and share its session
+            with nullcontext() if has_app_context() else self.app.app_context():
+                target = None if error else final_url(pending_url)
+                if error:
+                    print(f"Image job for bike {bike_id} failed: {str(error)}")
+                    self._remove(pending_url)
+                swapped = self._swap(bike_id, slot, pending_url, target)
+                if not swapped and not error and self.on_discard:
+                    # The photo was replaced or the bike deleted while rendering
+                    self.on_discard(target)
+        except Exception as e:
+            print(f"Error finishing image job for bike {bike_id}: {str(e)}")
+            error = error or e
+        with self._lock:
+            queued_at = self._pending.pop(key, None)
+            total = time.perf_counter() - queued_at if queued_at is not None else None
+            if error:
+                self.stats['failed'] += 1
+            elif swapped:
+                self.stats['completed'] += 1
+            else:
+                self.stats['discarded'] += 1
+            if render_seconds:
+                self.stats['render_seconds'] += render_seconds
+            self.recent.append({
+                'bike_id': bike_id,
+                'slot': slot,
+                'status': 'failed' if error else 'completed' if swapped else 'discarded',
+                'render_seconds': render_seconds,
+                'queue_seconds': total - render_seconds if total is not None and render_seconds else None,
+                'total_seconds': total,
+                'finished_at': datetime.utcnow().isoformat(),
+            })
+
+    def _swap(self, bike_id, slot, pending_url, target):
+        # Compare-and-swap: only replace the URL this job was started for
+        session = self.db.session
+        column = getattr(self.Bike, f'image_url_{slot}')
+        swapped = self.Bike.query.filter(self.Bike.id == bike_id, column == pending_url).update(
+            {column: target}, synchronize_session=False
+        )
+        if swapped and self.on_swap:
+            self.on_swap(session, bike_id, target)
+        session.commit()
+        return bool(swapped)
+
+    def _remove(self, image_url):
+        try:
+            os.remove(os.path.join(self.static_folder, image_url))
+        except FileNotFoundError:
+            pass
+
+    def recover(self):
+        """
+        Resubmit uploads still pending from a previous run and delete stale staged files no bike references.
+        Does nothing while another live process holds the recovery lock.
+        Returns: number of jobs resubmitted
+        """
+        if self.lock_path and self._recovery_lock is None:
+            lock = FileLock(self.lock_path)
+            if not lock.acquire(blocking=False):
+                return 0
+            # Never released: while this process lives, later workers leave recovery to it
+            self._recovery_lock = lock
+        with self.app.app_context():
+            columns = [getattr(self.Bike, f'image_url_{slot}') for slot in range(1, 4)]
+            rows = self.db.session.query(self.Bike.id, *columns).filter(
+                self.db.or_(*[column.like(PENDING_DIR + '/%') for column in columns])
+            ).all()
+        referenced = set()
+        resubmitted = 0
+        for bike_id, *urls in rows:
+            for slot, url in enumerate(urls, start=1):
+                if is_pending(url):
+                    referenced.add(os.path.basename(url))
+                    if not has_pending_name(url):
+                        print(f"Not resubmitting {url} of bike {bike_id}: staged before content addressing, "
+                              f"run migrations/dedupe_bike_images.py")
+                    elif os.path.exists(os.path.join(self.static_folder, url)) \
+                            or os.path.exists(os.path.join(self.static_folder, final_url(url))):
+                        # The second case is a job that published the original but died before the swap;
+                        # resubmitted, it finds the staged file gone and swaps in the stored one
+                        self.submit(bike_id, slot, url)
+                        resubmitted += 1
+        now = time.time()
+        for entry in os.scandir(self.staging_folder):
+            if entry.name not in referenced and now - entry.stat().st_mtime > STALE_STAGED_SECONDS:
+                os.remove(entry.path)
+        return resubmitted
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            finished = stats['completed'] + stats['discarded']
+            oldest = min(self._pending.values(), default=None)
+            return dict(
+                stats,
+                queue_depth=len(self._pending),
+                oldest_pending_seconds=time.perf_counter() - oldest if oldest is not None else None,
+                mean_render_seconds=stats['render_seconds'] / finished if finished else None,
+                workers=self.workers,
+                running=self._executor is not None,
+                recent_jobs=list(self.recent),
+            )
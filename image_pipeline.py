@@ -0,0 +1,130 @@
+"""
+Responsive renditions of uploaded bike photos.
+
+Originals are kept as uploaded. Next to each original, process_image() writes
+a small and a medium rendition, each in WebP and JPEG:
+
+    bike_images/20250321_205431_one.jpeg
+    bike_images/20250321_205431_one.thumb.webp   (400px wide)
+    bike_images/20250321_205431_one.thumb.jpg
+    bike_images/20250321_205431_one.medium.webp  (1024px wide)
+    bike_images/20250321_205431_one.medium.jpg
+
+The image is decoded once. JPEG decoding is reduced with draft() to the
+smallest scale that still covers the medium width. The thumbnail is then
+resized from the medium rendition rather than from the original.
+
+Templates build <picture> srcsets from rendition_url() (see
+templates/_images.html). An image without renditions, for example one
+uploaded before this pipeline existed, falls back to the original.
+"""
+import os
+import threading
+import uuid
+
+from PIL import Image, ImageOps
+
+# name -> maximum width in pixels; renditions never upscale
+RENDITIONS = {'thumb': 400, 'medium': 1024}
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_url(image_url, name, extension):
+    """URL of a rendition, relative to static/ like image_url itself"""
+    stem = os.path.splitext(image_url.replace('\\', '/'))[0]
+    return f'{stem}.{name}.{extension}'
+
+
+def _resized(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def _flattened(image):
+    # JPEG has no alpha channel: composite transparent images onto white
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def verify_image(path):
+    """Raise if the file at path is not an image Pillow can read (only the header is read)"""
+    with Image.open(path) as image:
+        return image.format
+
+
+def process_image(path, static_folder, image_url=None):
+    """
+    Write every rendition of the image at path.
+    image_url names the renditions (default: path relative to static_folder),
+    so a staged upload can be rendered under its final URL.
+    Returns: dict of rendition name -> {'width', 'height', 'urls': {extension: url}}
+    """
+    with Image.open(path) as source:
+        # Reduce JPEG decoding to the smallest scale that is still wide enough for the largest rendition
+        largest = max(RENDITIONS.values())
+        if source.width > largest:
+            source.draft('RGB', (largest, round(source.height * largest / source.width)))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    if image_url is None:
+        image_url = os.path.relpath(path, static_folder).replace(os.sep, '/')
+    renditions = {}
+    # Largest first, so each smaller rendition is resized from the previous one
+    for name, width in sorted(RENDITIONS.items(), key=lambda item: -item[1]):
+        image = _resized(image, width)
+        urls = {}
+        for extension, (image_format, options) in RENDITION_FORMATS.items():
+            url = rendition_url(image_url, name, extension)
+            encoded = image if image_format == 'WEBP' else _flattened(image)
+            target = os.path.join(static_folder, url)
+            # Renamed into place, so a concurrent render of the same photo never exposes a partial file
+            temporary = f'{target}.{uuid.uuid4().hex}.tmp'
+            encoded.save(temporary, image_format, **options)
+            os.replace(temporary, target)
+            urls[extension] = url
+        renditions[name] = {'width': image.width, 'height': image.height, 'urls': urls}
+    return renditions
+
+
+class RenditionIndex:
+    """Remembers which originals have renditions on disk, so templates do not stat files on every render"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def has_renditions(self, image_url):
+        if not image_url:
+            return False
+        if image_url in self._known:
+            return True
+        # Only positive answers are remembered: renditions may appear later (backfill or a background job)
+        exists = all(
+            os.path.exists(os.path.join(self.static_folder, rendition_url(image_url, name, extension)))
+            for name in RENDITIONS for extension in RENDITION_FORMATS
+        )
+        if exists:
+            with self._lock:
+                self._known.add(image_url)
+        return exists
+
+    def forget(self, image_url):
+        with self._lock:
+            self._known.discard(image_url)
+
+    def srcset(self, image_url, extension):
+        """srcset attribute value for one format, e.g. 'a.thumb.webp 400w, a.medium.webp 1024w'"""
+        return ', '.join(
+            f"/static/{rendition_url(image_url, name, extension)} {width}w"
+            for name, width in sorted(RENDITIONS.items(), key=lambda item: item[1])
+        )
@@ -0,0 +1,96 @@
+"""
+Content-addressed storage for bike photos.
+
+An image is stored once, under the SHA-256 of its bytes, in two levels of
+shard directories so no single directory grows without bound:
+
+    bike_images/3f/a2/3fa2...e9.jpg
+    bike_images/3f/a2/3fa2...e9.thumb.webp   (renditions, see image_pipeline.py)
+
+Identical uploads therefore map to the same URL. The extension comes from
+the decoded image format, not from the uploaded file name.
+
+Several bikes can share a file, so deleting one bike must not delete it.
+The image_blob table counts references per URL; app.py keeps the counts in
+step with the image_url_N columns and calls remove() once a count drops to
+zero.
+"""
+import hashlib
+import os
+import re
+
+from image_pipeline import RENDITION_FORMATS, RENDITIONS, rendition_url
+
+STORE_ROOT = 'bike_images'
+HASH_CHUNK_SIZE = 1024 * 1024
+# Pillow format -> stored extension
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+_CONTENT_URL = re.compile(r'^' + STORE_ROOT + r'/([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})\.([a-z0-9]+)$')
+
+
+def image_extension(image_format):
+    return FORMAT_EXTENSIONS.get(image_format, (image_format or 'bin').lower())
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_url(digest, extension):
+    """URL (relative to static/) of the image with this SHA-256"""
+    return f'{STORE_ROOT}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
+def is_content_url(image_url):
+    return bool(image_url) and _CONTENT_URL.match(image_url.replace('\\', '/')) is not None
+
+
+def is_stored_file(url):
+    """True for a stored image or one of its renditions: the name alone pins the contents"""
+    url = url.replace('\\', '/')
+    directory, name = url.rsplit('/', 1) if '/' in url else ('', url)
+    parts = name.split('.')
+    if len(parts) == 3 and parts[1] in RENDITIONS:
+        return is_content_url(f'{directory}/{parts[0]}.{parts[2]}')
+    return is_content_url(url)
+
+
+class ImageStore:
+    """Files of the content-addressed store under static_folder"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+
+    def path(self, image_url):
+        return os.path.join(self.static_folder, *image_url.replace('\\', '/').split('/'))
+
+    def exists(self, image_url):
+        return os.path.exists(self.path(image_url))
+
+    def files(self, image_url):
+        """Paths of an image and all of its renditions"""
+        return [self.path(image_url)] + [
+            self.path(rendition_url(image_url, name, extension))
+            for name in RENDITIONS for extension in RENDITION_FORMATS
+        ]
+
+    def remove(self, image_url):
+        """Delete an image and its renditions, and prune the shard directories if they are empty"""
+        for path in self.files(image_url):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        shard = os.path.dirname(self.path(image_url))
+        root = os.path.join(self.static_folder, STORE_ROOT)
+        while shard != root and is_content_url(image_url):
+            try:
+                os.rmdir(shard)
+            except OSError:
+                break
+            shard = os.path.dirname(shard)
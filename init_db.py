@@ -1,5 +1,6 @@
 from app import app, db, User, Bike
 from werkzeug.security import generate_password_hash
+from bike_search import create_search_index
 
 def init_db():
     with app.app_context():
@@ -8,6 +9,8 @@ def init_db():
         
         # Create all tables
         db.create_all()
+        with db.engine.begin() as connection:
+            create_search_index(connection)
         
         # Create a default admin user
         admin = User(
@@ -0,0 +1,30 @@
+from flask import current_app
+
+def upgrade():
+    """Create the bike_search FTS5 table, its sync triggers, and index existing bikes"""
+    from bike_search import create_search_index
+    
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        with db.engine.begin() as connection:
+            create_search_index(connection)
+
+def downgrade():
+    """Drop the bike_search table and its triggers"""
+    from bike_search import drop_search_index
+    
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        with db.engine.begin() as connection:
+            drop_search_index(connection)
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    with app.app_context():
+        upgrade()
+        print("Bike search index created")
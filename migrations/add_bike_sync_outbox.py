@@ -0,0 +1,31 @@
+from flask import current_app
+
+def upgrade():
+    """Create the bike_sync_outbox table used to replicate bike changes to MongoDB"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        db.engine.execute('''
+            CREATE TABLE IF NOT EXISTS bike_sync_outbox (
+                id INTEGER NOT NULL PRIMARY KEY,
+                bike_id INTEGER NOT NULL,
+                created_at DATETIME NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+
+def downgrade():
+    """Drop the bike_sync_outbox table"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        db.engine.execute('DROP TABLE IF EXISTS bike_sync_outbox;')
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    with app.app_context():
+        upgrade()
+        print("bike_sync_outbox table created; run 'flask reconcile-mongo' to backfill MongoDB")
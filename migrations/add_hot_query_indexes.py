@@ -0,0 +1,41 @@
+from flask import current_app
+
+# Indexes added by this migration; their columns are declared in the models' __table_args__
+INDEX_NAMES = [
+    'ix_bike_available_created',
+    'ix_bike_owner_id',
+    'ix_rental_bike_status_end',
+    'ix_rental_request_bike_status',
+    'ix_rental_request_renter_created',
+    'ix_purchase_bike_status',
+]
+
+def _indexes(db):
+    declared = {index.name: index for table in db.metadata.sorted_tables for index in table.indexes}
+    return [declared[name] for name in INDEX_NAMES]
+
+def upgrade():
+    """Create the hot query composite indexes"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        # checkfirst skips indexes that already exist (e.g. databases made by create_all)
+        for index in _indexes(db):
+            index.create(bind=db.engine, checkfirst=True)
+
+def downgrade():
+    """Drop the hot query composite indexes (indexes owned by other migrations are left alone)"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        for index in _indexes(db):
+            index.drop(bind=db.engine, checkfirst=True)
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    with app.app_context():
+        upgrade()
+        print("Hot query indexes created")
@@ -0,0 +1,39 @@
+from flask import current_app
+from sqlalchemy import inspect
+
+IMAGE_COLUMNS = {
+    'image_1_original_name': 'VARCHAR(200)',
+    'image_2_original_name': 'VARCHAR(200)',
+    'image_3_original_name': 'VARCHAR(200)',
+    'image_1_size': 'INTEGER',
+    'image_2_size': 'INTEGER',
+    'image_3_size': 'INTEGER'
+}
+
+def upgrade():
+    """Add uploaded image metadata columns to bike table"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        # Skip columns that add_form_metadata may already have created
+        existing = {column['name'] for column in inspect(db.engine).get_columns('bike')}
+        for column, column_type in IMAGE_COLUMNS.items():
+            if column not in existing:
+                db.engine.execute(f'ALTER TABLE bike ADD COLUMN {column} {column_type};')
+
+def downgrade():
+    """Remove uploaded image metadata columns from bike table"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        for column in IMAGE_COLUMNS:
+            db.engine.execute(f'ALTER TABLE bike DROP COLUMN {column};')
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    with app.app_context():
+        upgrade()
+        print("Image metadata columns added to bike table; run 'flask generate-renditions' to backfill")
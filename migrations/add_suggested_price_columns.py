@@ -0,0 +1,36 @@
+from flask import current_app
+from sqlalchemy import inspect
+
+PRICE_COLUMNS = {
+    'suggested_price': 'FLOAT',
+    'last_price_calculation': 'DATETIME',
+    'price_model_version': 'VARCHAR(50)'
+}
+
+def upgrade():
+    """Add stored price estimate columns to bike table"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        # Skip columns that add_form_metadata may already have created
+        existing = {column['name'] for column in inspect(db.engine).get_columns('bike')}
+        for column, column_type in PRICE_COLUMNS.items():
+            if column not in existing:
+                db.engine.execute(f'ALTER TABLE bike ADD COLUMN {column} {column_type};')
+
+def downgrade():
+    """Remove stored price estimate columns from bike table"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        
+        for column in PRICE_COLUMNS:
+            db.engine.execute(f'ALTER TABLE bike DROP COLUMN {column};')
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    with app.app_context():
+        upgrade()
+        print("Stored price columns added to bike table")
@@ -0,0 +1,133 @@
+from flask import current_app
+
+SLOTS = (1, 2, 3)
+
+def _is_rendition(filename):
+    from image_pipeline import RENDITIONS
+    parts = filename.split('.')
+    return len(parts) > 2 and parts[-2] in RENDITIONS
+
+def _store(source_path, target_path):
+    """Add a file to the store without copying its bytes where the filesystem allows it"""
+    import os
+    import shutil
+
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temporary_path = target_path + '.tmp'
+    try:
+        os.link(source_path, temporary_path)
+    except OSError:
+        shutil.copyfile(source_path, temporary_path)
+    os.replace(temporary_path, target_path)
+
+def upgrade(delete_orphans=False):
+    """
+    Move the timestamp-named photos in static/bike_images into the content-addressed store,
+    point image_url_N at the stored copies and count the references. Uploads still pending
+    under their timestamp names are renamed after their content so image_jobs can finish them.
+    """
+    import os
+    import uuid
+    from image_jobs import has_pending_name, is_pending, pending_url
+    from image_pipeline import verify_image
+    from image_store import ImageStore, content_url, hash_file, image_extension, is_content_url
+
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        store = ImageStore(os.path.dirname(upload_folder))
+
+        db.engine.execute('''
+            CREATE TABLE IF NOT EXISTS image_blob (
+                url VARCHAR(200) NOT NULL PRIMARY KEY,
+                refcount INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+
+        # 1. Store every legacy original once per distinct content (originals stay until step 3)
+        stored = {}
+        for entry in sorted(os.scandir(upload_folder), key=lambda entry: entry.name):
+            if not entry.is_file() or _is_rendition(entry.name):
+                continue
+            try:
+                image_format = verify_image(entry.path)
+            except Exception as e:
+                print(f"Skipping {entry.name}: {str(e)}")
+                continue
+            image_url = content_url(hash_file(entry.path), image_extension(image_format))
+            if not store.exists(image_url):
+                _store(entry.path, store.path(image_url))
+            stored['bike_images/' + entry.name] = image_url
+
+        # Pending uploads keep their bytes in staging; only the name changes
+        restaged = {}
+        static_folder = os.path.dirname(upload_folder)
+        for image_urls in db.engine.execute('SELECT image_url_1, image_url_2, image_url_3 FROM bike'):
+            for image_url in image_urls:
+                if not is_pending(image_url) or has_pending_name(image_url):
+                    continue
+                image_url = image_url.replace('\\', '/')
+                if image_url in restaged:
+                    continue
+                path = os.path.join(static_folder, image_url)
+                try:
+                    image_format = verify_image(path)
+                except Exception as e:
+                    print(f"Skipping {image_url}: {str(e)}")
+                    continue
+                new_url = pending_url(content_url(hash_file(path), image_extension(image_format)), uuid.uuid4().hex)
+                os.replace(path, os.path.join(static_folder, new_url))
+                restaged[image_url] = new_url
+
+        # 2. Rewrite the bike rows and recount references in one transaction
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                'SELECT id, image_url_1, image_url_2, image_url_3 FROM bike'
+            ).fetchall()
+            refcounts = {}
+            for bike_id, *image_urls in rows:
+                for slot, image_url in zip(SLOTS, image_urls):
+                    if not image_url:
+                        continue
+                    legacy_url = image_url.replace('\\', '/')
+                    new_url = restaged.get(legacy_url) or stored.get(legacy_url, image_url)
+                    if new_url != image_url:
+                        connection.execute(
+                            f'UPDATE bike SET image_url_{slot} = ? WHERE id = ?', (new_url, bike_id)
+                        )
+                    if is_content_url(new_url):
+                        refcounts[new_url] = refcounts.get(new_url, 0) + 1
+            connection.execute('DELETE FROM image_blob')
+            for image_url, refcount in refcounts.items():
+                connection.execute(
+                    'INSERT INTO image_blob (url, refcount) VALUES (?, ?)', (image_url, refcount)
+                )
+
+        # 3. The legacy names (and their renditions) are no longer referenced
+        for legacy_url in stored:
+            store.remove(legacy_url)
+
+        orphans = sorted(set(stored.values()) - set(refcounts))
+        if delete_orphans:
+            for image_url in orphans:
+                store.remove(image_url)
+
+        print(f"Stored {len(stored)} files as {len(set(stored.values()))} distinct images; "
+              f"{len(orphans)} are not used by any bike{' and were deleted' if delete_orphans else ''}; "
+              f"renamed {len(restaged)} pending uploads")
+
+def downgrade():
+    """Drop the image_blob table (stored files keep their content-addressed names)"""
+    with current_app.app_context():
+        db = current_app.extensions['sqlalchemy'].db
+
+        db.engine.execute('DROP TABLE IF EXISTS image_blob;')
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    with app.app_context():
+        upgrade(delete_orphans='--delete-orphans' in sys.argv)
+        print("Bike images deduplicated; run 'flask generate-renditions' and 'flask reconcile-mongo' to finish")
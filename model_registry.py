@@ -0,0 +1,499 @@
+"""
+Versioned, hot-reloadable store for the bike price model.
+
+Each published model lives in models/price/<version>/ as a directory of .npy
+arrays (see price_engine.py) plus a manifest.json describing its metrics,
+feature order, encoder classes and the checks it passed. models/price/CURRENT
+names the active version and is replaced atomically on publish or rollback.
+
+Nothing is loaded at import time. The first prediction memory-maps the active
+version (mmap_mode='r'), so every gunicorn worker shares the same page-cache
+pages. If the store is still empty, the first worker to get there publishes
+bike_price_model.joblib while holding the store's lock, and the others wait
+for it and then load that version. A version is only activated, on publish
+or later, if its parity and latency checks passed (activate and rollback
+take force to override). Running processes re-read CURRENT
+every few seconds and swap in a new version only after its reference rows
+still predict bit-identically; otherwise they keep serving the version they
+already have.
+
+Usage:
+    python model_registry.py publish [--model bike_price_model.joblib] [--version NAME] [--no-activate]
+    python model_registry.py list
+    python model_registry.py activate VERSION [--force]
+    python model_registry.py rollback [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from file_lock import FileLock
+from price_engine import (
+    BASE_DIR, CATEGORICAL_FEATURES, DEFAULT_DATA_PATH, DEFAULT_MODEL_PATH, FEATURE_ORDER,
+    CompiledForest, count_mismatches, load_dataset, parity_rows, reference_predictions,
+)
+
+PRICE_STORE_DIR = os.path.join(BASE_DIR, 'models', 'price')
+
+# Rows kept with each version so every process can re-verify parity on load
+REFERENCE_ROWS = 256
+
+# Single-row latency budget a version must meet at publish before it is activated
+MAX_LATENCY_MS = 10.0
+
+# How often running processes look for a newly activated version
+RELOAD_CHECK_SECONDS = 5.0
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, text):
+    staging = f'{path}.tmp-{os.getpid()}'
+    with open(staging, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(staging, path)
+
+
+def _mapped_rss(directory):
+    """
+    Resident bytes of this process's mappings of files under directory.
+    Returns: int, or None where /proc/self/smaps is unavailable
+    """
+    directory = os.path.abspath(directory)
+    try:
+        with open('/proc/self/smaps') as smaps:
+            resident = 0
+            in_mapping = False
+            for line in smaps:
+                fields = line.split()
+                if fields and '-' in fields[0] and len(fields) >= 5:
+                    # Mapping header: address perms offset dev inode [path]
+                    in_mapping = len(fields) >= 6 and fields[5].startswith(directory + os.sep)
+                elif in_mapping and fields and fields[0] == 'Rss:':
+                    resident += int(fields[1]) * 1024
+            return resident
+    except OSError:
+        return None
+
+
+def measure_latency(model, X_raw, repeats=50):
+    """
+    Time single-row and 100-row predictions.
+    Returns: dict of median latencies in milliseconds
+    """
+    single = X_raw[:1]
+    batch = np.resize(X_raw, (100, X_raw.shape[1]))
+    model.predict(single)
+
+    timings = {}
+    for name, rows in (('single_row_ms', single), ('batch_100_ms', batch)):
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.predict(rows)
+            samples.append((time.perf_counter() - start) * 1000)
+        timings[name] = float(np.median(samples))
+    return timings
+
+
+def verify_version(model, version_path):
+    """
+    Re-run the parity check recorded with a version. Latency was measured once, at publish,
+    and is not re-timed here: a busy host would otherwise reject every version.
+    Returns: (passed, reason)
+    """
+    reference_X = np.load(os.path.join(version_path, 'reference_X.npy'))
+    reference_y = np.load(os.path.join(version_path, 'reference_y.npy'))
+    mismatches = count_mismatches(reference_y, model.predict(reference_X))
+    if mismatches:
+        return False, f'{mismatches} of {len(reference_y)} reference predictions differ'
+    return True, None
+
+
+def dataset_metrics(model, X_raw, y):
+    """R², MAE and RMSE of a compiled model on encoded rows"""
+    y_pred = model.predict(X_raw)
+    errors = y - y_pred
+    return {
+        'r2': float(1 - np.sum(errors ** 2) / np.sum((y - y.mean()) ** 2)),
+        'mae': float(np.mean(np.abs(errors))),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'rows': int(len(y)),
+    }
+
+
+class ModelStore:
+    """Directory of published price model versions"""
+
+    def __init__(self, root=PRICE_STORE_DIR):
+        self.root = os.path.abspath(root)
+
+    @property
+    def current_file(self):
+        return os.path.join(self.root, 'CURRENT')
+
+    @property
+    def history_file(self):
+        return os.path.join(self.root, 'HISTORY')
+
+    @property
+    def lock(self):
+        """Lock serialising the bootstrap publish across worker processes"""
+        return FileLock(os.path.join(self.root, '.publish.lock'))
+
+    def version_path(self, version):
+        return os.path.join(self.root, version)
+
+    def current_version(self):
+        try:
+            with open(self.current_file) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def history(self):
+        try:
+            with open(self.history_file) as f:
+                return [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def read_manifest(self, version):
+        with open(os.path.join(self.version_path(version), 'manifest.json')) as f:
+            return json.load(f)
+
+    def versions(self):
+        """Published versions, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        manifests = []
+        for name in os.listdir(self.root):
+            if os.path.exists(os.path.join(self.root, name, 'manifest.json')):
+                manifests.append(self.read_manifest(name))
+        return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+    def load(self, version, mmap_mode='r'):
+        return CompiledForest.load(self.version_path(version), mmap_mode=mmap_mode)
+
+    def activate(self, version, record=True, force=False):
+        """
+        Point CURRENT at a published version.
+        Raises: ValueError for an unknown version, or one that failed its publish checks unless force is True
+        """
+        if not os.path.exists(os.path.join(self.version_path(version), 'manifest.json')):
+            raise ValueError(f'Unknown price model version: {version}')
+        if not self.read_manifest(version).get('checks_passed') and not force:
+            raise ValueError(f'Price model version {version} failed its publish checks; use force to activate it')
+        _write_atomic(self.current_file, version + '\n')
+        if record:
+            with open(self.history_file, 'a') as f:
+                f.write(version + '\n')
+        print(f'Price model version {version} activated')
+
+    def rollback(self, force=False):
+        """Re-activate the version that was active before the current one (see activate() for force)"""
+        current = self.current_version()
+        history = self.history()
+        if current not in history:
+            raise ValueError('No activation history to roll back')
+        index = len(history) - 1 - history[::-1].index(current)
+        if index == 0:
+            raise ValueError(f'Version {current} has no previous version')
+        previous = history[index - 1]
+        self.activate(previous, record=False, force=force)
+        return previous
+
+    def publish(self, artifacts, version=None, metrics=None, model_path=DEFAULT_MODEL_PATH,
+                data_path=DEFAULT_DATA_PATH, activate=True, max_latency_ms=MAX_LATENCY_MS):
+        """
+        Compile a joblib artifact dict into a new version and, if its checks pass, activate it.
+        max_latency_ms=None records the latency without gating activation on it.
+        Returns: the version manifest
+        """
+        # The random suffix keeps versions published in the same second apart
+        version = version or f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        final_path = self.version_path(version)
+        if os.path.exists(final_path):
+            raise ValueError(f'Price model version {version} already exists')
+
+        start = time.perf_counter()
+        compiled = CompiledForest.from_artifacts(artifacts)
+        compile_seconds = time.perf_counter() - start
+
+        # Parity against the sklearn model, including rows on every split boundary
+        X_parity = parity_rows(artifacts, compiled, data_path)
+        expected = reference_predictions(artifacts, X_parity)
+        mismatches = count_mismatches(expected, compiled.predict(X_parity))
+
+        X_data, y_data = load_dataset(artifacts, data_path)
+        if metrics is None:
+            metrics = dict(dataset_metrics(compiled, X_data, y_data), evaluated_on=os.path.basename(data_path))
+        latency = measure_latency(compiled, X_data)
+        too_slow = max_latency_ms is not None and latency['single_row_ms'] > max_latency_ms
+        checks_passed = not mismatches and not too_slow
+
+        manifest = {
+            'version': version,
+            'created_at': datetime.utcnow().isoformat(),
+            'feature_order': FEATURE_ORDER,
+            'encoder_classes': {column: compiled.classes[column].tolist() for column in CATEGORICAL_FEATURES},
+            'metrics': metrics,
+            'source_model': {
+                'path': os.path.basename(model_path),
+                'sha256': _file_sha256(model_path) if os.path.exists(model_path) else None,
+                'estimator': type(artifacts['model']).__name__,
+                'params': {key: value for key, value in artifacts['model'].get_params().items()
+                           if isinstance(value, (int, float, str, bool, type(None)))},
+            },
+            'forest': {'n_trees': compiled.n_trees, 'node_count': compiled.node_count, 'max_depth': compiled.max_depth},
+            'parity': {'rows': int(len(X_parity)), 'mismatches': mismatches},
+            'latency': latency,
+            'latency_budget_ms': max_latency_ms,
+            'checks_passed': checks_passed,
+            'compile_seconds': compile_seconds,
+        }
+
+        # Build the version beside the store and rename it in, so readers never see a partial version
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f'.{version}.tmp-{os.getpid()}')
+        compiled.save(staging)
+        np.save(os.path.join(staging, 'reference_X.npy'), X_parity[:REFERENCE_ROWS])
+        np.save(os.path.join(staging, 'reference_y.npy'), expected[:REFERENCE_ROWS])
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, final_path)
+        print(f'Price model version {version} published to {final_path}')
+
+        if mismatches:
+            print(f'Not activating {version}: {mismatches} of {len(X_parity)} parity rows differ')
+        elif too_slow:
+            print(f"Not activating {version}: single-row latency {latency['single_row_ms']:.2f}ms exceeds {max_latency_ms}ms")
+        elif activate:
+            self.activate(version)
+        return manifest
+
+    def remove(self, version):
+        if version == self.current_version():
+            raise ValueError(f'Cannot remove the active version {version}')
+        shutil.rmtree(self.version_path(version))
+
+
+class ModelRegistry:
+    """Serves the active price model version and hot-swaps it when CURRENT changes"""
+
+    def __init__(self, store=None, model_path=DEFAULT_MODEL_PATH, mmap_mode='r',
+                 check_interval=RELOAD_CHECK_SECONDS):
+        self.store = store or ModelStore()
+        self.model_path = os.path.abspath(model_path)
+        self.mmap_mode = mmap_mode
+        self.check_interval = check_interval
+        # (model, version) swapped as one tuple so readers never see a mismatched pair
+        self._active = (None, None)
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._rejected = {}
+        self._load_seconds = None
+        self._loaded_at = None
+        self._reloads = 0
+        self._listeners = []
+
+    def _bootstrap(self):
+        """Publish the joblib artifact as the first version when the store is empty (once across processes)"""
+        import joblib
+
+        with self.store.lock:
+            if self.store.current_version() is not None:
+                # Another worker published it while we waited
+                return
+            print(f'No active price model version, publishing {self.model_path}')
+            # The shipped model is all there is to serve, so a slow host must not keep it inactive
+            self.store.publish(joblib.load(self.model_path), model_path=self.model_path, max_latency_ms=None)
+
+    def _try_load(self, version):
+        """
+        Load and verify a version.
+        Returns: the model, or None if it failed its checks
+        """
+        start = time.perf_counter()
+        try:
+            model = self.store.load(version, mmap_mode=self.mmap_mode)
+            passed, reason = verify_version(model, self.store.version_path(version))
+        except (OSError, ValueError, KeyError) as e:
+            passed, reason = False, str(e)
+        if not passed:
+            self._rejected[version] = reason
+            print(f'Price model version {version} rejected: {reason}')
+            return None
+        self._load_seconds = time.perf_counter() - start
+        self._loaded_at = time.time()
+        return model
+
+    def _load_initial(self):
+        if self.store.current_version() is None:
+            self._bootstrap()
+        # Walk back through the activation history until a version passes its checks
+        candidates = [self.store.current_version()] + self.store.history()[::-1]
+        for version in dict.fromkeys(candidate for candidate in candidates if candidate):
+            if version in self._rejected:
+                continue
+            model = self._try_load(version)
+            if model is not None:
+                self._active = (model, version)
+                print(f'Price model version {version} loaded in {self._load_seconds * 1000:.1f}ms')
+                return
+        raise RuntimeError('No price model version passed its parity check')
+
+    def _maybe_reload(self):
+        version = self.store.current_version()
+        if not version or version == self._version or version in self._rejected:
+            return
+        model = self._try_load(version)
+        if model is None:
+            # Keep serving the version we already have
+            return
+        # In-flight requests keep their reference to the old model; new ones see the new one
+        self._active = (model, version)
+        self._reloads += 1
+        print(f'Price model hot-reloaded to version {version} in {self._load_seconds * 1000:.1f}ms')
+
+    def get_versioned(self):
+        """
+        Return the active model and its version, loading it on first use and picking up new versions
+        Returns: (model, version)
+        """
+        active = self._active
+        now = time.monotonic()
+        if active[0] is not None and now < self._next_check:
+            return active
+        with self._lock:
+            previous = self._version
+            if self._model is None:
+                self._load_initial()
+            elif now >= self._next_check:
+                self._maybe_reload()
+            self._next_check = now + self.check_interval
+            active = self._active
+        if active[1] != previous:
+            for callback in self._listeners:
+                try:
+                    callback(active[1], previous)
+                except Exception as e:
+                    print(f"Price model listener failed: {str(e)}")
+        return active
+
+    @property
+    def _model(self):
+        return self._active[0]
+
+    @property
+    def _version(self):
+        return self._active[1]
+
+    def get(self):
+        """Return the active model, loading it on first use and picking up new versions"""
+        return self.get_versioned()[0]
+
+    def on_version_change(self, callback):
+        """
+        Call callback(version, previous) whenever this process starts serving a different version.
+        previous is None when the process loads its first version.
+        """
+        self._listeners.append(callback)
+        return callback
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def metrics(self):
+        """Version, load time and memory footprint of the price model in this process"""
+        model = self._model
+        return {
+            'loaded': model is not None,
+            'version': self._version,
+            'active_version': self.store.current_version(),
+            'pid': os.getpid(),
+            'load_seconds': self._load_seconds,
+            'loaded_at': self._loaded_at,
+            'reloads': self._reloads,
+            'rejected_versions': dict(self._rejected),
+            'mmap_mode': self.mmap_mode,
+            'model_bytes': model.nbytes if model is not None else None,
+            'resident_bytes': (
+                _mapped_rss(self.store.version_path(self._version)) if self.mmap_mode else model.nbytes
+            ) if model is not None else None,
+            'n_trees': model.n_trees if model is not None else None,
+            'node_count': model.node_count if model is not None else None,
+            'categories': model.category_stats() if model is not None else None,
+        }
+
+
+# Shared registry used by the web app and scripts
+price_registry = ModelRegistry()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Versioned bike price model store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish_parser = subparsers.add_parser('publish', help='Compile a joblib model into a new version')
+    publish_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    publish_parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    publish_parser.add_argument('--version')
+    publish_parser.add_argument('--metrics', help='JSON file with evaluation metrics to record')
+    publish_parser.add_argument('--no-activate', action='store_true')
+
+    subparsers.add_parser('list', help='List published versions')
+    activate_parser = subparsers.add_parser('activate', help='Make a published version active')
+    activate_parser.add_argument('version')
+    activate_parser.add_argument('--force', action='store_true', help='Activate even if its checks failed')
+    rollback_parser = subparsers.add_parser('rollback', help='Re-activate the previously active version')
+    rollback_parser.add_argument('--force', action='store_true', help='Roll back even if its checks failed')
+
+    args = parser.parse_args(argv)
+    store = ModelStore()
+    if args.command == 'publish':
+        import joblib
+
+        metrics = None
+        if args.metrics:
+            with open(args.metrics) as f:
+                metrics = json.load(f)
+        store.publish(joblib.load(args.model), version=args.version, metrics=metrics,
+                      model_path=args.model, data_path=args.data, activate=not args.no_activate)
+    elif args.command == 'list':
+        current = store.current_version()
+        for manifest in store.versions():
+            marker = '*' if manifest['version'] == current else ' '
+            metrics = manifest.get('metrics', {})
+            print(f"{marker} {manifest['version']}  r2={metrics.get('r2', float('nan')):.4f}  "
+                  f"mae={metrics.get('mae', float('nan')):.2f}  "
+                  f"single_row={manifest['latency']['single_row_ms']:.3f}ms")
+    elif args.command == 'activate':
+        store.activate(args.version, force=args.force)
+    elif args.command == 'rollback':
+        store.rollback(force=args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+SQL -> Mongo replication of bike listings through a change outbox.
+
+SQL is the source of truth. Every flush that inserts, updates or deletes a
+Bike also writes a row to bike_sync_outbox in the same transaction (see the
+session hooks in app.py), so a committed change can never be lost and a
+rolled back one is never published. MongoBikeSync drains the outbox in
+batches: it collapses the rows per bike, loads the current SQL state and
+applies it with one unordered bulk_write. Applying the current state (not the
+change) makes every operation idempotent, so a failed batch can simply be
+retried.
+
+Batches must not overlap, though. A process could read a bike, then another
+could apply and delete a newer outbox row, and the first one's bulk_write
+would then put the older state back with no row left to correct it. Every
+worker process runs a syncer thread, so with lock_path set, each batch (and
+reconcile()) holds a FileLock across processes. A syncer that finds the lock
+taken leaves the batch to the holder and retries on its next poll.
+
+Mongo owns the metadata counters (views, favorites, last_viewed); they are
+only set when a document is first created.
+
+reconcile() walks both stores in sql_id chunks and repairs any drift, for
+databases that predate the outbox or after Mongo was restored from backup.
+"""
+import threading
+import time
+from datetime import datetime
+
+from contextlib import nullcontext
+
+from pymongo import DeleteOne, UpdateOne
+
+from file_lock import FileLock
+
+# Bike fields copied to Mongo as-is
+SYNCED_FIELDS = [
+    'brand', 'model', 'year', 'engine_cc', 'km_driven', 'mileage', 'condition', 'listing_type',
+    'price_per_day', 'sale_price', 'description', 'owner_id', 'suggested_price', 'is_available',
+]
+
+
+def bike_document(bike):
+    """The SQL-owned part of a bike's Mongo document"""
+    document = {field: getattr(bike, field) for field in SYNCED_FIELDS}
+    document['sql_id'] = bike.id
+    document['images'] = [bike.image_url_1, bike.image_url_2, bike.image_url_3]
+    document['created_at'] = bike.created_at
+    document['metadata.search_keywords'] = [
+        (bike.brand or '').lower(),
+        (bike.model or '').lower(),
+        str(bike.year),
+        (bike.condition or '').lower()
+    ]
+    return document
+
+
+def bike_upsert(bike):
+    return UpdateOne(
+        {'sql_id': bike.id},
+        {
+            '$set': bike_document(bike),
+            '$setOnInsert': {'metadata.views': 0, 'metadata.favorites': 0, 'metadata.last_viewed': None},
+        },
+        upsert=True
+    )
+
+
+def _comparable(value):
+    # BSON stores datetimes with millisecond precision
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000, tzinfo=None)
+    return value
+
+
+def document_differs(bike, document):
+    """True if the Mongo document does not match the bike's SQL state"""
+    expected = bike_document(bike)
+    metadata = document.get('metadata') or {}
+    for field, value in expected.items():
+        actual = metadata.get('search_keywords') if field == 'metadata.search_keywords' else document.get(field)
+        if _comparable(value) != _comparable(actual):
+            return True
+    return False
+
+
+class MongoBikeSync:
+    """Drains bike_sync_outbox into the Mongo bikes collection"""
+
+    def __init__(self, app, db, bike_model, outbox_model, collection, batch_size=200,
+                 poll_interval=5, backoff_base=1, backoff_max=60, lock_path=None):
+        self.app = app
+        self.db = db
+        self.Bike = bike_model
+        self.Outbox = outbox_model
+        self.collection = collection
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Serialises batches across processes (None: this process is the only syncer)
+        self.lock_path = lock_path
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'applied': 0, 'upserts': 0, 'deletes': 0, 'batches': 0, 'errors': 0,
+            'last_error': None, 'last_batch_seconds': None,
+        }
+
+    def notify(self):
+        """Wake the syncer after a commit that queued changes"""
+        self._wakeup.set()
+
+    def _lock(self):
+        return FileLock(self.lock_path) if self.lock_path else None
+
+    def process_batch(self):
+        """
+        Apply one batch of outbox rows to Mongo (call inside an app context, holding the sync lock).
+        Returns: number of outbox rows applied
+        """
+        session = self.db.session
+        rows = self.Outbox.query.order_by(self.Outbox.id).limit(self.batch_size).all()
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        bike_ids = {row.bike_id for row in rows}
+        # The current SQL state decides the operation: a bike that no longer exists is deleted
+        bikes = {bike.id: bike for bike in self.Bike.query.filter(self.Bike.id.in_(bike_ids))}
+        operations = [
+            bike_upsert(bikes[bike_id]) if bike_id in bikes else DeleteOne({'sql_id': bike_id})
+            for bike_id in sorted(bike_ids)
+        ]
+        row_ids = [row.id for row in rows]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except Exception:
+            session.rollback()
+            self.Outbox.query.filter(self.Outbox.id.in_(row_ids)).update(
+                {self.Outbox.attempts: self.Outbox.attempts + 1}, synchronize_session=False
+            )
+            session.commit()
+            raise
+        self.Outbox.query.filter(self.Outbox.id.in_(row_ids)).delete(synchronize_session=False)
+        session.commit()
+        with self._stats_lock:
+            self.stats['applied'] += len(rows)
+            self.stats['upserts'] += sum(1 for bike_id in bike_ids if bike_id in bikes)
+            self.stats['deletes'] += sum(1 for bike_id in bike_ids if bike_id not in bikes)
+            self.stats['batches'] += 1
+            self.stats['last_batch_seconds'] = time.perf_counter() - start
+        return len(rows)
+
+    def drain(self):
+        """Apply every queued change, in the calling thread (waits for a syncer busy in another process)"""
+        total = 0
+        with self._lock() or nullcontext(), self.app.app_context():
+            while True:
+                applied = self.process_batch()
+                if not applied:
+                    return total
+                total += applied
+
+    def _run(self):
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                lock = self._lock()
+                if lock is None or lock.acquire(blocking=False):
+                    try:
+                        with self.app.app_context():
+                            applied = self.process_batch()
+                    finally:
+                        if lock is not None:
+                            lock.release()
+                else:
+                    # Another process is applying a batch
+                    applied = 0
+                failures = 0
+                if applied:
+                    continue
+                wait = self.poll_interval
+            except Exception as e:
+                failures += 1
+                with self._stats_lock:
+                    self.stats['errors'] += 1
+                    self.stats['last_error'] = str(e)
+                print(f"Mongo sync error: {str(e)}")
+                wait = min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the background syncer thread (once per process)"""
+        if self._thread:
+            return
+        with self._start_lock:
+            if self._thread:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='mongo-bike-sync', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def metrics(self):
+        with self.app.app_context():
+            depth = self.Outbox.query.count()
+            oldest = self.db.session.query(self.db.func.min(self.Outbox.created_at)).scalar()
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict(
+            stats,
+            queue_depth=depth,
+            oldest_pending_seconds=(datetime.utcnow() - oldest).total_seconds() if oldest else None,
+            running=self._thread is not None,
+        )
+
+    def reconcile(self, chunk_size=500, repair=True):
+        """
+        Diff SQL and Mongo chunk by chunk and (optionally) repair the differences.
+        Returns: dict with counts of missing, stale and orphaned Mongo documents
+        """
+        report = {'checked': 0, 'missing': 0, 'stale': 0, 'orphaned': 0, 'repaired': 0}
+        # Repairs write the SQL state as read, so the syncers must not apply batches meanwhile
+        with self._lock() or nullcontext(), self.app.app_context():
+            # SQL -> Mongo: every bike must have an up-to-date document
+            last_id = 0
+            while True:
+                bikes = self.Bike.query.filter(self.Bike.id > last_id).order_by(self.Bike.id).limit(chunk_size).all()
+                if not bikes:
+                    break
+                last_id = bikes[-1].id
+                documents = {
+                    document['sql_id']: document
+                    for document in self.collection.find({'sql_id': {'$in': [bike.id for bike in bikes]}})
+                }
+                operations = []
+                for bike in bikes:
+                    document = documents.get(bike.id)
+                    if document is None:
+                        report['missing'] += 1
+                        operations.append(bike_upsert(bike))
+                    elif document_differs(bike, document):
+                        report['stale'] += 1
+                        operations.append(bike_upsert(bike))
+                report['checked'] += len(bikes)
+                if repair and operations:
+                    self.collection.bulk_write(operations, ordered=False)
+                    report['repaired'] += len(operations)
+                self.db.session.expire_all()
+
+            # Mongo -> SQL: documents whose bike is gone are deleted
+            last_sql_id = None
+            while True:
+                query = {'sql_id': {'$type': 'number'}}
+                if last_sql_id is not None:
+                    query['sql_id']['$gt'] = last_sql_id
+                sql_ids = [
+                    document['sql_id']
+                    for document in self.collection.find(query, {'sql_id': 1, '_id': 0}).sort('sql_id', 1).limit(chunk_size)
+                ]
+                if not sql_ids:
+                    break
+                last_sql_id = sql_ids[-1]
+                existing = {
+                    bike_id for (bike_id,) in self.db.session.query(self.Bike.id).filter(self.Bike.id.in_(sql_ids))
+                }
+                orphaned = [sql_id for sql_id in sql_ids if sql_id not in existing]
+                report['orphaned'] += len(orphaned)
+                if repair and orphaned:
+                    self.collection.delete_many({'sql_id': {'$in': orphaned}})
+                    report['repaired'] += len(orphaned)
+        return report
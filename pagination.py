@@ -0,0 +1,115 @@
+"""
+Keyset (cursor) pagination for the Mongo bike search APIs.
+
+Results are ordered newest first on (created_at, sql_id). The cursor handed to
+clients encodes the sort key of the last bike on a page, so the next page is a
+range scan on the (created_at, sql_id) index instead of a growing skip().
+Legacy documents lacking either key are skipped; 'flask reconcile-mongo'
+rewrites the ones that belong to a SQL bike.
+"""
+import base64
+import json
+from datetime import datetime
+
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Sort order shared by every paginated search, backed by SEARCH_INDEX
+SEARCH_SORT = [('created_at', DESCENDING), ('sql_id', DESCENDING)]
+SEARCH_INDEX_NAME = 'created_at_-1_sql_id_-1'
+
+# Legacy documents missing either sort key have no place in the order and are left out of paginated searches
+HAS_SORT_KEY = {'created_at': {'$type': 'date'}, 'sql_id': {'$type': 'number'}}
+
+
+class PaginationError(ValueError):
+    """Raised for a malformed cursor, page size or fields parameter"""
+
+
+def ensure_search_index(collection):
+    """Create the index that backs SEARCH_SORT (a no-op when it already exists)"""
+    collection.create_index(SEARCH_SORT, name=SEARCH_INDEX_NAME)
+
+
+def encode_cursor(document):
+    """Opaque cursor pointing just after this document"""
+    key = [document['created_at'].isoformat(), document['sql_id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Parse a cursor made by encode_cursor.
+    Returns: (created_at datetime, sql_id)
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, sql_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(sql_id)
+    except (ValueError, TypeError) as e:
+        raise PaginationError(f"Invalid cursor: {token}") from e
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Page size from a query parameter, clamped to 1..maximum"""
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        raise PaginationError(f"Invalid limit: {value}")
+    return max(1, min(size, maximum))
+
+
+def requested_fields(value, field_sources):
+    """
+    Parse a comma-separated fields= parameter.
+    field_sources maps each response field to the Mongo fields it is built from.
+    Returns: list of response fields (all of them when the parameter is empty)
+    """
+    if not value:
+        return list(field_sources)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in field_sources]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def projection_for(fields, field_sources):
+    """Mongo projection covering the requested fields plus the sort key ('_id' only when asked for)"""
+    projection = {'_id': 0, 'created_at': 1, 'sql_id': 1}
+    for field in fields:
+        for source in field_sources[field]:
+            projection[source] = 1
+    return projection
+
+
+def after_cursor(query, cursor):
+    """Restrict a Mongo query to documents that have the sort key and sort after the cursor"""
+    conditions = [query, HAS_SORT_KEY] if query else [HAS_SORT_KEY]
+    if cursor is not None:
+        created_at, sql_id = cursor
+        conditions.append({'$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, 'sql_id': {'$lt': sql_id}}
+        ]})
+    return {'$and': conditions}
+
+
+def find_page(collection, query, limit, cursor=None, projection=None):
+    """
+    Fetch one page of a search.
+    Returns: (list of documents, cursor for the next page or None on the last page)
+    """
+    documents = list(
+        collection.find(after_cursor(query, cursor), projection)
+        .sort(SEARCH_SORT)
+        .limit(limit + 1)
+    )
+    if len(documents) > limit:
+        documents = documents[:limit]
+        return documents, encode_cursor(documents[-1])
+    return documents, None
@@ -0,0 +1,181 @@
+"""
+Bounded LRU/TTL cache for price predictions.
+
+Entries are keyed on the encoded feature vector (the exact float64 row the
+model scores), so identical listings share one prediction. Every entry belongs
+to a model version; when the registry serves a new version the cache drops
+everything it holds for the old one.
+
+An optional SQLite file acts as a second level shared by all worker
+processes on the host. The in-process LRU is checked first, then SQLite.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """Two-level (in-process LRU, optional SQLite) prediction cache"""
+
+    def __init__(self, max_entries=10000, ttl=3600, store_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store_path = os.path.abspath(store_path) if store_path else None
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._store_writes = 0
+        self.counters = {
+            'hits': 0,
+            'store_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    # SQLite connections cannot be shared between threads, so each thread opens its own
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.store_path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS prediction_cache (
+                    version TEXT NOT NULL,
+                    key BLOB NOT NULL,
+                    price REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (version, key)
+                )
+            ''')
+            self._local.connection = connection
+        return connection
+
+    def _check_version(self, version):
+        """Drop all entries when the model version changes; call with the lock held"""
+        if version == self._version:
+            return
+        if self._version is not None:
+            self.counters['invalidations'] += 1
+            if self.store_path:
+                with self._connection() as connection:
+                    connection.execute('DELETE FROM prediction_cache WHERE version != ?', (version,))
+        self._entries.clear()
+        self._version = version
+
+    @staticmethod
+    def keys_for(X):
+        """Cache keys for the rows of an encoded feature matrix"""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        return [row.tobytes() for row in X]
+
+    def get_many(self, version, keys):
+        """
+        Look up many keys at once.
+        Returns: list of cached prices, None where there is no live entry
+        """
+        now = time.time()
+        results = [None] * len(keys)
+        missing = []
+        with self._lock:
+            self._check_version(version)
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(i)
+                elif entry[1] < now:
+                    del self._entries[key]
+                    self.counters['expirations'] += 1
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(key)
+                    results[i] = entry[0]
+                    self.counters['hits'] += 1
+
+        if missing and self.store_path:
+            found = self._store_get(version, [keys[i] for i in missing], now)
+            still_missing = []
+            for i in missing:
+                entry = found.get(keys[i])
+                if entry is None:
+                    still_missing.append(i)
+                else:
+                    results[i] = entry[0]
+            with self._lock:
+                self.counters['store_hits'] += len(missing) - len(still_missing)
+                for i in missing:
+                    if keys[i] in found:
+                        self._remember(keys[i], *found[keys[i]])
+            missing = still_missing
+
+        with self._lock:
+            self.counters['misses'] += len(missing)
+        return results
+
+    def _store_get(self, version, keys, now):
+        found = {}
+        connection = self._connection()
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = connection.execute(
+                f'SELECT key, price, expires_at FROM prediction_cache '
+                f'WHERE version = ? AND expires_at >= ? AND key IN ({placeholders})',
+                [version, now] + chunk
+            )
+            for key, price, expires_at in rows:
+                found[bytes(key)] = (price, expires_at)
+        return found
+
+    def _remember(self, key, price, expires_at):
+        """Insert into the LRU, evicting the oldest entries; call with the lock held"""
+        self._entries[key] = (price, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def put_many(self, version, keys, prices):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._check_version(version)
+            for key, price in zip(keys, prices):
+                self._remember(key, float(price), expires_at)
+        if self.store_path:
+            with self._connection() as connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO prediction_cache (version, key, price, expires_at) VALUES (?, ?, ?, ?)',
+                    [(version, key, float(price), expires_at) for key, price in zip(keys, prices)]
+                )
+                # Sweep expired rows now and then rather than on every write
+                self._store_writes += 1
+                if self._store_writes % 100 == 0:
+                    connection.execute('DELETE FROM prediction_cache WHERE expires_at < ?', (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store_path:
+            with self._connection() as connection:
+                connection.execute('DELETE FROM prediction_cache')
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['store_hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                version=self._version,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                ttl=self.ttl,
+                store_path=self.store_path,
+                hit_rate=(self.counters['hits'] + self.counters['store_hits']) / lookups if lookups else None,
+            )
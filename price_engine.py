@@ -0,0 +1,449 @@
+"""
+Compiled inference engine for the bike price model.
+
+The RandomForestRegressor saved in bike_price_model.joblib is flattened into
+plain NumPy arrays (feature, threshold, children and value per node). The
+StandardScaler is folded into the thresholds, so rows are compared in raw
+feature space and neither sklearn nor the scaler is needed at request time.
+
+The compiled model is stored as a directory of plain .npy files so it can be
+memory-mapped and shared between worker processes.
+
+Usage:
+    python price_engine.py export [--model bike_price_model.joblib] [--output bike_price_model_compiled]
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(BASE_DIR, 'bike_price_model.joblib')
+DEFAULT_COMPILED_PATH = os.path.join(BASE_DIR, 'bike_price_model_compiled')
+DEFAULT_DATA_PATH = os.path.join(BASE_DIR, 'used_bike_data.csv')
+
+# Column order the forest was trained on
+FEATURE_ORDER = ['brand', 'model', 'year', 'engine_cc', 'km_driven', 'mileage', 'condition']
+CATEGORICAL_FEATURES = ['brand', 'model', 'condition']
+
+# Arrays making up a compiled model, one .npy file each
+ARRAY_NAMES = ['feature', 'threshold', 'left', 'right', 'value', 'roots', 'max_depth'] + [
+    f'{column}_classes' for column in CATEGORICAL_FEATURES
+]
+
+# Marker used by sklearn for leaf nodes
+TREE_LEAF = -1
+
+# Label a model can be trained with to give unseen categories a learned bucket
+UNKNOWN_CATEGORY = '__unknown__'
+
+
+def _float64_to_ordered(values):
+    """Map float64 values onto int64 so that integer order matches float order"""
+    bits = np.asarray(values, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, np.int64(-2**63) - bits - 1, bits)
+
+
+def _ordered_to_float64(ordered):
+    """Inverse of _float64_to_ordered"""
+    ordered = np.asarray(ordered, dtype=np.int64)
+    bits = np.where(ordered < 0, np.int64(-2**63) - ordered - 1, ordered)
+    return bits.view(np.float64)
+
+
+def _goes_left(raw, mean, scale, threshold):
+    """The exact split test sklearn applies after scaling: float32((x - mean) / scale) <= threshold"""
+    return ((raw - mean) / scale).astype(np.float32) <= threshold
+
+
+def fold_scaler_thresholds(threshold, mean, scale):
+    """
+    Rewrite scaled-space thresholds as raw-space thresholds.
+
+    sklearn scales in float64 and then casts to float32 before comparing, so
+    a plain ``threshold * scale + mean`` can disagree with the model on
+    values close to a split. The scaled test is monotone in the raw value, so
+    each raw threshold is found by bisection over the ordered float64 values:
+    the largest raw x that still goes left. This keeps the folded forest
+    bit-identical to the original model.
+    """
+    threshold = np.asarray(threshold, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    finite_max = np.finfo(np.float64).max
+    low = _float64_to_ordered(np.full(threshold.shape, -finite_max))
+    high = _float64_to_ordered(np.full(threshold.shape, finite_max))
+
+    # Splits that send everything right or everything left need no search
+    never_left = ~_goes_left(_ordered_to_float64(low), mean, scale, threshold)
+    always_left = _goes_left(_ordered_to_float64(high), mean, scale, threshold)
+
+    # Invariant: low goes left, high + 1 goes right
+    while True:
+        active = low < high
+        if not active.any():
+            break
+        # Upper midpoint without overflowing int64
+        mid = low // 2 + high // 2 + ((low % 2) | (high % 2))
+        left = _goes_left(_ordered_to_float64(mid), mean, scale, threshold)
+        low = np.where(active & left, mid, low)
+        high = np.where(active & ~left, mid - 1, high)
+
+    folded = _ordered_to_float64(low)
+    folded = np.where(never_left, -np.inf, folded)
+    folded = np.where(always_left, np.inf, folded)
+    return folded
+
+
+def flatten_forest(artifacts):
+    """
+    Flatten the forest and encoders from a joblib artifact dict into NumPy arrays.
+    Returns: dict of arrays suitable for CompiledForest
+    """
+    forest = artifacts['model']
+    scaler = artifacts['scaler']
+    label_encoders = artifacts['label_encoders']
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == TREE_LEAF
+        node_ids = np.arange(tree.node_count, dtype=np.int64) + offset
+
+        feature = np.where(is_leaf, 0, tree.feature).astype(np.int64)
+        mean = scaler.mean_[feature]
+        scale = scaler.scale_[feature]
+        threshold = fold_scaler_thresholds(tree.threshold, mean, scale)
+
+        features.append(feature)
+        # Leaves point back at themselves so a fixed number of steps always lands on them
+        thresholds.append(np.where(is_leaf, np.inf, threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        roots.append(offset)
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    compiled = {
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'max_depth': np.asarray(max_depth, dtype=np.int32),
+    }
+    for column in CATEGORICAL_FEATURES:
+        compiled[f'{column}_classes'] = np.asarray(label_encoders[column].classes_, dtype=str)
+    return compiled
+
+
+# Distinct unseen labels counted by name; later ones share OTHER_LABELS, since labels come from clients
+MAX_TRACKED_FALLBACKS = 1000
+OTHER_LABELS = '<other>'
+# Longer labels are counted under their prefix
+MAX_TRACKED_LABEL_LENGTH = 100
+
+
+def _normalize_label(label):
+    return str(label).strip().casefold()
+
+
+class CategoryIndex:
+    """
+    O(1) label -> code lookup for one categorical feature.
+
+    Exact labels are tried first, then a whitespace/case-normalized form.
+    Labels that still miss go to the model's UNKNOWN_CATEGORY code when it was
+    trained with one; otherwise the row cannot be priced. Every fallback is
+    counted per label so unseen brands/models show up in the metrics, up to
+    MAX_TRACKED_FALLBACKS distinct labels.
+    """
+
+    def __init__(self, classes):
+        self.classes = list(classes)
+        self.codes = {label: code for code, label in enumerate(self.classes)}
+        self.normalized_codes = {}
+        for code, label in enumerate(self.classes):
+            self.normalized_codes.setdefault(_normalize_label(label), code)
+        self.unknown_code = self.codes.get(UNKNOWN_CATEGORY)
+        self.fallbacks = Counter()
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, label):
+        """Returns: the code for label, the unknown code, or None"""
+        code = self.codes.get(label)
+        if code is None:
+            code = self.normalized_codes.get(_normalize_label(label))
+            if code is None:
+                code = self.unknown_code
+                key = str(label)[:MAX_TRACKED_LABEL_LENGTH]
+                with self._lock:
+                    if key not in self.fallbacks and len(self.fallbacks) >= MAX_TRACKED_FALLBACKS:
+                        key = OTHER_LABELS
+                    self.fallbacks[key] += 1
+        return code
+
+    def encode_many(self, labels):
+        """
+        Returns: (float64 codes, boolean mask of labels that have a code)
+        """
+        codes = np.empty(len(labels), dtype=np.float64)
+        known = np.ones(len(labels), dtype=bool)
+        for i, label in enumerate(labels):
+            code = self.lookup(label)
+            if code is None:
+                known[i] = False
+                code = 0
+            codes[i] = code
+        with self._lock:
+            self.lookups += len(labels)
+        return codes, known
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'fallbacks': sum(self.fallbacks.values()),
+                'has_unknown_bucket': self.unknown_code is not None,
+                'top_unseen': dict(self.fallbacks.most_common(10)),
+            }
+
+
+# Batches at least this large are scored by CompiledForest._predict_tree_at_a_time (see bench_price_model.py)
+TREE_AT_A_TIME_ROWS = 2000
+
+
+class CompiledForest:
+    """Pure-NumPy evaluator for a flattened price forest"""
+
+    def __init__(self, arrays):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.max_depth = int(arrays['max_depth'])
+        self.classes = {column: arrays[f'{column}_classes'] for column in CATEGORICAL_FEATURES}
+        self.category_index = {
+            column: CategoryIndex(classes.tolist()) for column, classes in self.classes.items()
+        }
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        return cls(flatten_forest(artifacts))
+
+    @classmethod
+    def load(cls, path=DEFAULT_COMPILED_PATH, mmap_mode=None):
+        """Load a compiled model directory, optionally memory-mapping the arrays"""
+        return cls({
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        })
+
+    def arrays(self):
+        arrays = {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'roots': self.roots,
+            'max_depth': np.asarray(self.max_depth, dtype=np.int32),
+        }
+        for column, classes in self.classes.items():
+            arrays[f'{column}_classes'] = classes
+        return arrays
+
+    def save(self, path=DEFAULT_COMPILED_PATH):
+        """Write the arrays to a sibling directory first, then swap it into place"""
+        staging = f'{path}.tmp-{os.getpid()}'
+        os.makedirs(staging, exist_ok=True)
+        for name, array in self.arrays().items():
+            np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array))
+
+        previous = None
+        if os.path.exists(path):
+            previous = f'{path}.old-{os.getpid()}'
+            os.rename(path, previous)
+        os.rename(staging, path)
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays().values())
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def encode(self, rows):
+        """
+        Encode feature dicts into a raw float64 matrix in FEATURE_ORDER
+        Returns: (matrix of the known rows, boolean mask of known rows)
+        """
+        known = np.ones(len(rows), dtype=bool)
+        X = np.empty((len(rows), len(FEATURE_ORDER)), dtype=np.float64)
+        for j, column in enumerate(FEATURE_ORDER):
+            if column in self.category_index:
+                X[:, j], column_known = self.category_index[column].encode_many([row[column] for row in rows])
+                known &= column_known
+            else:
+                X[:, j] = [row[column] for row in rows]
+        return X[known], known
+
+    def category_stats(self):
+        return {column: index.stats() for column, index in self.category_index.items()}
+
+    def predict(self, X):
+        """Predict prices for a raw (unscaled) feature matrix"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[0] >= TREE_AT_A_TIME_ROWS:
+            return self._predict_tree_at_a_time(X)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            goes_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(goes_left, self.left[nodes], self.right[nodes])
+        # Sum trees in order, exactly as RandomForestRegressor accumulates them
+        leaf_values = self.value[nodes]
+        total = np.cumsum(leaf_values, axis=1)[:, -1]
+        return total / self.n_trees
+
+    def _predict_tree_at_a_time(self, X):
+        """Walk one tree at a time so the working set stays small for large batches"""
+        n_rows, n_features = X.shape
+        flat = np.ascontiguousarray(X).ravel()
+        offsets = np.arange(n_rows, dtype=np.intp) * n_features
+        # children[2 * node + goes_left] picks the next node without np.where
+        children = np.stack([self.right, self.left], axis=1).ravel().astype(np.intp)
+        feature = self.feature.astype(np.intp)
+        total = np.zeros(n_rows, dtype=np.float64)
+        for root in self.roots:
+            nodes = np.full(n_rows, root, dtype=np.intp)
+            for _ in range(self.max_depth):
+                goes_left = flat.take(offsets + feature.take(nodes)) <= self.threshold.take(nodes)
+                nodes = children.take(2 * nodes + goes_left)
+            # Adding tree by tree keeps the same summation order as the batched path
+            total += self.value.take(nodes)
+        return total / self.n_trees
+
+    def predict_one(self, row):
+        """Predict the price of a single feature dict, None if a category is unknown"""
+        X, known = self.encode([row])
+        if not known[0]:
+            return None
+        return float(self.predict(X)[0])
+
+
+def reference_predictions(artifacts, X_raw):
+    """Predictions of the original sklearn model for raw feature rows"""
+    return artifacts['model'].predict(artifacts['scaler'].transform(X_raw))
+
+
+def count_mismatches(expected, actual):
+    """Number of predictions that are not bit-identical"""
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    return int(np.count_nonzero(expected.view(np.int64) != actual.view(np.int64)))
+
+
+def check_parity(artifacts, compiled, X_raw):
+    """
+    Compare the compiled forest against the joblib model on raw feature rows.
+    Returns: number of rows whose predictions are not bit-identical
+    """
+    return count_mismatches(reference_predictions(artifacts, X_raw), compiled.predict(X_raw))
+
+
+def load_dataset(artifacts, data_path=DEFAULT_DATA_PATH):
+    """
+    Encode the training CSV with the artifact's label encoders.
+    Returns: (raw feature matrix in FEATURE_ORDER, price vector)
+    """
+    import pandas as pd
+
+    df = pd.read_csv(data_path)
+    encoders = artifacts['label_encoders']
+    X_raw = np.column_stack([
+        encoders['brand'].transform(df['Brand']),
+        encoders['model'].transform(df['Model']),
+        df['Year'],
+        df['Engine_CC'],
+        df['KM_Driven'],
+        df['Mileage_KMPL'],
+        encoders['condition'].transform(df['Condition']),
+    ]).astype(np.float64)
+    return X_raw, df['Price'].to_numpy(dtype=np.float64)
+
+
+def parity_rows(artifacts, compiled, data_path=DEFAULT_DATA_PATH):
+    """
+    Build rows for the parity check: the training data plus, for every split,
+    rows sitting exactly on the folded threshold and just past it.
+    """
+    base, _ = load_dataset(artifacts, data_path)
+
+    splits = np.isfinite(compiled.threshold)
+    split_features = compiled.feature[splits]
+    split_thresholds = compiled.threshold[splits]
+    edges = np.repeat(base[:1], 2 * len(split_thresholds), axis=0)
+    edges[0::2, :][np.arange(len(split_thresholds)), split_features] = split_thresholds
+    edges[1::2, :][np.arange(len(split_thresholds)), split_features] = np.nextafter(split_thresholds, np.inf)
+    return np.vstack([base, edges])
+
+
+def export(model_path=DEFAULT_MODEL_PATH, output_path=DEFAULT_COMPILED_PATH, data_path=DEFAULT_DATA_PATH):
+    """Compile the joblib model, verify parity and write the compiled model directory"""
+    import joblib
+
+    start = time.perf_counter()
+    artifacts = joblib.load(model_path)
+    compiled = CompiledForest.from_artifacts(artifacts)
+    print(f"Compiled {compiled.n_trees} trees ({compiled.node_count} nodes) in {time.perf_counter() - start:.2f}s")
+
+    X_raw = parity_rows(artifacts, compiled, data_path)
+    mismatches = check_parity(artifacts, compiled, X_raw)
+    if mismatches:
+        raise ValueError(f"Compiled model disagrees with {model_path} on {mismatches} of {len(X_raw)} rows")
+    print(f"Parity check passed on {len(X_raw)} rows")
+
+    compiled.save(output_path)
+    print(f"Compiled model saved to {output_path}")
+    return compiled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bike price model inference engine')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Flatten the joblib model into NumPy arrays')
+    export_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    export_parser.add_argument('--output', default=DEFAULT_COMPILED_PATH)
+    export_parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        export(args.model, args.output, args.data)
+
+
+if __name__ == '__main__':
+    main()
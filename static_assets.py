@@ -0,0 +1,190 @@
+"""
+Cache-friendly serving of files under static/.
+
+URLs built with StaticFiles.url() never change while the file stays the
+same. A content-addressed photo and its renditions (see image_store.py) are
+already named by the photo's hash and are used as-is. Any other file gets a fingerprint of its contents
+spliced into the name:
+
+    css/style.css  ->  /static/css/style.3fa2b1c4d5e6.css
+
+A request for a URL with the current fingerprint is answered with a
+one-year "immutable" Cache-Control, so browsers never revalidate it. Every
+other request must revalidate, which is cheap: each response carries a
+strong ETag (the content hash), and send_file answers If-None-Match with 304
+and Range requests with 206.
+
+Text assets can be compressed ahead of time with compress() ('flask
+compress-static'). Clients that accept br or gzip then get the .br or .gz
+file next to the original, with no compression per request. A copy older
+than its original is ignored until compress() runs again.
+
+With sendfile='x-sendfile' or 'x-accel-redirect', the app only decides
+headers and a front proxy (Apache/lighttpd or nginx) sends the bytes.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+from image_store import HASH_CHUNK_SIZE, is_content_url, is_stored_file
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Extensions worth storing precompressed copies of
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+# Content-Encoding -> suffix of the precompressed file, in order of preference
+PRECOMPRESSED = [('br', '.br'), ('gzip', '.gz')]
+
+_FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<fingerprint>[0-9a-f]{%d})(?P<extension>\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class StaticFiles:
+    """Fingerprinted URLs and conditional responses for one static directory"""
+
+    def __init__(self, root, sendfile=None, accel_prefix='/protected-static/'):
+        self.root = root
+        if sendfile not in (None, 'x-sendfile', 'x-accel-redirect'):
+            raise ValueError(f"Unknown sendfile mode: {sendfile}")
+        self.sendfile = sendfile
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+        # path -> (mtime_ns, size, hex digest)
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        path = safe_join(self.root, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
+
+    def digest(self, path):
+        """SHA-256 of a file, recomputed only when its mtime or size changes"""
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        with self._lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def url(self, filename):
+        """Cacheable URL for a file under the static directory"""
+        filename = filename.replace('\\', '/')
+        if is_stored_file(filename):
+            return '/static/' + filename
+        path = self._path(filename)
+        if path is None:
+            return '/static/' + filename
+        stem, extension = os.path.splitext(filename)
+        return f"/static/{stem}.{self.digest(path)[:FINGERPRINT_LENGTH]}{extension}"
+
+    def _resolve(self, filename):
+        """
+        Map a requested name to a file.
+        Returns: (path, immutable) where immutable says the URL pins the current contents
+        """
+        path = self._path(filename)
+        if path is not None:
+            return path, is_stored_file(filename)
+        match = _FINGERPRINTED.match(filename)
+        if match:
+            path = self._path(match.group('stem') + match.group('extension'))
+            if path is not None:
+                # An outdated fingerprint still gets the current file, but only with revalidation
+                return path, self.digest(path).startswith(match.group('fingerprint'))
+        raise NotFound()
+
+    def _precompressed(self, path):
+        if os.path.splitext(path)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return None, None
+        accepted = request.accept_encodings
+        for encoding, suffix in PRECOMPRESSED:
+            # A copy older than the original was compressed from an earlier version of it
+            if accepted[encoding] and os.path.isfile(path + suffix) \
+                    and os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+                return encoding, path + suffix
+        return None, None
+
+    def serve(self, filename):
+        """Response for GET /static/<filename>"""
+        path, immutable = self._resolve(filename.replace('\\', '/'))
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        encoding, encoded_path = self._precompressed(path)
+        served_path = encoded_path or path
+        # The content hash is a strong validator; each encoding is a different representation
+        digest = os.path.basename(filename).split('.')[0] if is_content_url(filename) else self.digest(served_path)
+        etag = f"{digest}-{encoding}" if encoding else digest
+
+        if self.sendfile == 'x-accel-redirect':
+            response = Response(mimetype=mimetype)
+            relative = os.path.relpath(served_path, self.root).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + relative
+            response.set_etag(etag)
+            response.last_modified = os.path.getmtime(served_path)
+            # 304 for a matching If-None-Match; nginx handles Range itself
+            response = response.make_conditional(request)
+        else:
+            # send_file answers If-None-Match with 304 and Range with 206,
+            # and emits X-Sendfile itself when the app has USE_X_SENDFILE set
+            response = send_file(served_path, mimetype=mimetype, etag=etag, conditional=True)
+
+        if encoding and response.status_code != 304:
+            response.headers['Content-Encoding'] = encoding
+        if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        if immutable:
+            # send_file marks responses no-cache when the app sets no max age
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    def compress(self, extensions=COMPRESSIBLE_EXTENSIONS):
+        """
+        Write .gz (and, with the brotli package, .br) copies of text assets that are missing or out of date.
+        Returns: number of files written
+        """
+        written = 0
+        for directory, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(directory, name)
+                if os.path.splitext(name)[1] not in extensions:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                encoders = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    encoders.append(('.br', lambda data: brotli.compress(data, quality=11)))
+                for suffix, encode in encoders:
+                    target = path + suffix
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    encoded = encode(data)
+                    if len(encoded) >= len(data):
+                        continue
+                    with open(target + '.tmp', 'wb') as f:
+                        f.write(encoded)
+                    os.replace(target + '.tmp', target)
+                    written += 1
+        return written
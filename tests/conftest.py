@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the app's flat top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py imported against a fresh SQLite database created from the models"""
+    tmp = tmp_path_factory.mktemp('app')
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{tmp / 'bikerental.db'}",
+        EMAIL_OUTBOX_PATH=str(tmp / 'email_outbox.db'),
+        LOCK_FOLDER=str(tmp / 'locks'),
+        IMAGE_WORKERS='0',
+    )
+    os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/')
+    import app
+
+    with app.app.app_context():
+        app.db.create_all()
+    return app
+
+
+class FakeCursor(list):
+    """The slice of pymongo's Cursor the search views use; documents come back in insertion order"""
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, count):
+        return FakeCursor(self[:count])
+
+    def batch_size(self, size):
+        return self
+
+
+class FakeCollection:
+    """Stands in for the Mongo bikes collection: find() ignores the filter and returns every document"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self.documents)
+
+
+@pytest.fixture
+def fake_bikes_collection(app_module, monkeypatch):
+    """Install a FakeCollection as app.bikes_collection; call it with the documents to serve"""
+    def install(documents):
+        collection = FakeCollection(documents)
+        monkeypatch.setattr(app_module, 'bikes_collection', collection)
+        return collection
+    return install
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+import bike_search
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine('sqlite://')
+    with engine.connect() as connection:
+        # Only the columns search() reads; year is nullable as on databases created before the constraint
+        connection.execute(text(
+            'CREATE TABLE bike (id INTEGER PRIMARY KEY, brand TEXT, condition TEXT, listing_type TEXT, '
+            'year INTEGER, is_available BOOLEAN, created_at DATETIME)'
+        ))
+        connection.execute(text(
+            "INSERT INTO bike VALUES (:id, 'Honda', 'Good', 'rent', :year, 1, :created_at)"
+        ), [{'id': 1, 'year': 2008, 'created_at': '2024-01-01'},
+            {'id': 2, 'year': None, 'created_at': '2024-01-02'},
+            {'id': 3, 'year': 2021, 'created_at': '2024-01-03'}])
+        yield connection
+
+
+@pytest.mark.parametrize('year, label', [
+    (2009, 'before 2010'), (2010, '2010-2014'), (2019, '2015-2019'), (2020, '2020 and later'), (None, None),
+])
+def test_year_bucket(year, label):
+    assert bike_search.year_bucket(year) == label
+
+
+def test_search_counts_bikes_without_a_year(connection):
+    result = bike_search.search(connection)
+    assert result['total'] == 3
+    assert result['ids'] == [3, 2, 1]
+    assert dict(result['facets']['year']) == {'before 2010': 1, '2020 and later': 1, None: 1}
+
+
+def test_year_filter_skips_bikes_without_a_year(connection):
+    assert bike_search.search(connection, year='2020 and later')['ids'] == [3]
+
+
+@pytest.fixture
+def catalog():
+    engine = create_engine('sqlite://')
+    with engine.connect() as connection:
+        connection.execute(text(
+            'CREATE TABLE bike (id INTEGER PRIMARY KEY, brand TEXT, model TEXT, description TEXT, condition TEXT, '
+            'listing_type TEXT, year INTEGER, is_available BOOLEAN, created_at DATETIME)'
+        ))
+        assert bike_search.ensure_search_index(connection)
+        assert not bike_search.ensure_search_index(connection)
+        connection.execute(text(
+            "INSERT INTO bike VALUES (:id, :brand, 'Model', 'A bike', :condition, 'sale', :year, 1, :created_at)"
+        ), [{'id': i, 'brand': 'Honda' if i % 3 else 'Yamaha', 'condition': 'Good' if i % 2 else 'Fair',
+             'year': 2005 + i, 'created_at': f'2024-01-{i:02d}'} for i in range(1, 13)])
+        yield connection
+
+
+def test_search_pages_and_counts_facets_over_all_matches(catalog):
+    result = bike_search.search(catalog, query='hond', limit=3, offset=2)
+    # Honda is every bike whose id is not a multiple of 3, newest first
+    assert result['ids'] == [8, 7, 5]
+    assert result['total'] == 8
+    facets = {facet: dict(counts) for facet, counts in result['facets'].items()}
+    assert facets['brand'] == {'Honda': 8}
+    assert facets['condition'] == {'Good': 4, 'Fair': 4}
+    assert facets['year'] == {'before 2010': 3, '2010-2014': 3, '2015-2019': 2}
+
+
+def test_ensure_search_index_restores_missing_triggers(catalog):
+    catalog.execute(text('DROP TRIGGER bike_search_insert'))
+    assert not bike_search.search_index_exists(catalog)
+    assert bike_search.ensure_search_index(catalog)
+    catalog.execute(text(
+        "INSERT INTO bike VALUES (13, 'Suzuki', 'Access', 'Scooter', 'Good', 'rent', 2022, 1, '2024-02-01')"
+    ))
+    assert bike_search.search(catalog, query='suzuki')['ids'] == [13]
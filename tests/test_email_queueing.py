@@ -0,0 +1,39 @@
+"""Emails about a transaction reach the outbox only if the transaction commits"""
+import pytest
+
+
+@pytest.fixture
+def queued(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAIL_USERNAME', 'shop@example.com')
+    monkeypatch.setitem(app_module.app.config, 'MAIL_PASSWORD', 'secret')
+    monkeypatch.setitem(app_module.app.config, 'MAIL_SERVER', 'localhost')
+    messages = []
+    monkeypatch.setattr(app_module.email_outbox, 'enqueue_many', messages.extend)
+    return messages
+
+
+def test_after_commit_emails_wait_for_the_commit(app_module, queued):
+    with app_module.app.app_context():
+        assert app_module.send_email('buyer@example.com', 'Accepted', 'Your offer was accepted', after_commit=True)
+        assert queued == []
+        app_module.db.session.commit()
+    assert [message['recipients'] for message in queued] == [['buyer@example.com']]
+
+
+def test_after_commit_emails_are_dropped_on_rollback(app_module, queued):
+    with app_module.app.app_context():
+        app_module.send_bulk_template_email(
+            'email/purchase_rejected.txt',
+            [('buyer@example.com', 'Rejected', {'buyer': {'username': 'buyer'}})],
+            bike={'brand': 'Honda', 'model': 'Shine'},
+            after_commit=True
+        )
+        app_module.db.session.rollback()
+        app_module.db.session.commit()
+    assert queued == []
+
+
+def test_emails_without_after_commit_are_queued_at_once(app_module, queued):
+    with app_module.app.app_context():
+        app_module.send_email('buyer@example.com', 'Hello', 'Hi')
+        assert len(queued) == 1
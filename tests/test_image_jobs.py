@@ -0,0 +1,80 @@
+"""Recovery of uploads left pending by a process that died mid-job"""
+import io
+import os
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from PIL import Image
+
+from image_jobs import ImageJobQueue, _render_job, final_url, pending_url
+from image_store import content_url, hash_file
+
+
+@pytest.fixture
+def queue_env(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'jobs.db'}",
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db = SQLAlchemy(app)
+
+    class Bike(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        image_url_1 = db.Column(db.String(200))
+        image_url_2 = db.Column(db.String(200))
+        image_url_3 = db.Column(db.String(200))
+
+    with app.app_context():
+        db.create_all()
+    static_folder = str(tmp_path / 'static')
+    swaps = []
+
+    def new_queue():
+        return ImageJobQueue(app, db, Bike, static_folder, workers=0,
+                             on_swap=lambda session, bike_id, image_url: swaps.append((bike_id, image_url)))
+
+    return app, db, Bike, static_folder, new_queue, swaps
+
+
+def stage_upload(static_folder):
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'orange').save(buffer, 'JPEG')
+    staged = os.path.join(static_folder, 'upload.tmp')
+    with open(staged, 'wb') as f:
+        f.write(buffer.getvalue())
+    image_url = pending_url(content_url(hash_file(staged), 'jpg'), 'a1b2c3')
+    os.replace(staged, os.path.join(static_folder, image_url))
+    return image_url
+
+
+def test_recover_swaps_upload_published_before_a_crash(queue_env):
+    app, db, Bike, static_folder, new_queue, swaps = queue_env
+    new_queue()
+    image_url = stage_upload(static_folder)
+    with app.app_context():
+        db.session.add(Bike(id=1, image_url_1=image_url))
+        db.session.commit()
+
+    # The worker published the original, then the parent died before swapping the row
+    _render_job(static_folder, image_url)
+    assert not os.path.exists(os.path.join(static_folder, image_url))
+
+    assert new_queue().recover() == 1
+    with app.app_context():
+        assert Bike.query.get(1).image_url_1 == final_url(image_url)
+    assert swaps == [(1, final_url(image_url))]
+
+
+def test_recover_skips_upload_whose_files_are_gone(queue_env):
+    app, db, Bike, static_folder, new_queue, swaps = queue_env
+    new_queue()
+    image_url = stage_upload(static_folder)
+    os.remove(os.path.join(static_folder, image_url))
+    with app.app_context():
+        db.session.add(Bike(id=1, image_url_1=image_url))
+        db.session.commit()
+
+    assert new_queue().recover() == 0
+    with app.app_context():
+        assert Bike.query.get(1).image_url_1 == image_url
+    assert swaps == []
@@ -0,0 +1,36 @@
+import joblib
+import pytest
+
+from model_registry import ModelStore
+from price_engine import DEFAULT_MODEL_PATH
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    store = ModelStore(tmp_path_factory.mktemp('price'))
+    artifacts = joblib.load(DEFAULT_MODEL_PATH)
+    store.publish(artifacts, version='good')
+    # No model meets a zero latency budget, so this version fails its checks and stays inactive
+    store.publish(artifacts, version='too_slow', max_latency_ms=0.0)
+    return store
+
+
+def test_failed_version_is_not_activated(store):
+    assert store.read_manifest('too_slow')['checks_passed'] is False
+    assert store.current_version() == 'good'
+    with pytest.raises(ValueError, match='failed its publish checks'):
+        store.activate('too_slow')
+    assert store.current_version() == 'good'
+
+
+def test_failed_version_is_activated_with_force_but_not_rolled_back_to(store):
+    store.activate('too_slow', force=True)
+    store.activate('good')
+    assert store.current_version() == 'good'
+
+    with pytest.raises(ValueError, match='failed its publish checks'):
+        store.rollback()
+    assert store.current_version() == 'good'
+
+    assert store.rollback(force=True) == 'too_slow'
+    assert store.current_version() == 'too_slow'
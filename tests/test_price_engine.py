@@ -0,0 +1,68 @@
+import joblib
+import numpy as np
+import pytest
+
+from price_engine import (
+    DEFAULT_MODEL_PATH, MAX_TRACKED_FALLBACKS, OTHER_LABELS, TREE_AT_A_TIME_ROWS, CategoryIndex, CompiledForest,
+    parity_rows, reference_predictions
+)
+
+
+@pytest.fixture(scope='module')
+def artifacts():
+    return joblib.load(DEFAULT_MODEL_PATH)
+
+
+@pytest.fixture(scope='module')
+def compiled(artifacts):
+    return CompiledForest.from_artifacts(artifacts)
+
+
+@pytest.fixture(scope='module')
+def rows(artifacts, compiled):
+    return parity_rows(artifacts, compiled)
+
+
+def assert_bit_identical(expected, actual):
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    assert expected.shape == actual.shape
+    mismatches = np.flatnonzero(expected.view(np.int64) != actual.view(np.int64))
+    assert mismatches.size == 0, f"{mismatches.size} of {len(expected)} predictions differ, first at row {mismatches[0]}"
+
+
+def test_parity_rows_cover_every_split(compiled, rows):
+    assert len(rows) >= 2 * np.isfinite(compiled.threshold).sum()
+
+
+def test_compiled_forest_matches_joblib_model(artifacts, compiled, rows):
+    assert len(rows) >= TREE_AT_A_TIME_ROWS
+    assert_bit_identical(reference_predictions(artifacts, rows), compiled.predict(rows))
+
+
+def test_small_batches_match_joblib_model(artifacts, compiled, rows):
+    # Batches below TREE_AT_A_TIME_ROWS take the broadcast path
+    expected = reference_predictions(artifacts, rows)
+    for start in range(0, len(rows), TREE_AT_A_TIME_ROWS // 2):
+        batch = rows[start:start + TREE_AT_A_TIME_ROWS // 2]
+        assert_bit_identical(expected[start:start + len(batch)], compiled.predict(batch))
+
+
+def test_saved_model_matches_joblib_model(artifacts, compiled, rows, tmp_path):
+    path = str(tmp_path / 'compiled')
+    compiled.save(path)
+    loaded = CompiledForest.load(path, mmap_mode='r')
+    assert_bit_identical(reference_predictions(artifacts, rows), loaded.predict(rows))
+
+
+def test_unseen_labels_are_tracked_up_to_a_cap():
+    index = CategoryIndex(['Honda', 'Yamaha'])
+    labels = [f'brand-{i}' for i in range(MAX_TRACKED_FALLBACKS + 50)]
+    index.encode_many(labels + ['brand-0', ' honda '])
+
+    stats = index.stats()
+    assert stats['lookups'] == len(labels) + 2
+    assert stats['fallbacks'] == len(labels) + 1
+    assert len(index.fallbacks) == MAX_TRACKED_FALLBACKS + 1
+    assert index.fallbacks['brand-0'] == 2
+    assert index.fallbacks[OTHER_LABELS] == 50
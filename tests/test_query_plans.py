@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import inspect, text
+
+
+@pytest.fixture
+def query_plans(app_module):
+    """check_query_plans imports app, so it is loaded after app_module has configured the test database"""
+    import check_query_plans
+
+    with app_module.app.app_context():
+        yield check_query_plans
+
+
+def index_names(db):
+    inspector = inspect(db.engine)
+    return {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+
+
+def test_hot_queries_use_an_index(app_module, query_plans):
+    for name, query in query_plans.hot_queries():
+        plan = query_plans.query_plan(query)
+        assert not query_plans.full_scans(plan), f"{name} does a full table scan: {plan}"
+
+
+def test_migration_manages_only_its_own_indexes(app_module, query_plans):
+    from migrations import add_hot_query_indexes
+
+    db = app_module.db
+    with db.engine.begin() as connection:
+        connection.execute(text('CREATE INDEX ix_other_migration ON bike (brand)'))
+    try:
+        add_hot_query_indexes.downgrade()
+        remaining = index_names(db)
+        assert not remaining & set(add_hot_query_indexes.INDEX_NAMES)
+        assert 'ix_other_migration' in remaining
+        assert query_plans.check_query_plans(verbose=False), 'expected full scans without the indexes'
+
+        add_hot_query_indexes.upgrade()
+        assert set(add_hot_query_indexes.INDEX_NAMES) <= index_names(db)
+        assert query_plans.check_query_plans(verbose=False) == []
+    finally:
+        add_hot_query_indexes.upgrade()
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX IF EXISTS ix_other_migration'))
@@ -0,0 +1,98 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def owners(app_module):
+    """Ten users to own the search results"""
+    app, db, User = app_module.app, app_module.db, app_module.User
+    with app.app_context():
+        db.session.execute(User.__table__.delete())
+        db.session.execute(User.__table__.insert(), [
+            {'id': user_id, 'username': f'owner{user_id}', 'email': f'owner{user_id}@example.com',
+             'password_hash': 'x'}
+            for user_id in range(1, 11)
+        ])
+        db.session.commit()
+    return list(range(1, 11))
+
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    # The first request also runs the before_first_request start-up queries
+    client.get('/api/image-jobs/metrics')
+    return client
+
+
+@pytest.fixture
+def count_queries(app_module):
+    """Count SQL statements issued by this thread (background workers share the engine)"""
+    counts = []
+    thread = threading.get_ident()
+
+    def before_cursor_execute(*args):
+        if threading.get_ident() == thread:
+            counts[-1] += 1
+
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+    def run(call):
+        counts.append(0)
+        result = call()
+        return result, counts[-1]
+
+    yield run
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def bike_documents(count, owners):
+    now = datetime.utcnow()
+    return [
+        {
+            'sql_id': count - i,
+            'brand': 'Honda', 'model': 'Shine', 'year': 2020, 'condition': 'Good',
+            'listing_type': 'rent', 'price_per_day': 500.0, 'sale_price': None, 'is_available': True,
+            'owner_id': owners[i % len(owners)],
+            'images': [], 'metadata': {'views': 0, 'favorites': 0},
+            'created_at': now - timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def test_search_resolves_owners_in_one_query(app_module, client, owners, fake_bikes_collection, count_queries):
+    query_counts = {}
+    for result_count in (1, 10, 100):
+        fake_bikes_collection(bike_documents(result_count, owners))
+        response, query_counts[result_count] = count_queries(
+            lambda: client.get(f'/api/bikes/search?limit={result_count}')
+        )
+        assert response.status_code == 200
+        bikes = response.get_json()['bikes']
+        assert len(bikes) == result_count
+        assert all(bike['owner']['username'] == f"owner{bike['owner']['id']}" for bike in bikes)
+    assert query_counts == {1: 1, 10: 1, 100: 1}
+
+
+def test_search_without_owner_field_runs_no_query(app_module, client, owners, fake_bikes_collection, count_queries):
+    fake_bikes_collection(bike_documents(50, owners))
+    response, query_count = count_queries(lambda: client.get('/api/bikes/search?limit=50&fields=id,brand'))
+    assert response.status_code == 200
+    assert query_count == 0
+
+
+def test_ndjson_export_runs_one_query_per_batch(app_module, client, owners, fake_bikes_collection, count_queries):
+    batch_size = app_module.STREAM_BATCH_SIZE
+    for result_count in (batch_size, 3 * batch_size):
+        fake_bikes_collection(bike_documents(result_count, owners))
+        lines, query_count = count_queries(
+            lambda: client.get('/api/bikes/search?format=ndjson').get_data(as_text=True).splitlines()
+        )
+        assert len(lines) == result_count
+        assert query_count == result_count // batch_size
@@ -0,0 +1,114 @@
+"""Fingerprinted URLs, conditional and range responses, and precompressed copies of static files"""
+import glob
+import gzip
+import hashlib
+import os
+import re
+
+import pytest
+from flask import Flask
+
+from static_assets import FINGERPRINT_LENGTH, IMMUTABLE_MAX_AGE, StaticFiles
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+
+@pytest.fixture
+def static(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'style.css').write_text('body { color: red; }\n' * 50)
+    files = StaticFiles(str(tmp_path))
+    assert files.compress()
+    return files, tmp_path / 'css' / 'style.css'
+
+
+def get(files, filename, headers=None):
+    app = Flask(__name__)
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip'} if headers is None else headers):
+        response = files.serve(filename)
+        response.direct_passthrough = False
+        return response
+
+
+def served_name(files, filename):
+    return files.url(filename)[len('/static/'):]
+
+
+def test_url_carries_a_fingerprint_of_the_contents(static):
+    files, path = static
+    fingerprint = hashlib.sha256(path.read_bytes()).hexdigest()[:FINGERPRINT_LENGTH]
+    assert files.url('css/style.css') == f'/static/css/style.{fingerprint}.css'
+
+    path.write_text('body { color: blue; }\n' * 50)
+    assert files.url('css/style.css') != f'/static/css/style.{fingerprint}.css'
+    # Missing files and stored photos keep their names
+    assert files.url('css/missing.css') == '/static/css/missing.css'
+    stored = 'bike_images/ab/cd/' + 'abcd' * 16 + '.jpg'
+    assert files.url(stored) == '/static/' + stored
+
+
+def test_current_fingerprint_is_immutable_and_others_revalidate(static):
+    files, path = static
+    current = get(files, served_name(files, 'css/style.css'))
+    assert current.cache_control.immutable
+    assert current.cache_control.max_age == IMMUTABLE_MAX_AGE
+
+    outdated = get(files, 'css/style.000000000000.css')
+    assert outdated.status_code == 200
+    assert outdated.cache_control.no_cache
+    assert not outdated.cache_control.immutable
+    assert get(files, 'css/style.css').cache_control.no_cache
+
+
+def test_matching_if_none_match_gets_304(static):
+    files, path = static
+    name = served_name(files, 'css/style.css')
+    etag = get(files, name).headers['ETag']
+
+    response = get(files, name, {'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    # The gzip copy and the plain file are different representations
+    assert get(files, name, {'If-None-Match': etag}).status_code == 200
+
+
+def test_range_request_gets_206(static):
+    files, path = static
+    response = get(files, served_name(files, 'css/style.css'), {'Range': 'bytes=5-9'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 5-9/{path.stat().st_size}'
+    assert response.get_data() == path.read_bytes()[5:10]
+
+
+def test_fresh_copy_is_served(static):
+    files, path = static
+    response = get(files, served_name(files, 'css/style.css'))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == path.read_bytes()
+
+
+def test_copy_older_than_original_is_ignored(static):
+    files, path = static
+    path.write_text('body { color: blue; }\n' * 50)
+    # Edited after compress-static ran
+    stat = os.stat(path)
+    os.utime(f'{path}.gz', ns=(stat.st_atime_ns, stat.st_mtime_ns - 1_000_000_000))
+
+    response = get(files, served_name(files, 'css/style.css'))
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data() == path.read_bytes()
+
+    assert files.compress()
+    response = get(files, served_name(files, 'css/style.css'))
+    assert gzip.decompress(response.get_data()) == path.read_bytes()
+
+
+def test_templates_reference_static_files_through_static_url():
+    # Literal /static/ paths and url_for('static') would bypass the fingerprint
+    bypass = re.compile(r'''(?:src|href)\s*=\s*["'](?:/static/|\{\{\s*url_for\(\s*['"]static['"])''')
+    offenders = []
+    for template in glob.glob(os.path.join(TEMPLATES_DIR, '**', '*.html'), recursive=True):
+        with open(template) as f:
+            for number, line in enumerate(f, start=1):
+                if bypass.search(line):
+                    offenders.append(f'{os.path.relpath(template, TEMPLATES_DIR)}:{number}')
+    assert offenders == []
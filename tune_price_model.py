@@ -0,0 +1,261 @@
+"""
+Hyperparameter search for the bike price model.
+
+Runs a parallel random search over RandomForest settings and alternative
+regressors (ExtraTrees, HistGradientBoosting). The encoded and scaled fold
+matrices are built once and cached on disk with joblib.Memory, so repeated
+runs and every candidate reuse them. The best candidates are refit on the
+training split and timed at serving batch sizes, so the choice can weigh
+R²/MAE against per-row inference latency.
+
+Usage:
+    python tune_price_model.py [--candidates 40] [--folds 5] [--n-jobs -1]
+                               [--max-latency-ms 1.0] [--output tuning_results.json]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import joblib
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, ParameterSampler, train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from bike_price_model import FOREST_PARAMS, encode_features, load_data
+from price_engine import BASE_DIR, DEFAULT_DATA_PATH, CompiledForest
+
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, '.cache', 'price_tuning')
+
+# Search spaces per estimator family
+SEARCH_SPACES = {
+    'random_forest': (RandomForestRegressor, {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [6, 8, 10, 12, 16],
+        'min_samples_split': [2, 5, 10],
+        'min_samples_leaf': [1, 2, 4, 8],
+        'max_features': [1.0, 0.7, 0.5, 'sqrt'],
+    }),
+    'extra_trees': (ExtraTreesRegressor, {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [6, 8, 10, 12, 16],
+        'min_samples_leaf': [1, 2, 4, 8],
+        'max_features': [1.0, 0.7, 0.5],
+    }),
+    'hist_gradient_boosting': (HistGradientBoostingRegressor, {
+        'max_iter': [50, 100, 200, 400],
+        'learning_rate': [0.03, 0.05, 0.1, 0.2],
+        'max_leaf_nodes': [7, 15, 31, 63],
+        'min_samples_leaf': [10, 20, 40],
+        'l2_regularization': [0.0, 0.1, 1.0],
+    }),
+}
+
+# Forest families that the compiled NumPy engine can serve
+COMPILABLE = {'random_forest', 'extra_trees'}
+
+
+def _build_folds(data_path, data_mtime, n_folds, random_state):
+    """
+    Encode the dataset and scale every CV fold once.
+    data_mtime is only part of the cache key, so an edited CSV rebuilds the cache.
+    Returns: dict with the train/test split and a list of scaled fold matrices
+    """
+    df = load_data(data_path)
+    X, y, label_encoders = encode_features(df)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, X_test = X_train.to_numpy(dtype=np.float64), X_test.to_numpy(dtype=np.float64)
+    y_train, y_test = y_train.to_numpy(dtype=np.float64), y_test.to_numpy(dtype=np.float64)
+
+    folds = []
+    for train_index, val_index in KFold(n_folds, shuffle=True, random_state=random_state).split(X_train):
+        scaler = StandardScaler().fit(X_train[train_index])
+        folds.append((
+            scaler.transform(X_train[train_index]), y_train[train_index],
+            scaler.transform(X_train[val_index]), y_train[val_index],
+        ))
+
+    scaler = StandardScaler().fit(X_train)
+    return {
+        'folds': folds,
+        'X_train': scaler.transform(X_train),
+        'y_train': y_train,
+        'X_test': scaler.transform(X_test),
+        'y_test': y_test,
+        'scaler': scaler,
+        'label_encoders': label_encoders,
+    }
+
+
+def load_folds(data_path=DEFAULT_DATA_PATH, n_folds=5, random_state=42, cache_dir=DEFAULT_CACHE_DIR):
+    memory = joblib.Memory(cache_dir, verbose=0)
+    return memory.cache(_build_folds)(os.path.abspath(data_path), os.path.getmtime(data_path), n_folds, random_state)
+
+
+def sample_candidates(n_candidates, random_state=42, families=None):
+    """Random draws from each family's search space, plus the current production settings"""
+    families = families or list(SEARCH_SPACES)
+    candidates = [{'family': 'random_forest', 'params': {k: v for k, v in FOREST_PARAMS.items() if k != 'random_state'},
+                   'baseline': True}]
+    per_family = max(1, n_candidates // len(families))
+    for family in families:
+        _, space = SEARCH_SPACES[family]
+        for params in ParameterSampler(space, per_family, random_state=random_state):
+            candidates.append({'family': family, 'params': params, 'baseline': False})
+    return candidates
+
+
+def make_estimator(candidate, n_jobs=1):
+    estimator_class, _ = SEARCH_SPACES[candidate['family']]
+    estimator = estimator_class(random_state=42, **candidate['params'])
+    if 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+    return estimator
+
+
+def _score_fold(candidate, fold):
+    X_train, y_train, X_val, y_val = fold
+    start = time.perf_counter()
+    estimator = make_estimator(candidate).fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    y_pred = estimator.predict(X_val)
+    return r2_score(y_val, y_pred), mean_absolute_error(y_val, y_pred), fit_seconds
+
+
+def _median_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def measure_serving_latency(estimator, candidate, data, repeats=30):
+    """
+    Per-row latency of the estimator at serving batch sizes.
+    Forest families are also timed through the compiled NumPy engine, which is what the app serves.
+    """
+    X_scaled = data['X_test']
+    single, batch = X_scaled[:1], np.resize(X_scaled, (100, X_scaled.shape[1]))
+    estimator.set_params(**({'n_jobs': None} if 'n_jobs' in estimator.get_params() else {}))
+    estimator.predict(single)
+    latency = {
+        'sklearn_single_row_ms': _median_ms(lambda: estimator.predict(single), repeats),
+        'sklearn_per_row_batch_100_ms': _median_ms(lambda: estimator.predict(batch), repeats) / 100,
+    }
+    if candidate['family'] in COMPILABLE:
+        compiled = CompiledForest.from_artifacts({
+            'model': estimator, 'scaler': data['scaler'], 'label_encoders': data['label_encoders'],
+        })
+        raw_single = data['scaler'].inverse_transform(single)
+        raw_batch = data['scaler'].inverse_transform(batch)
+        compiled.predict(raw_single)
+        latency['compiled_single_row_ms'] = _median_ms(lambda: compiled.predict(raw_single), repeats)
+        latency['compiled_per_row_batch_100_ms'] = _median_ms(lambda: compiled.predict(raw_batch), repeats) / 100
+        latency['serving_single_row_ms'] = latency['compiled_single_row_ms']
+    else:
+        latency['serving_single_row_ms'] = latency['sklearn_single_row_ms']
+    return latency
+
+
+def tune(data_path=DEFAULT_DATA_PATH, n_candidates=40, n_folds=5, n_jobs=-1, top=8,
+         max_latency_ms=None, families=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Run the search.
+    Returns: list of result dicts, best first
+    """
+    start = time.perf_counter()
+    data = load_folds(data_path, n_folds, cache_dir=cache_dir)
+    print(f"Fold matrices ready in {time.perf_counter() - start:.2f}s ({n_folds} folds, cached in {cache_dir})")
+
+    candidates = sample_candidates(n_candidates, families=families)
+    start = time.perf_counter()
+    # One task per (candidate, fold); joblib memory-maps the shared fold arrays into the workers
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_score_fold)(candidate, fold) for candidate in candidates for fold in data['folds']
+    )
+    print(f"Evaluated {len(candidates)} candidates x {n_folds} folds in {time.perf_counter() - start:.2f}s")
+
+    results = []
+    for i, candidate in enumerate(candidates):
+        fold_scores = scores[i * n_folds:(i + 1) * n_folds]
+        results.append({
+            'family': candidate['family'],
+            'params': candidate['params'],
+            'baseline': candidate['baseline'],
+            'cv_r2': float(np.mean([score[0] for score in fold_scores])),
+            'cv_r2_std': float(np.std([score[0] for score in fold_scores])),
+            'cv_mae': float(np.mean([score[1] for score in fold_scores])),
+            'fit_seconds': float(np.mean([score[2] for score in fold_scores])),
+        })
+    results.sort(key=lambda result: result['cv_r2'], reverse=True)
+
+    # Refit the shortlist (and the baseline) on the training split and time them one at a time
+    shortlist = results[:top] + [result for result in results[top:] if result['baseline']]
+    for result in shortlist:
+        estimator = make_estimator(result, n_jobs=n_jobs).fit(data['X_train'], data['y_train'])
+        y_pred = estimator.predict(data['X_test'])
+        result['holdout_r2'] = float(r2_score(data['y_test'], y_pred))
+        result['holdout_mae'] = float(mean_absolute_error(data['y_test'], y_pred))
+        result['latency'] = measure_serving_latency(estimator, result, data)
+        result['within_budget'] = (
+            max_latency_ms is None or result['latency']['serving_single_row_ms'] <= max_latency_ms
+        )
+    return results
+
+
+def print_report(results):
+    print(f"\n{'family':<24}{'cv_r2':>8}{'cv_mae':>10}{'holdout_r2':>12}{'serve_ms':>10}{'fit_s':>8}  params")
+    for result in results:
+        if 'latency' not in result:
+            continue
+        marker = '*' if result['baseline'] else ' '
+        flag = '' if result['within_budget'] else '  (over latency budget)'
+        print(f"{marker}{result['family']:<23}{result['cv_r2']:>8.4f}{result['cv_mae']:>10.0f}"
+              f"{result['holdout_r2']:>12.4f}{result['latency']['serving_single_row_ms']:>10.3f}"
+              f"{result['fit_seconds']:>8.2f}  {json.dumps(result['params'])}{flag}")
+
+    eligible = [result for result in results if result.get('within_budget')]
+    if eligible:
+        best = eligible[0]
+        print(f"\nRecommended: {best['family']} {json.dumps(best['params'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the bike price model')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    parser.add_argument('--candidates', type=int, default=40, help='Random candidates to evaluate')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--top', type=int, default=8, help='Candidates to refit and time')
+    parser.add_argument('--max-latency-ms', type=float, help='Serving latency budget for a single row')
+    parser.add_argument('--family', action='append', choices=sorted(SEARCH_SPACES), help='Limit the search to these families')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--output', help='Write all results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = tune(
+        data_path=args.data,
+        n_candidates=args.candidates,
+        n_folds=args.folds,
+        n_jobs=args.n_jobs,
+        top=args.top,
+        max_latency_ms=args.max_latency_ms,
+        families=args.family,
+        cache_dir=args.cache_dir
+    )
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Single-pass handling of uploaded photos.
+
+Werkzeug normally buffers each multipart file in memory or a temporary
+file, and FileStorage.save() then copies it again. ImageUploadStream is
+used as the upload container instead (see UploadRequest in app.py).
+Werkzeug's parser writes each file part into it chunk by chunk, and every
+chunk is checked, hashed and written to the staging file in the same pass:
+
+- The first bytes must carry a JPEG, PNG, GIF or WebP signature, whatever
+  the file is called.
+- A part larger than max_size is cut off as soon as it crosses the limit.
+- The SHA-256 needed by the content-addressed store (image_store.py) is
+  computed as the bytes arrive.
+
+A rejected part is dropped and the rest of the form is still parsed, so
+the view can report the error. Memory per upload is one parser chunk. A
+staging file that no view claims is deleted when the request closes its
+files.
+"""
+import hashlib
+import os
+import uuid
+
+# Bytes needed to recognise every supported format
+HEADER_BYTES = 12
+
+
+def sniff_image_format(header):
+    """Pillow format name of an image from its first bytes, or None if it is not a supported image"""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+class ImageUploadStream:
+    """Writable upload container that validates, hashes and stores a photo as it is received"""
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.token = uuid.uuid4().hex
+        self.path = None
+        self.size = 0
+        self.image_format = None
+        self.error = None
+        self.claimed = False
+        self._file = None
+        self._header = b''
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        if self.error:
+            return len(data)
+        if self._file is None:
+            self.path = os.path.join(self.directory, self.token)
+            self._file = open(self.path, 'wb+')
+        if self.image_format is None and len(self._header) < HEADER_BYTES:
+            self._header += data[:HEADER_BYTES - len(self._header)]
+            if len(self._header) == HEADER_BYTES:
+                self._check_header()
+                if self.error:
+                    return len(data)
+        self.size += len(data)
+        if self.size > self.max_size:
+            self._reject(f"larger than {self.max_size // (1024 * 1024)}MB")
+            return len(data)
+        self._hash.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def _check_header(self):
+        self.image_format = sniff_image_format(self._header)
+        if self.image_format is None:
+            self._reject("not a JPEG, PNG, GIF or WebP image")
+
+    def _reject(self, reason):
+        self.error = reason
+        self._discard()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path and not self.claimed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def claim(self):
+        """
+        Take ownership of the staged file (the caller moves or deletes it).
+        Returns: (path, image format, size, sha256 hex digest)
+        Raises: UploadRejected if the upload is not an acceptable image
+        """
+        if not self.error and self.image_format is None:
+            # Shorter than HEADER_BYTES
+            self._check_header()
+        if self.error:
+            raise UploadRejected(self.error)
+        self._file.flush()
+        self.claimed = True
+        return self.path, self.image_format, self.size, self._hash.hexdigest()
+
+    # File methods Werkzeug and FileStorage expect of an upload container
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence) if self._file is not None else 0
+
+    def tell(self):
+        return self._file.tell() if self._file is not None else 0
+
+    def read(self, size=-1):
+        return self._file.read(size) if self._file is not None else b''
+
+    def readline(self, size=-1):
+        return self._file.readline(size) if self._file is not None else b''
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def close(self):
+        """Close the staging file, deleting it unless a view claimed it"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not self.claimed:
+            self._discard()